@@ -1,5 +1,6 @@
 from .base_agent import BaseAgent
 from .agent_coordinator import AgentCoordinator
+from .pipeline_processor import PipelineProcessor
 from .query_agent import QueryUnderstandingAgent
 from .retrieval_agent import RetrievalAgent
 from .context_agent import ContextIntegrationAgent
@@ -1,8 +1,16 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
+from collections import OrderedDict
 from .base_agent import BaseAgent
 from .logger import get_agent_logger
+import logging
+import hashlib
+import json
+import sys
 import time
 
+# Per-request fields that must never be served from the response cache
+UNCACHED_KEYS = {"query", "session_id", "chat_history", "processing_history", "processing_time"}
+
 
 class AgentCoordinator:
     """
@@ -10,74 +18,187 @@ class AgentCoordinator:
     
     The coordinator manages the flow of information between agents and ensures
     that each agent's output is properly passed to the next agent in the pipeline.
+    Results for repeated queries are served from a response cache once the query
+    has been analyzed.
     """
     
-    def __init__(self, agents: List[BaseAgent]):
+    def __init__(self, agents: List[BaseAgent], cache_size: int = 256,
+                 cache_ttl: float = 7 * 24 * 3600):
         """
         Initialize the coordinator with a list of agents.
         
         Args:
             agents: A list of BaseAgent instances that will participate in the pipeline.
+            cache_size: Maximum number of cached pipeline results (0 disables the cache).
+            cache_ttl: Time in seconds after which a cached result expires.
         """
         self.agents = agents
         self.agent_map = {agent.name: agent for agent in agents}
         self.logger = get_agent_logger("coordinator")
         
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+    
+    def _cache_key(self, data: Dict[str, Any]) -> Optional[str]:
+        """
+        Fingerprint a query from its normalized text, type, key terms and chat history.
+        
+        The context is built from the chat history, so results are only shared between
+        requests with the same history. Returns None until the query has been analyzed.
+        """
+        if "query_type" not in data:
+            return None
+        
+        normalized_query = " ".join(data.get("query", "").lower().split())
+        key_terms = sorted(term.lower() for term in data.get("key_terms", []))
+        history = json.dumps(data.get("chat_history") or [], sort_keys=True, default=str)
+        history_digest = hashlib.sha256(history.encode("utf-8")).hexdigest()
+        fingerprint = "|".join([normalized_query, data["query_type"], history_digest, *key_terms])
+        return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+    
+    def _cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result for a key if present and not expired."""
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        
+        stored_at, result = entry
+        if time.time() - stored_at > self.cache_ttl:
+            del self._cache[key]
+            return None
+        
+        self._cache.move_to_end(key)
+        return result
+    
+    def _cache_put(self, key: str, data: Dict[str, Any]) -> None:
+        """Store a pipeline result, evicting the least recently used entries."""
+        if self.cache_size <= 0:
+            return
+        
+        self._cache[key] = (time.time(), {k: v for k, v in data.items() if k not in UNCACHED_KEYS})
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+    
+    def clear_cache(self) -> None:
+        """Drop all cached pipeline results."""
+        self._cache.clear()
+    
+    async def _run_agent(self, agent: BaseAgent, batch: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], float]:
+        """Run a single agent over every pipeline state in the batch and measure how long it took."""
+        self.logger.info(f"Running agent: {agent.name}")
+        agent_start_ns = time.perf_counter_ns()
+        
+        # Use the new execute_with_logging method
+        if len(batch) == 1:
+            agent_results = [await agent.execute_with_logging(batch[0])]
+        else:
+            agent_results = await agent.execute_batch_with_logging(batch)
+        
+        return agent_results, (time.perf_counter_ns() - agent_start_ns) / 1e9
+    
     async def run_pipeline(self, initial_input: Dict[str, Any]) -> Dict[str, Any]:
         """
         Run the complete multi-agent pipeline.
         
         Args:
             initial_input: The initial input data for the pipeline, typically including the user query.
-            
+        
         Returns:
             The final result after all agents have processed the data.
         """
-        self.logger.info("Starting multi-agent pipeline")
-        start_time = time.time()
+        results = await self.run_batch([initial_input])
+        return results[0]
+    
+    async def run_batch(self, initial_inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Run the multi-agent pipeline for several inputs in lockstep.
+        
+        Each agent is invoked once for the whole batch, so agents that implement
+        process_batch can share work (e.g. embedding all queries at once).
+        
+        Args:
+            initial_inputs: The initial input data for each pipeline run.
+        
+        Returns:
+            The final result for each input, in the same order.
+        """
+        self.logger.info(f"Starting multi-agent pipeline for {len(initial_inputs)} input(s)")
+        start_ns = time.perf_counter_ns()
         
-        current_data = initial_input
-        processing_history = []
+        # Copy once so merging agent results in place never touches the caller's dicts; the
+        # caller's keys may be built at runtime, so intern them like the agents' literal keys
+        states = [{sys.intern(key) if isinstance(key, str) else key: value
+                   for key, value in initial_input.items()}
+                  for initial_input in initial_inputs]
+        histories = [[] for _ in states]
+        cache_keys = [None] * len(states)
+        cache_hits = [False] * len(states)
+        active = list(range(len(states)))
         
         try:
             for agent in self.agents:
-                self.logger.info(f"Running agent: {agent.name}")
-                agent_start_time = time.time()
-                
-                # Use the new execute_with_logging method
-                agent_result = await agent.execute_with_logging(current_data)
-                
-                agent_duration = time.time() - agent_start_time
+                if not active:
+                    break
                 
-                processing_history.append({
-                    "agent": agent.name,
-                    "duration": agent_duration,
-                    "error": agent_result.get("error", None)
-                })
+                batch = [states[i] for i in active]
+                agent_results, agent_duration = await self._run_agent(agent, batch)
                 
-                # If there was an error, log it but continue with what we have
-                if "error" in agent_result:
-                    self.logger.error(f"Error in agent {agent.name}: {agent_result['error']}")
+                for i, agent_result in zip(active, agent_results):
+                    histories[i].append({
+                        "agent": agent.name,
+                        "duration": agent_duration,
+                        "error": agent_result.get("error", None)
+                    })
+                    
+                    # If there was an error, log it but continue with what we have
+                    if "error" in agent_result:
+                        self.logger.error(f"Error in agent {agent.name}: {agent_result['error']}")
+                    
+                    # Merge the agent result with the current data
+                    states[i].update(agent_result)
                 
-                # Merge the agent result with the current data
-                current_data = {**current_data, **agent_result}
+                # Probe the cache as soon as a query has been analyzed
+                if self.cache_size > 0:
+                    for i in list(active):
+                        if cache_keys[i] is not None:
+                            continue
+                        cache_keys[i] = self._cache_key(states[i])
+                        cached_result = self._cache_get(cache_keys[i]) if cache_keys[i] else None
+                        if cached_result is not None:
+                            self.logger.info("Serving pipeline result from cache")
+                            histories[i].append({
+                                "agent": "cache",
+                                "duration": 0.0,
+                                "error": None,
+                                "cache_hit": True
+                            })
+                            states[i].update(cached_result)
+                            cache_hits[i] = True
+                            active.remove(i)
             
-            # Add the processing history to the result for debugging and evaluation
-            current_data["processing_history"] = processing_history
+            for i, current_data in enumerate(states):
+                # Only cache complete runs that finished without errors
+                if cache_keys[i] and not cache_hits[i] and not any(stage["error"] for stage in histories[i]):
+                    self._cache_put(cache_keys[i], current_data)
+                
+                # Add the processing history to the result for debugging and evaluation
+                current_data["processing_history"] = histories[i]
             
-            total_duration = time.time() - start_time
+            total_duration = (time.perf_counter_ns() - start_ns) / 1e9
             self.logger.info(f"Multi-agent pipeline completed in {total_duration:.2f}s")
             
-            return current_data
-            
+            return states
+        
         except Exception as e:
-            self.logger.error(f"Error in pipeline execution: {str(e)}", exc_info=True)
-            return {
+            self.logger.error("Error in pipeline execution: %s", e,
+                              exc_info=self.logger.isEnabledFor(logging.DEBUG))
+            return [{
                 "error": f"Pipeline error: {str(e)}",
                 "processing_history": processing_history
-            }
+            } for processing_history in histories]
     
-    async def get_agent(self, name: str) -> Optional[BaseAgent]:
+    def get_agent(self, name: str) -> Optional[BaseAgent]:
         """Get an agent by name."""
         return self.agent_map.get(name)
-        return self.agent_map.get(name)
@@ -1,9 +1,14 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List
+import asyncio
+import sys
 import time
 import logging
 from .logger import get_agent_logger
 
+# Shape of the result returned when an agent fails, copied for each error
+_ERROR_TEMPLATE = {"error": "", "agent": "", "processing_time": 0.0}
+
 
 class BaseAgent(ABC):
     """
@@ -11,10 +16,22 @@ class BaseAgent(ABC):
     
     Each agent has a specific responsibility in the RAG pipeline and implements
     the process method to perform its task.
+    
+    Agents that do no I/O can set ``is_cpu_bound`` and implement ``_process_sync``;
+    they are then called directly, without the coroutine round trip. Inputs for
+    which ``_should_offload`` returns True are processed in a worker thread
+    instead, so large workloads do not stall the event loop.
+    
+    Agents that can share work across several pipeline runs set ``supports_batch``
+    and implement ``process_batch``.
     """
     
+    is_cpu_bound: bool = False
+    supports_batch: bool = False
+    
     def __init__(self, name: str):
-        self.name = name
+        # Agent names key the coordinator's maps and histories, so intern them
+        self.name = sys.intern(name)
         self.logger = get_agent_logger(name)
         
     @abstractmethod
@@ -31,6 +48,42 @@ class BaseAgent(ABC):
         # This will be implemented by each specific agent
         pass
     
+    def _process_sync(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Synchronous variant of process for agents that set is_cpu_bound.
+        
+        Args:
+            input_data: A dictionary containing the input data for the agent.
+            
+        Returns:
+            A dictionary containing the results of the agent's processing.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not implement _process_sync")
+    
+    def _should_offload(self, input_data: Dict[str, Any]) -> bool:
+        """
+        Decide whether _process_sync should run in a worker thread for this input.
+        
+        Args:
+            input_data: A dictionary containing the input data for the agent.
+            
+        Returns:
+            True if the input is large enough to justify the thread hop.
+        """
+        return False
+    
+    async def process_batch(self, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Process several inputs at once, for agents that set supports_batch.
+        
+        Args:
+            inputs: The input data of each pipeline run in the batch.
+            
+        Returns:
+            The results for each input, in the same order.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not implement process_batch")
+    
     async def execute_with_logging(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Wrapper around the process method that adds logging and timing.
@@ -42,40 +95,94 @@ class BaseAgent(ABC):
             Result from the agent's process method
         """
         self.logger.info(f"Starting processing in {self.name}")
-        start_time = time.time()
+        start_ns = time.perf_counter_ns()
+        
+        # Only build the filtered copies for debug output when it will be emitted
+        debug_enabled = self.logger.isEnabledFor(logging.DEBUG)
         
         try:
             # Log key input data without sensitive information
-            safe_input = {k: v for k, v in input_data.items() 
-                         if k not in ["model", "tokenizer", "vectordb"]}
-            self.logger.debug(f"Input data: {safe_input}")
+            if debug_enabled:
+                safe_input = {k: v for k, v in input_data.items() 
+                             if k not in ["model", "tokenizer", "vectordb"]}
+                self.logger.debug(f"Input data: {safe_input}")
             
-            # Call the actual processing method
-            result = await self.process(input_data)
+            # Call the actual processing method, skipping the coroutine for CPU-bound agents
+            if self.is_cpu_bound:
+                if self._should_offload(input_data):
+                    result = await asyncio.to_thread(self._process_sync, input_data)
+                else:
+                    result = self._process_sync(input_data)
+            else:
+                result = await self.process(input_data)
             
             # Calculate processing time
-            processing_time = time.time() - start_time
-            
-            # Log results without very large content
-            safe_result = {k: (v if not isinstance(v, (str, list)) or (isinstance(v, str) and len(v) < 500) 
-                              else f"[{type(v).__name__}: length={len(v)}]") 
-                          for k, v in result.items()}
+            processing_time = (time.perf_counter_ns() - start_ns) / 1e9
             
             self.logger.info(f"Completed processing in {self.name} (took {processing_time:.2f}s)")
-            self.logger.debug(f"Result: {safe_result}")
+            
+            # Log results without very large content
+            if debug_enabled:
+                safe_result = {k: (v if not isinstance(v, (str, list)) or (isinstance(v, str) and len(v) < 500) 
+                                  else f"[{type(v).__name__}: length={len(v)}]") 
+                              for k, v in result.items()}
+                self.logger.debug(f"Result: {safe_result}")
             
             # Add processing time to the result
             result["processing_time"] = processing_time
             
             return result
         except Exception as e:
-            self.logger.error(f"Error in {self.name}: {str(e)}", exc_info=True)
+            self.logger.error("Error in %s: %s", self.name, e,
+                              exc_info=self.logger.isEnabledFor(logging.DEBUG))
             # Return minimal result with error information
-            return {
-                "error": str(e),
-                "agent": self.name,
-                "processing_time": time.time() - start_time
-            }
+            return self._error_result(e, (time.perf_counter_ns() - start_ns) / 1e9)
+    
+    async def execute_batch_with_logging(self, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Batched counterpart of execute_with_logging.
+        
+        Agents without batch support process each input concurrently on its own.
+        
+        Args:
+            inputs: Input data of each pipeline run in the batch
+            
+        Returns:
+            Results for each input, in the same order
+        """
+        if not self.supports_batch:
+            return list(await asyncio.gather(*(self.execute_with_logging(data) for data in inputs)))
+        
+        self.logger.info(f"Starting batch processing of {len(inputs)} inputs in {self.name}")
+        start_ns = time.perf_counter_ns()
+        
+        try:
+            results = await self.process_batch(inputs)
+            
+            # Calculate processing time
+            processing_time = (time.perf_counter_ns() - start_ns) / 1e9
+            
+            self.logger.info(f"Completed batch processing in {self.name} (took {processing_time:.2f}s)")
+            
+            # Add processing time to each result
+            for result in results:
+                result["processing_time"] = processing_time
+            
+            return results
+        except Exception as e:
+            self.logger.error("Error in %s: %s", self.name, e,
+                              exc_info=self.logger.isEnabledFor(logging.DEBUG))
+            # Return minimal results with error information
+            processing_time = (time.perf_counter_ns() - start_ns) / 1e9
+            return [self._error_result(e, processing_time) for _ in inputs]
+    
+    def _error_result(self, error: Exception, processing_time: float) -> Dict[str, Any]:
+        """Build the minimal result returned when processing fails."""
+        result = _ERROR_TEMPLATE.copy()
+        result["error"] = str(error)
+        result["agent"] = self.name
+        result["processing_time"] = processing_time
+        return result
     
     def __str__(self) -> str:
         return f"{self.__class__.__name__}(name={self.name})"
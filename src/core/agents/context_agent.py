@@ -1,8 +1,28 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
 from .base_agent import BaseAgent
+from .text_utils import build_indicator_matcher
+import numpy as np
 import re
 
 
+# Indicator phrases used to classify documents for specific query types
+CAUSAL_INDICATORS = ("because", "since", "as a result", "therefore", "consequently",
+                     "due to", "leads to", "causes", "effect of", "impact of")
+STEP_INDICATORS = ("step", "first", "then", "next", "finally", "1.", "2.", "3.", "-", "*")
+EVAL_INDICATORS = ("advantage", "disadvantage", "benefit", "drawback", "pro", "con",
+                   "better", "best", "worse", "worst", "good", "bad", "recommend")
+
+# Phrases marking previous user questions as explanatory or definitional
+EXPLANATION_QUERY_RE = re.compile("explain|how|what is|describe")
+DEFINITION_QUERY_RE = re.compile("what is|define|meaning of|definition")
+
+# Numbered items, bullets, dashes and bracketed items that indicate a list
+LIST_PATTERN_RE = re.compile(r"\d+\.|•|\*|-\s|\[.+\]|\(.+\)")
+
+# Total document length above which context integration runs in a worker thread
+OFFLOAD_THRESHOLD_CHARS = 50_000
+
+
 class ContextIntegrationAgent(BaseAgent):
     """
     Agent responsible for integrating retrieved context with conversation history.
@@ -14,14 +34,31 @@ class ContextIntegrationAgent(BaseAgent):
     4. Prepares the final context for the response generation
     """
     
+    is_cpu_bound = True
+    
     def __init__(self, name: str = "context_agent", max_context_length: int = 4000):
         super().__init__(name)
         self.max_context_length = max_context_length
+        self._has_causal_indicator = build_indicator_matcher(CAUSAL_INDICATORS)
+        self._has_step_indicator = build_indicator_matcher(STEP_INDICATORS)
+        self._has_eval_indicator = build_indicator_matcher(EVAL_INDICATORS)
         
     async def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Integrate retrieved documents with conversation history."""
+        # The pipeline calls _process_sync through execute_with_logging, which offloads large inputs
+        return self._process_sync(input_data)
+    
+    def _should_offload(self, input_data: Dict[str, Any]) -> bool:
+        """Offload to a thread only when the documents are large enough to stall the event loop."""
+        total_chars = sum(len(doc) for doc in input_data.get("retrieved_documents", []))
+        return total_chars > OFFLOAD_THRESHOLD_CHARS
+    
+    def _process_sync(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Integrate retrieved documents with conversation history.
         
+        This is pure string processing, so it runs synchronously.
+        
         Args:
             input_data: A dictionary containing:
                 - retrieved_documents: Documents from the RetrievalAgent
@@ -45,13 +82,10 @@ class ContextIntegrationAgent(BaseAgent):
         key_terms = input_data.get("key_terms", [])
         
         # Match documents with scores, sorted by relevance
+        # (a stable sort on negated scores keeps ties in retrieval order)
         if len(scores) > 0:
-            doc_score_pairs = sorted(
-                zip(documents, scores), 
-                key=lambda x: x[1], 
-                reverse=True
-            )
-            documents = [doc for doc, _ in doc_score_pairs]
+            order = np.argsort(-np.asarray(scores[:len(documents)], dtype=float), kind="stable")
+            documents = [documents[i] for i in order]
         
         # Determine how much context to include based on the query type
         # Different query types may benefit from different context structures
@@ -70,19 +104,25 @@ class ContextIntegrationAgent(BaseAgent):
         # Get the appropriate context creation function
         context_fn = context_templates.get(query_type, self._create_general_context)
         
-        # Create the context
-        integrated_context = context_fn(query, documents, chat_history, key_terms)
+        # Lowercase documents and key terms once for all helpers
+        docs_lower = [doc.lower() for doc in documents]
+        key_terms_lower = [term.lower() for term in key_terms]
+        
+        # Create the context, counting the document-backed sections as we go
+        integrated_context, section_count = context_fn(query, documents, docs_lower, chat_history,
+                                        key_terms, key_terms_lower)
         
         # Create a brief summary of the context
-        context_summary = self._summarize_context(integrated_context, query_type)
+        context_summary = self._summarize_context(section_count, query_type)
         
         return {
             "integrated_context": integrated_context,
             "context_summary": context_summary
         }
     
-    def _create_general_context(self, query: str, documents: List[str], 
-                               chat_history: List[Dict[str, Any]], key_terms: List[str]) -> str:
+    def _create_general_context(self, query: str, documents: List[str], docs_lower: List[str],
+                               chat_history: List[Dict[str, Any]], key_terms: List[str],
+                               key_terms_lower: List[str]) -> Tuple[str, int]:
         """Create a general-purpose context combining documents and history."""
         # Start with the most relevant information
         context_parts = []
@@ -94,23 +134,21 @@ class ContextIntegrationAgent(BaseAgent):
             else:
                 context_parts.append(f"Additional information:\n{doc}")
         
+        section_count = len(context_parts)
+        
         # Add recent and relevant history if available
-        relevant_history = self._filter_relevant_history(chat_history, key_terms)
+        relevant_history = self._scan_history(chat_history, key_terms_lower)["relevant"]
         if relevant_history:
             history_text = "\n".join([f"User: {h['user']}\nAnswer: {h['assistant']}" 
                                      for h in relevant_history[-2:]])
             context_parts.append(f"Relevant conversation history:\n{history_text}")
         
-        # Combine all parts
-        integrated_context = "\n\n".join(context_parts)
-        
-        # Ensure the context isn't too long
-        integrated_context = self._trim_context(integrated_context)
-        
-        return integrated_context
+        # Combine all parts, ensuring the context isn't too long
+        return self._join_with_budget(context_parts), section_count
     
-    def _create_explanatory_context(self, query: str, documents: List[str], 
-                                   chat_history: List[Dict[str, Any]], key_terms: List[str]) -> str:
+    def _create_explanatory_context(self, query: str, documents: List[str], docs_lower: List[str],
+                                   chat_history: List[Dict[str, Any]], key_terms: List[str],
+                                   key_terms_lower: List[str]) -> Tuple[str, int]:
         """Create a context optimized for explanatory queries."""
         context_parts = []
         
@@ -130,22 +168,24 @@ class ContextIntegrationAgent(BaseAgent):
         if background_info:
             context_parts.append(f"Background information:\n{' '.join(background_info[:3])}")  # Limit background
         
+        section_count = len(context_parts)
+        
         # Add any relevant previous explanations from history
-        explanation_history = self._filter_explanatory_history(chat_history, key_terms)
+        explanation_history = self._scan_history(chat_history, key_terms_lower)["explanatory"]
         if explanation_history:
             history_text = "\n".join([f"Previous explanation on this topic:\n{h['assistant']}" 
                                      for h in explanation_history[:1]])
             context_parts.append(history_text)
         
-        integrated_context = "\n\n".join(context_parts)
-        return self._trim_context(integrated_context)
+        return self._join_with_budget(context_parts), section_count
     
-    def _create_definitional_context(self, query: str, documents: List[str], 
-                                    chat_history: List[Dict[str, Any]], key_terms: List[str]) -> str:
+    def _create_definitional_context(self, query: str, documents: List[str], docs_lower: List[str],
+                                    chat_history: List[Dict[str, Any]], key_terms: List[str],
+                                    key_terms_lower: List[str]) -> Tuple[str, int]:
         """Create a context optimized for definitional queries."""
         # For definitions, we want precise information, not too verbose
         if not documents:
-            return ""
+            return "", 0
         
         # Start with the most relevant definition
         primary_def = documents[0]
@@ -161,28 +201,33 @@ class ContextIntegrationAgent(BaseAgent):
         if additional_context:
             context_parts.append(f"Additional context:\n{' '.join(additional_context)}")
         
+        section_count = len(context_parts)
+        
         # Check if there were previous questions about this definition
-        previous_definitions = self._filter_definitional_history(chat_history, key_terms)
+        previous_definitions = self._scan_history(chat_history, key_terms_lower)["definitional"]
         if previous_definitions:
             prev_def = f"Previously provided definition:\n{previous_definitions[0]['assistant']}"
             context_parts.append(prev_def)
         
-        integrated_context = "\n\n".join(context_parts)
-        return self._trim_context(integrated_context)
+        return self._join_with_budget(context_parts), section_count
     
-    def _create_comparative_context(self, query: str, documents: List[str], 
-                                   chat_history: List[Dict[str, Any]], key_terms: List[str]) -> str:
+    def _create_comparative_context(self, query: str, documents: List[str], docs_lower: List[str],
+                                   chat_history: List[Dict[str, Any]], key_terms: List[str],
+                                   key_terms_lower: List[str]) -> Tuple[str, int]:
         """Create a context optimized for comparative queries."""
         # For comparisons, we need information about all entities being compared
         context_parts = []
         
         # Organize documents that might contain information about each entity
+        # Only the first two matching documents per term are used, so stop there
         comparison_docs = {}
-        for term in key_terms:
+        for term, term_lower in zip(key_terms, key_terms_lower):
             term_docs = []
-            for doc in documents:
-                if term.lower() in doc.lower():
+            for doc, doc_lower in zip(documents, docs_lower):
+                if term_lower in doc_lower:
                     term_docs.append(doc)
+                    if len(term_docs) == 2:
+                        break
             if term_docs:
                 comparison_docs[term] = term_docs
         
@@ -195,11 +240,11 @@ class ContextIntegrationAgent(BaseAgent):
             for i, doc in enumerate(documents[:4]):
                 context_parts.append(f"Comparison information {i+1}:\n{doc}")
         
-        integrated_context = "\n\n".join(context_parts)
-        return self._trim_context(integrated_context)
+        return self._join_with_budget(context_parts), len(context_parts)
     
-    def _create_causal_context(self, query: str, documents: List[str], 
-                              chat_history: List[Dict[str, Any]], key_terms: List[str]) -> str:
+    def _create_causal_context(self, query: str, documents: List[str], docs_lower: List[str],
+                              chat_history: List[Dict[str, Any]], key_terms: List[str],
+                              key_terms_lower: List[str]) -> Tuple[str, int]:
         """Create a context optimized for causal (why) queries."""
         # For causal queries, we need explanations of causes and effects
         context_parts = []
@@ -208,11 +253,8 @@ class ContextIntegrationAgent(BaseAgent):
         causal_docs = []
         general_docs = []
         
-        causal_indicators = ["because", "since", "as a result", "therefore", "consequently", 
-                            "due to", "leads to", "causes", "effect of", "impact of"]
-        
-        for doc in documents:
-            if any(indicator in doc.lower() for indicator in causal_indicators):
+        for doc, doc_lower in zip(documents, docs_lower):
+            if self._has_causal_indicator(doc_lower):
                 causal_docs.append(doc)
             else:
                 general_docs.append(doc)
@@ -223,16 +265,16 @@ class ContextIntegrationAgent(BaseAgent):
         if general_docs:
             context_parts.append(f"Related information:\n{' '.join(general_docs[:2])}")
         
-        integrated_context = "\n\n".join(context_parts)
-        return self._trim_context(integrated_context)
+        return self._join_with_budget(context_parts), len(context_parts)
     
-    def _create_factual_context(self, query: str, documents: List[str], 
-                               chat_history: List[Dict[str, Any]], key_terms: List[str]) -> str:
+    def _create_factual_context(self, query: str, documents: List[str], docs_lower: List[str],
+                               chat_history: List[Dict[str, Any]], key_terms: List[str],
+                               key_terms_lower: List[str]) -> Tuple[str, int]:
         """Create a context optimized for factual queries."""
         # For factual queries, we want precise information
         # Often, less context is better as long as it's accurate
         if not documents:
-            return ""
+            return "", 0
         
         context_parts = []
         
@@ -243,21 +285,20 @@ class ContextIntegrationAgent(BaseAgent):
             else:
                 context_parts.append(f"Additional facts:\n{doc}")
         
-        integrated_context = "\n\n".join(context_parts)
-        return self._trim_context(integrated_context)
+        return self._join_with_budget(context_parts), len(context_parts)
     
-    def _create_procedural_context(self, query: str, documents: List[str], 
-                                  chat_history: List[Dict[str, Any]], key_terms: List[str]) -> str:
+    def _create_procedural_context(self, query: str, documents: List[str], docs_lower: List[str],
+                                  chat_history: List[Dict[str, Any]], key_terms: List[str],
+                                  key_terms_lower: List[str]) -> Tuple[str, int]:
         """Create a context optimized for procedural (how-to) queries."""
         context_parts = []
         
         # Look for step-by-step instructions in the documents
-        step_indicators = ["step", "first", "then", "next", "finally", "1.", "2.", "3.", "-", "*"]
         procedural_docs = []
         other_docs = []
         
-        for doc in documents:
-            if any(indicator in doc.lower() for indicator in step_indicators):
+        for doc, doc_lower in zip(documents, docs_lower):
+            if self._has_step_indicator(doc_lower):
                 procedural_docs.append(doc)
             else:
                 other_docs.append(doc)
@@ -268,11 +309,11 @@ class ContextIntegrationAgent(BaseAgent):
         if other_docs:
             context_parts.append(f"Additional guidance:\n{' '.join(other_docs[:2])}")
         
-        integrated_context = "\n\n".join(context_parts)
-        return self._trim_context(integrated_context)
+        return self._join_with_budget(context_parts), len(context_parts)
     
-    def _create_enumerative_context(self, query: str, documents: List[str], 
-                                   chat_history: List[Dict[str, Any]], key_terms: List[str]) -> str:
+    def _create_enumerative_context(self, query: str, documents: List[str], docs_lower: List[str],
+                                   chat_history: List[Dict[str, Any]], key_terms: List[str],
+                                   key_terms_lower: List[str]) -> Tuple[str, int]:
         """Create a context optimized for list or enumeration queries."""
         context_parts = []
         
@@ -280,11 +321,8 @@ class ContextIntegrationAgent(BaseAgent):
         list_docs = []
         other_docs = []
         
-        # Check for list patterns
-        list_patterns = [r"\d+\.", r"•", r"\*", r"-\s", r"\[.+\]", r"\(.+\)"]
-        
         for doc in documents:
-            if any(re.search(pattern, doc) for pattern in list_patterns):
+            if LIST_PATTERN_RE.search(doc) is not None:
                 list_docs.append(doc)
             else:
                 other_docs.append(doc)
@@ -295,23 +333,20 @@ class ContextIntegrationAgent(BaseAgent):
         if other_docs:
             context_parts.append(f"Additional information:\n{' '.join(other_docs[:2])}")
         
-        integrated_context = "\n\n".join(context_parts)
-        return self._trim_context(integrated_context)
+        return self._join_with_budget(context_parts), len(context_parts)
     
-    def _create_evaluative_context(self, query: str, documents: List[str], 
-                                  chat_history: List[Dict[str, Any]], key_terms: List[str]) -> str:
+    def _create_evaluative_context(self, query: str, documents: List[str], docs_lower: List[str],
+                                  chat_history: List[Dict[str, Any]], key_terms: List[str],
+                                  key_terms_lower: List[str]) -> Tuple[str, int]:
         """Create a context optimized for evaluative queries."""
         context_parts = []
         
         # Look for evaluative language in documents
-        eval_indicators = ["advantage", "disadvantage", "benefit", "drawback", "pro", "con", 
-                         "better", "best", "worse", "worst", "good", "bad", "recommend"]
-        
         eval_docs = []
         other_docs = []
         
-        for doc in documents:
-            if any(indicator in doc.lower() for indicator in eval_indicators):
+        for doc, doc_lower in zip(documents, docs_lower):
+            if self._has_eval_indicator(doc_lower):
                 eval_docs.append(doc)
             else:
                 other_docs.append(doc)
@@ -322,68 +357,88 @@ class ContextIntegrationAgent(BaseAgent):
         if other_docs:
             context_parts.append(f"Additional context:\n{' '.join(other_docs[:2])}")
         
-        integrated_context = "\n\n".join(context_parts)
-        return self._trim_context(integrated_context)
+        return self._join_with_budget(context_parts), len(context_parts)
     
-    def _filter_relevant_history(self, chat_history: List[Dict[str, Any]], key_terms: List[str]) -> List[Dict[str, Any]]:
-        """Filter chat history to find entries relevant to the current query."""
-        if not chat_history or not key_terms:
-            return []
+    def _scan_history(self, chat_history: List[Dict[str, Any]], key_terms_lower: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Find history entries relevant to the current query in a single pass.
+        
+        Returns:
+            A dictionary with the relevant entries (at most 3) and the subsets of
+            them that were explanatory or definitional questions.
+        """
+        history = {"relevant": [], "explanatory": [], "definitional": []}
+        if not chat_history or not key_terms_lower:
+            return history
         
-        relevant_history = []
+        key_terms_re = re.compile("|".join(re.escape(term) for term in key_terms_lower))
         
         # Check each history entry for relevant terms
         for entry in chat_history:
             # Get the text from both user and assistant
-            entry_text = f"{entry.get('user', '')} {entry.get('assistant', '')}"
+            entry_text_lower = f"{entry.get('user', '')} {entry.get('assistant', '')}".lower()
+            if not key_terms_re.search(entry_text_lower):
+                continue
             
-            # Check if any key term is in the entry
-            if any(term.lower() in entry_text.lower() for term in key_terms):
-                relevant_history.append(entry)
+            history["relevant"].append(entry)
+            
+            # Classify the kind of question that was asked
+            user_lower = entry.get('user', '').lower()
+            if EXPLANATION_QUERY_RE.search(user_lower):
+                history["explanatory"].append(entry)
+            if DEFINITION_QUERY_RE.search(user_lower):
+                history["definitional"].append(entry)
+            
+            # Limit to the first 3 relevant entries
+            if len(history["relevant"]) == 3:
+                break
         
-        return relevant_history[:3]  # Limit to the 3 most recent relevant entries
-    
-    def _filter_explanatory_history(self, chat_history: List[Dict[str, Any]], key_terms: List[str]) -> List[Dict[str, Any]]:
-        """Filter for previous explanations in chat history."""
-        explanation_queries = ["explain", "how", "what is", "describe"]
-        relevant_history = self._filter_relevant_history(chat_history, key_terms)
-        
-        # Further filter for explanatory queries
-        return [entry for entry in relevant_history 
-                if any(eq in entry.get('user', '').lower() for eq in explanation_queries)]
-    
-    def _filter_definitional_history(self, chat_history: List[Dict[str, Any]], key_terms: List[str]) -> List[Dict[str, Any]]:
-        """Filter for previous definitions in chat history."""
-        definition_queries = ["what is", "define", "meaning of", "definition"]
-        relevant_history = self._filter_relevant_history(chat_history, key_terms)
-        
-        # Further filter for definitional queries
-        return [entry for entry in relevant_history 
-                if any(dq in entry.get('user', '').lower() for dq in definition_queries)]
+        return history
     
-    def _trim_context(self, context: str) -> str:
-        """Ensure the context doesn't exceed the maximum allowed length."""
-        if len(context) <= self.max_context_length:
-            return context
+    def _join_with_budget(self, parts: List[str], separator: str = "\n\n") -> str:
+        """
+        Join context parts, keeping the result within the maximum allowed length.
+        
+        When the joined context would be too long, only the beginning and the end
+        are materialized, without building the full string first.
+        """
+        total_length = sum(len(part) for part in parts) + len(separator) * max(len(parts) - 1, 0)
+        if total_length <= self.max_context_length:
+            return separator.join(parts)
         
         # If it's too long, keep the beginning and end, trimming the middle
         keep_start = int(self.max_context_length * 0.6)  # Keep 60% from start
         keep_end = int(self.max_context_length * 0.4)    # Keep 40% from end
         
-        start_text = context[:keep_start]
-        end_text = context[-keep_end:]
+        start_pieces = []
+        start_length = 0
+        for i, part in enumerate(parts):
+            if start_length >= keep_start:
+                break
+            piece = part if i == 0 else separator + part
+            start_pieces.append(piece)
+            start_length += len(piece)
+        
+        end_pieces = []
+        end_length = 0
+        for i in range(len(parts) - 1, -1, -1):
+            if end_length >= keep_end:
+                break
+            piece = parts[i] if i == 0 else separator + parts[i]
+            end_pieces.append(piece)
+            end_length += len(piece)
+        
+        start_text = "".join(start_pieces)[:keep_start]
+        end_text = "".join(reversed(end_pieces))[-keep_end:] if keep_end > 0 else ""
         
         return f"{start_text}\n...[Content trimmed for length]...\n{end_text}"
     
-    def _summarize_context(self, context: str, query_type: str) -> str:
-        """Create a brief summary of the integrated context."""
-        # Count the documents included
-        doc_count = context.count("information:")
-        
+    def _summarize_context(self, doc_count: int, query_type: str) -> str:
+        """Create a brief summary of the integrated context from its number of document sections."""
         # Create a simple summary based on query type
         type_summaries = {
             "explanatory": f"Prepared explanatory context with {doc_count} information sources",
-            "definitional": f"Prepared definitional context with primary definition and {doc_count-1} supporting sources",
+            "definitional": f"Prepared definitional context with primary definition and {max(doc_count - 1, 0)} supporting sources",
             "comparative": "Prepared comparative context with information for each entity",
             "causal": f"Prepared causal explanation context with {doc_count} information sources",
             "factual": f"Prepared factual context with {doc_count} relevant sources",
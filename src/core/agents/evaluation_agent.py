@@ -1,7 +1,70 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Set, Tuple
 from .base_agent import BaseAgent
+from .text_utils import BM25_K1, BM25_B, TOKEN_RE, build_indicator_matcher
+from collections import Counter, OrderedDict
+import numpy as np
+import asyncio
+import hashlib
+import copy
+import math
+import sys
 import re
 
+# Patterns shared by the evaluation metrics
+WORD_RE = re.compile(r'\b\w{4,}\b')  # Key terms: words of 4+ characters
+STEP_RE = re.compile(r'\d+\.|\d+\)|\bstep\b\s*\d+')
+DEFINITION_RE = re.compile(r'is\s+a|refers\s+to|defined\s+as')
+
+# Sentences end at '.', '!' or '?'; mapping all three to '.' lets str.split find them
+SENTENCE_END_TRANSLATION = str.maketrans({"!": ".", "?": "."})
+
+# Single words are matched against token sets, multi-word phrases by substring
+QUESTION_WORDS = frozenset({"what", "who", "where", "when", "why", "how"})
+TRANSITION_WORDS = frozenset({
+    "first", "second", "third", "finally", "additionally", "furthermore",
+    "however", "therefore", "consequently", "meanwhile", "nevertheless",
+    "similarly", "specifically"
+})
+TRANSITION_PHRASES = ("in conclusion", "for example", "in contrast")
+COMPARISON_TERMS = frozenset({"whereas", "similarly", "unlike", "advantage", "disadvantage"})
+COMPARISON_PHRASES = ("compared to", "in contrast")
+REDUNDANT_PHRASES = ("as mentioned earlier", "as stated before", "as i said",
+                     "to reiterate", "as previously mentioned")
+
+# Total response and document length above which the metrics run in worker threads
+OFFLOAD_THRESHOLD_CHARS = 50_000
+
+# Minimum and ideal response word counts for each query type
+MIN_WORDS = {
+    "factual": 20,
+    "definitional": 40,
+    "explanatory": 80,
+    "comparative": 100,
+    "procedural": 60,
+    "causal": 70,
+    "general": 50
+}
+IDEAL_WORDS = {
+    "factual": 50,
+    "definitional": 100,
+    "explanatory": 200,
+    "comparative": 250,
+    "procedural": 150,
+    "causal": 180,
+    "general": 120
+}
+DEFAULT_MIN_WORDS = 50
+DEFAULT_IDEAL_WORDS = 120
+
+# Suggestions added for low-quality responses to specific query types
+TYPE_SUGGESTIONS = {
+    "explanatory": "Structure explanations with an introduction, main points, and a conclusion.",
+    "definitional": "Start with a clear definition before elaborating on details.",
+    "comparative": "Use a parallel structure when comparing entities.",
+    "procedural": "Number steps and consider potential challenges or variations.",
+    "factual": "Focus on accuracy and provide specific details instead of generalizations."
+}
+
 
 class EvaluationAgent(BaseAgent):
     """
@@ -14,7 +77,16 @@ class EvaluationAgent(BaseAgent):
     4. Provides feedback for improvement
     """
     
-    def __init__(self, name: str = "evaluation_agent"):
+    supports_batch = True
+    
+    def __init__(self, name: str = "evaluation_agent", cache_size: int = 2048):
+        """
+        Initialize the evaluation agent.
+        
+        Args:
+            name: The name of the agent.
+            cache_size: Maximum number of memoized evaluations (0 disables the cache).
+        """
         super().__init__(name)
         self.evaluation_metrics = [
             "relevance",
@@ -24,6 +96,14 @@ class EvaluationAgent(BaseAgent):
             "conciseness"
         ]
         
+        # Multi-word phrases are found with a single scan per text
+        self._has_transition_phrase = build_indicator_matcher(TRANSITION_PHRASES)
+        self._has_comparison_phrase = build_indicator_matcher(COMPARISON_PHRASES)
+        
+        # Evaluations are deterministic, so identical inputs can reuse their result
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[bytes, bytes, bytes, str], Dict[str, Any]]" = OrderedDict()
+        
     async def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Evaluate the quality of the generated response.
@@ -43,22 +123,101 @@ class EvaluationAgent(BaseAgent):
                 - quality_assessment: Overall assessment of response quality
                 - improvement_suggestions: Suggestions for improving the response
         """
+        results = await self.process_batch([input_data])
+        return results[0]
+    
+    async def process_batch(self, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Evaluate the responses of several pipeline runs.
+        
+        The length-based parts of the completeness and conciseness scores are
+        computed for the whole batch at once; the remaining metrics are evaluated
+        per response.
+        
+        Args:
+            inputs: The input data of each pipeline run, as described in process
+            
+        Returns:
+            The evaluation result for each input, in the same order
+        """
         # Get the necessary data
-        response = input_data.get("response", "")
-        query = input_data.get("query", "")
-        context = input_data.get("integrated_context", "")
-        documents = input_data.get("retrieved_documents", [])
-        query_type = input_data.get("query_type", "general")
+        responses = [input_data.get("response", "") for input_data in inputs]
+        queries = [input_data.get("query", "") for input_data in inputs]
+        documents_list = [input_data.get("retrieved_documents", []) for input_data in inputs]
+        query_types = [input_data.get("query_type", "general") for input_data in inputs]
+        
+        word_counts = np.fromiter((len(response.split()) for response in responses),
+                                  dtype=np.int32, count=len(responses))
+        completeness_bases = self._completeness_base_scores(word_counts, query_types)
+        conciseness_bases = self._conciseness_base_scores(word_counts)
+        
+        results = []
+        for i, (response, query, documents, query_type) in enumerate(
+                zip(responses, queries, documents_list, query_types)):
+            cache_key = self._cache_key(response, query, documents, query_type)
+            result = self._cache.get(cache_key)
+            if result is not None:
+                self._cache.move_to_end(cache_key)
+            else:
+                result = await self._evaluate(response, query, documents, query_type,
+                                              float(completeness_bases[i]), float(conciseness_bases[i]))
+                if self.cache_size > 0:
+                    self._cache[cache_key] = result
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+            
+            # Hand out a copy, callers are free to modify the result
+            results.append(copy.deepcopy(result))
+        
+        return results
+    
+    async def _evaluate(self, response: str, query: str, documents: List[str], query_type: str,
+                        completeness_base: float, conciseness_base: float) -> Dict[str, Any]:
+        """
+        Compute all evaluation metrics, feedback and suggestions for a response.
+        
+        The metrics are independent, so for large inputs they run concurrently in
+        worker threads instead of blocking the event loop.
+        
+        Args:
+            response: The generated response
+            query: The user's query
+            documents: The source documents
+            query_type: The type of query
+            completeness_base: The length-based completeness score of the response
+            conciseness_base: The length-based conciseness score of the response
+            
+        Returns:
+            The evaluation result as returned by process
+        """
+        # Normalize the response and query once for all metrics
+        response_lower = response.lower()
+        query_lower = query.lower()
+        sentences = response.translate(SENTENCE_END_TRANSLATION).split(".")
+        sentences = [s.strip() for s in sentences if s.strip()]
+        sentences_lower = [s.lower() for s in sentences]
+        sentence_terms = [set(WORD_RE.findall(s)) for s in sentences_lower]
+        # Interned like the keyword literals, so matching tokens compare by identity
+        response_tokens = set(map(sys.intern, TOKEN_RE.findall(response_lower)))
         
         # Evaluate different aspects of the response
-        evaluation_scores = {
-            "relevance": self._evaluate_relevance(response, query),
-            "grounding": self._evaluate_grounding(response, documents),
-            "completeness": self._evaluate_completeness(response, query, query_type),
-            "coherence": self._evaluate_coherence(response),
-            "conciseness": self._evaluate_conciseness(response)
+        metric_calls = {
+            "relevance": (self._evaluate_relevance, response_tokens, query_lower),
+            "grounding": (self._evaluate_grounding, sentence_terms, documents),
+            "completeness": (self._evaluate_completeness, response_lower, response_tokens, sentences_lower,
+                             completeness_base, query_type),
+            "coherence": (self._evaluate_coherence, response, sentences_lower, sentence_terms),
+            "conciseness": (self._evaluate_conciseness, response_lower, sentences_lower, conciseness_base)
         }
         
+        total_chars = len(response) + sum(len(doc) for doc in documents)
+        if total_chars > OFFLOAD_THRESHOLD_CHARS:
+            scores = await asyncio.gather(*(asyncio.to_thread(fn, *args)
+                                            for fn, *args in metric_calls.values()))
+        else:
+            scores = [fn(*args) for fn, *args in metric_calls.values()]
+        evaluation_scores = dict(zip(metric_calls, scores))
+        
         # Calculate an overall score
         overall_score = sum(evaluation_scores.values()) / len(evaluation_scores)
         
@@ -66,10 +225,11 @@ class EvaluationAgent(BaseAgent):
         feedback = self._generate_feedback(evaluation_scores, query_type)
         
         # Provide an overall quality assessment
-        quality_assessment = self._assess_overall_quality(evaluation_scores)
+        quality_assessment = self._assess_overall_quality(evaluation_scores, overall_score)
         
         # Generate improvement suggestions
-        improvement_suggestions = self._generate_improvement_suggestions(evaluation_scores, query_type)
+        improvement_suggestions = self._generate_improvement_suggestions(evaluation_scores, query_type,
+                                                                         overall_score)
         
         return {
             "evaluation_scores": evaluation_scores,
@@ -79,47 +239,65 @@ class EvaluationAgent(BaseAgent):
             "improvement_suggestions": improvement_suggestions
         }
     
-    def _evaluate_relevance(self, response: str, query: str) -> float:
+    def _cache_key(self, response: str, query: str, documents: List[str],
+                   query_type: str) -> Tuple[bytes, bytes, bytes, str]:
+        """Build a compact cache key from digests of the evaluation inputs."""
+        docs_digest = hashlib.blake2b(digest_size=16)
+        for doc in documents:
+            docs_digest.update(doc.encode("utf-8"))
+            docs_digest.update(b"\0")
+        
+        return (
+            hashlib.blake2b(response.encode("utf-8"), digest_size=16).digest(),
+            hashlib.blake2b(query.encode("utf-8"), digest_size=16).digest(),
+            docs_digest.digest(),
+            query_type
+        )
+    
+    def clear_cache(self) -> None:
+        """Drop all memoized evaluations."""
+        self._cache.clear()
+    
+    def _evaluate_relevance(self, response_tokens: Set[str], query_lower: str) -> float:
         """
         Evaluate how relevant the response is to the query.
         
         Args:
-            response: The generated response
-            query: The user's query
+            response_tokens: The distinct lowercased words of the generated response
+            query_lower: The lowercased user's query
             
         Returns:
             A score between 0 and 1 indicating relevance
         """
         # Extract key terms from query
-        query_words = set(re.findall(r'\b\w{4,}\b', query.lower()))
+        query_tokens = set(map(sys.intern, TOKEN_RE.findall(query_lower)))
+        query_words = {token for token in query_tokens if len(token) >= 4}
         if not query_words:
             return 0.5  # Default if no significant query words
         
-        # Check for presence of query terms in response
-        response_words = set(re.findall(r'\b\w{4,}\b', response.lower()))
-        
-        # Calculate term overlap
-        if not response_words:
+        if not response_tokens:
             return 0.0
-            
-        overlap = len(query_words.intersection(response_words))
+        
+        # Count the query terms present in the response, iterating the smaller query side
+        overlap = sum(1 for word in query_words if word in response_tokens)
         relevance_score = min(1.0, overlap / len(query_words))
         
-        # Boost score if response directly addresses question words
-        question_words = ["what", "who", "where", "when", "why", "how"]
-        for word in question_words:
-            if word in query.lower() and word not in response.lower():
-                # The response should address the question type
-                relevance_score = max(0.0, relevance_score - 0.1)
+        # The response should address the question words used in the query
+        for _ in (query_tokens & QUESTION_WORDS) - response_tokens:
+            relevance_score = max(0.0, relevance_score - 0.1)
                 
         return relevance_score
     
-    def _evaluate_grounding(self, response: str, documents: List[str]) -> float:
+    def _evaluate_grounding(self, sentence_terms: List[Set[str]], documents: List[str]) -> float:
         """
         Evaluate how well the response is grounded in the source documents.
         
+        Each sentence is scored with BM25 against its best matching document,
+        relative to a document of average length containing every sentence term
+        once. The grounding score is the average over all sentences.
+        
         Args:
-            response: The generated response
+            sentence_terms: The key terms (4+ letter words) of each response sentence
             documents: The source documents
             
         Returns:
@@ -128,142 +306,171 @@ class EvaluationAgent(BaseAgent):
         if not documents:
             return 0.5  # Default when no documents are provided
             
-        # Combine documents into a single context for matching
-        combined_docs = " ".join(documents).lower()
+        if not sentence_terms:
+            return 0.5  # Default for empty response
         
-        # Split response into sentences for analysis
-        response_sentences = re.split(r'[.!?]', response)
-        response_sentences = [s.strip() for s in response_sentences if s.strip()]
+        # Term statistics of the documents are shared by all sentences
+        bm25 = self._bm25_prepare(documents)
+        if not bm25["doc_freqs"]:
+            return 0.0  # No sentence can match documents without key terms
         
-        if not response_sentences:
-            return 0.5  # Default for empty response
+        grounding_total = 0.0
+        for terms in sentence_terms:
+            if terms:
+                grounding_total += self._bm25_sentence_score(terms, bm25)
+        
+        # Calculate grounding score
+        grounding_score = grounding_total / len(sentence_terms)
+        
+        return grounding_score
+    
+    def _bm25_prepare(self, documents: List[str]) -> Dict[str, Any]:
+        """
+        Precompute the BM25 statistics of the documents.
+        
+        Args:
+            documents: The source documents
             
-        # Count sentences with good grounding
-        grounded_sentences = 0
+        Returns:
+            A dictionary with the per-document term frequencies, document
+            frequencies, the document length normalization and the number of documents
+        """
+        term_freqs = [Counter(WORD_RE.findall(doc.lower())) for doc in documents]
+        doc_lens = np.array([sum(tf.values()) for tf in term_freqs], dtype=float)
+        avgdl = doc_lens.mean() or 1.0
         
-        for sentence in response_sentences:
-            # Extract key terms (4+ letter words) from sentence
-            sentence_terms = re.findall(r'\b\w{4,}\b', sentence.lower())
-            if not sentence_terms:
-                continue
-                
-            # Check term overlap with documents
-            matching_terms = sum(1 for term in sentence_terms if term in combined_docs)
+        doc_freqs = Counter()
+        for tf in term_freqs:
+            doc_freqs.update(tf.keys())
+        
+        return {
+            "term_freqs": term_freqs,
+            "doc_freqs": doc_freqs,
+            "length_norm": BM25_K1 * (1 - BM25_B + BM25_B * doc_lens / avgdl),
+            "num_docs": len(documents)
+        }
+    
+    def _bm25_sentence_score(self, terms: Set[str], bm25: Dict[str, Any]) -> float:
+        """
+        Score a sentence against its best matching document with BM25.
+        
+        Args:
+            terms: The distinct key terms of the sentence
+            bm25: Document statistics from _bm25_prepare
             
-            # If more than 50% of terms are in docs, consider it grounded
-            if matching_terms / len(sentence_terms) > 0.5:
-                grounded_sentences += 1
+        Returns:
+            A score between 0 and 1, where 1 means some document covers every term
+            at least as well as an average-length document mentioning it once
+        """
+        # A sentence sharing no terms with the documents scores 0
+        matched_terms = terms & bm25["doc_freqs"].keys()
+        if not matched_terms:
+            return 0.0
         
-        # Calculate grounding score
-        grounding_score = grounded_sentences / len(response_sentences) if response_sentences else 0.5
+        num_docs = bm25["num_docs"]
+        scores = np.zeros(num_docs)
         
-        return grounding_score
+        # Terms missing from every document only add to the attainable score
+        attainable = (len(terms) - len(matched_terms)) * math.log((num_docs + 0.5) / 0.5 + 1)
+        
+        for term in matched_terms:
+            df = bm25["doc_freqs"][term]
+            idf = math.log((num_docs - df + 0.5) / (df + 0.5) + 1)
+            attainable += idf
+            tf = np.array([doc_tf.get(term, 0) for doc_tf in bm25["term_freqs"]], dtype=float)
+            scores += idf * tf * (BM25_K1 + 1) / (tf + bm25["length_norm"])
+        
+        return min(1.0, float(scores.max()) / attainable)
     
-    def _evaluate_completeness(self, response: str, query: str, query_type: str) -> float:
+    def _completeness_base_scores(self, word_counts: np.ndarray, query_types: List[str]) -> np.ndarray:
+        """
+        Score response lengths relative to the expected length of each query type.
+        
+        Args:
+            word_counts: The number of words in each response
+            query_types: The type of each query
+            
+        Returns:
+            The length-based completeness score of each response
+        """
+        # Get thresholds for each query type
+        min_threshold = np.array([MIN_WORDS.get(query_type, DEFAULT_MIN_WORDS) for query_type in query_types], dtype=float)
+        ideal_threshold = np.array([IDEAL_WORDS.get(query_type, DEFAULT_IDEAL_WORDS) for query_type in query_types], dtype=float)
+        word_counts = word_counts.astype(float)
+        
+        # Below minimum, between minimum and ideal, at or above ideal threshold
+        return np.where(
+            word_counts < min_threshold,
+            word_counts / min_threshold * 0.5,
+            np.where(
+                word_counts < ideal_threshold,
+                0.5 + ((word_counts - min_threshold) / (ideal_threshold - min_threshold) * 0.4),
+                0.9
+            )
+        )
+    
+    def _evaluate_completeness(self, response_lower: str, response_tokens: Set[str],
+                               sentences_lower: List[str], base_score: float, query_type: str) -> float:
         """
         Evaluate the completeness of the response relative to the query.
         
         Args:
-            response: The generated response
-            query: The user's query
+            response_lower: The lowercased generated response
+            response_tokens: The distinct lowercased words of the response
+            sentences_lower: The lowercased, non-empty sentences of the response
+            base_score: The length-based score from _completeness_base_scores
             query_type: The type of query
             
         Returns:
             A score between 0 and 1 indicating completeness
         """
-        # Base completeness on response length appropriate to query type
-        word_count = len(response.split())
-        
-        # Define minimum word counts for different query types
-        min_words = {
-            "factual": 20,
-            "definitional": 40,
-            "explanatory": 80,
-            "comparative": 100,
-            "procedural": 60,
-            "causal": 70,
-            "general": 50
-        }
-        
-        # Define ideal word counts
-        ideal_words = {
-            "factual": 50,
-            "definitional": 100,
-            "explanatory": 200,
-            "comparative": 250,
-            "procedural": 150,
-            "causal": 180,
-            "general": 120
-        }
+        completeness_score = base_score
         
-        # Get thresholds for this query type
-        min_threshold = min_words.get(query_type, 50)
-        ideal_threshold = ideal_words.get(query_type, 120)
-        
-        # Score based on word count relative to thresholds
-        if word_count < min_threshold:
-            # Below minimum threshold
-            completeness_score = word_count / min_threshold * 0.5
-        elif word_count < ideal_threshold:
-            # Between minimum and ideal
-            completeness_score = 0.5 + ((word_count - min_threshold) / 
-                                        (ideal_threshold - min_threshold) * 0.4)
-        else:
-            # At or above ideal threshold
-            completeness_score = 0.9
-            
         # Check for expected elements based on query type
         if query_type == "procedural":
             # Procedural responses should have numbered steps
-            has_steps = bool(re.search(r'\d+\.|\d+\)|\bstep\b\s*\d+', response.lower()))
+            has_steps = bool(STEP_RE.search(response_lower))
             completeness_score = completeness_score * 0.8 + (0.2 if has_steps else 0)
             
         elif query_type == "comparative":
             # Comparative responses should mention comparison terms
-            comparison_terms = ["whereas", "compared to", "similarly", "unlike", "in contrast", "advantage", "disadvantage"]
-            has_comparison = any(term in response.lower() for term in comparison_terms)
+            has_comparison = (not response_tokens.isdisjoint(COMPARISON_TERMS) or
+                              self._has_comparison_phrase(response_lower))
             completeness_score = completeness_score * 0.8 + (0.2 if has_comparison else 0)
             
         elif query_type == "definitional":
             # Definitional responses should start with a definition
-            first_sentences = re.split(r'[.!?]', response)
-            first_sentences = [s.strip() for s in first_sentences if s.strip()]
-            first_sentence = first_sentences[0] if first_sentences else ""
-            has_definition = bool(re.search(r'is\s+a|refers\s+to|defined\s+as', first_sentence.lower()))
+            first_sentence = sentences_lower[0] if sentences_lower else ""
+            has_definition = bool(DEFINITION_RE.search(first_sentence))
             completeness_score = completeness_score * 0.8 + (0.2 if has_definition else 0)
             
         return min(1.0, completeness_score)
     
-    def _evaluate_coherence(self, response: str) -> float:
+    def _evaluate_coherence(self, response: str, sentences_lower: List[str],
+                            sentence_terms: List[Set[str]]) -> float:
         """
         Evaluate the logical flow and readability of the response.
         
         Args:
             response: The generated response
+            sentences_lower: The lowercased, non-empty sentences of the response
+            sentence_terms: The key terms (4+ letter words) of each sentence
             
         Returns:
             A score between 0 and 1 indicating coherence
         """
         # Simple heuristics for coherence evaluation
-        response_sentences = re.split(r'[.!?]', response)
-        response_sentences = [s.strip() for s in response_sentences if s.strip()]
-        
-        if len(response_sentences) <= 1:
+        if len(sentences_lower) <= 1:
             return 0.5  # Default for very short responses
             
-        # Check for transition words that indicate good structure
-        transition_words = [
-            "first", "second", "third", "finally", "additionally", "furthermore",
-            "however", "therefore", "consequently", "in conclusion", "for example",
-            "meanwhile", "nevertheless", "similarly", "in contrast", "specifically"
-        ]
-        
-        # Count sentences with transition words
-        transition_count = sum(1 for sentence in response_sentences 
-                              if any(word in sentence.lower() for word in transition_words))
+        # Count sentences with transition words that indicate good structure
+        # (every single transition word is long enough to be a key term)
+        transition_count = sum(1 for sentence_lower, terms in zip(sentences_lower, sentence_terms)
+                              if not TRANSITION_WORDS.isdisjoint(terms)
+                              or self._has_transition_phrase(sentence_lower))
         
         # Calculate transition density (what % of sentences use transitions)
-        transition_density = transition_count / (len(response_sentences) - 1)  # Exclude first sentence
+        transition_density = transition_count / (len(sentences_lower) - 1)  # Exclude first sentence
         
         # Check for paragraph breaks (basic structure)
         has_paragraphs = '\n\n' in response or '\n \n' in response
@@ -275,55 +482,63 @@ class EvaluationAgent(BaseAgent):
         
         return coherence_score
     
-    def _evaluate_conciseness(self, response: str) -> float:
+    def _conciseness_base_scores(self, word_counts: np.ndarray) -> np.ndarray:
+        """
+        Score response lengths for conciseness, with an ideal range of 20-250 words.
+        
+        Args:
+            word_counts: The number of words in each response
+            
+        Returns:
+            The length-based conciseness score of each response
+        """
+        word_counts = word_counts.astype(float)
+        
+        return np.select(
+            [word_counts < 20, word_counts <= 250, word_counts <= 400],  # Too short, ideal, a bit verbose
+            [0.3, 0.9, 0.9 - ((word_counts - 250) / 750)],
+            default=0.5  # Too verbose
+        )
+    
+    def _evaluate_conciseness(self, response_lower: str, sentences_lower: List[str],
+                              base_score: float) -> float:
         """
         Evaluate how concise and to-the-point the response is.
         
         Args:
-            response: The generated response
+            response_lower: The lowercased generated response
+            sentences_lower: The lowercased, non-empty sentences of the response
+            base_score: The length-based score from _conciseness_base_scores
             
         Returns:
             A score between 0 and 1 indicating conciseness
         """
-        # Count words
-        word_count = len(response.split())
+        conciseness_score = base_score
         
         # Check for redundancy indicators
-        redundant_phrases = [
-            "as mentioned earlier", "as stated before", "as I said", 
-            "to reiterate", "as previously mentioned"
-        ]
-        
-        redundancy_count = sum(1 for phrase in redundant_phrases 
-                              if phrase in response.lower())
+        redundancy_count = sum(1 for phrase in REDUNDANT_PHRASES 
+                              if phrase in response_lower)
         
-        # Repeated sentences or near-duplicates (simplified check)
-        response_sentences = re.split(r'[.!?]', response)
-        response_sentences = [s.strip().lower() for s in response_sentences if s.strip()]
+        # Beyond this many similar sentences the score is already at its floor
+        max_similar = int((conciseness_score - 0.1 - redundancy_count * 0.1) / 0.05) + 2
         
-        # Check for similar sentences (crude approximation)
+        # Repeated sentences or near-duplicates (crude approximation)
+        token_sets = [set(sentence.split()) for sentence in sentences_lower]
+        sizes = [len(tokens) for tokens in token_sets]
         similar_sentences = 0
-        for i in range(len(response_sentences)):
-            for j in range(i+1, len(response_sentences)):
+        for i in range(len(token_sets)):
+            if similar_sentences >= max_similar:
+                break
+            words_i = token_sets[i]
+            for j in range(i+1, len(token_sets)):
                 # If sentences share more than 70% of words, consider them similar
-                words_i = set(response_sentences[i].split())
-                words_j = set(response_sentences[j].split())
-                if words_i and words_j:
-                    overlap = len(words_i.intersection(words_j)) / min(len(words_i), len(words_j))
+                if sizes[i] and sizes[j]:
+                    overlap = len(words_i.intersection(token_sets[j])) / min(sizes[i], sizes[j])
                     if overlap > 0.7:
                         similar_sentences += 1
+                        if similar_sentences >= max_similar:
+                            break
         
-        # Calculate base conciseness score based on word count
-        # Ideal range: 50-250 words
-        if word_count < 20:  # Too short
-            conciseness_score = 0.3
-        elif word_count <= 250:  # Ideal range
-            conciseness_score = 0.9
-        elif word_count <= 400:  # A bit verbose
-            conciseness_score = 0.9 - ((word_count - 250) / 750)
-        else:  # Too verbose
-            conciseness_score = 0.5
-            
         # Penalize for redundancy
         redundancy_penalty = redundancy_count * 0.1 + similar_sentences * 0.05
         conciseness_score = max(0.1, conciseness_score - redundancy_penalty)
@@ -374,18 +589,26 @@ class EvaluationAgent(BaseAgent):
             
         return feedback
     
-    def _assess_overall_quality(self, scores: Dict[str, float]) -> Dict[str, Any]:
+    def _assess_overall_quality(self, scores: Dict[str, float], avg_score: float) -> Dict[str, Any]:
         """
         Provide an overall assessment of response quality.
         
         Args:
             scores: Dictionary of metric scores
+            avg_score: The average of the metric scores
             
         Returns:
             Dictionary with quality assessment
         """
-        # Calculate average score
-        avg_score = sum(scores.values()) / len(scores)
+        # Identify strongest and weakest areas in one pass
+        items = iter(scores.items())
+        strongest, max_score = next(items)
+        weakest, min_score = strongest, max_score
+        for metric, score in items:
+            if score > max_score:
+                strongest, max_score = metric, score
+            if score < min_score:
+                weakest, min_score = metric, score
         
         # Determine quality level
         if avg_score >= 0.85:
@@ -396,10 +619,6 @@ class EvaluationAgent(BaseAgent):
             quality_level = "satisfactory"
         else:
             quality_level = "needs improvement"
-            
-        # Identify strongest and weakest areas
-        strongest = max(scores.items(), key=lambda x: x[1])[0]
-        weakest = min(scores.items(), key=lambda x: x[1])[0]
         
         return {
             "average_score": round(avg_score, 2),
@@ -408,13 +627,15 @@ class EvaluationAgent(BaseAgent):
             "weakest_aspect": weakest
         }
     
-    def _generate_improvement_suggestions(self, scores: Dict[str, float], query_type: str) -> List[str]:
+    def _generate_improvement_suggestions(self, scores: Dict[str, float], query_type: str,
+                                          avg_score: float) -> List[str]:
         """
         Generate concrete suggestions for improvement.
         
         Args:
             scores: Dictionary of metric scores
             query_type: The type of query
+            avg_score: The average of the metric scores
             
         Returns:
             List of improvement suggestions
@@ -451,16 +672,8 @@ class EvaluationAgent(BaseAgent):
                 suggestions.append("Eliminate redundant statements and focus on essential information.")
                 
         # Add query-type specific suggestions if overall quality is low
-        if sum(scores.values()) / len(scores) < 0.7:
-            type_suggestions = {
-                "explanatory": "Structure explanations with an introduction, main points, and a conclusion.",
-                "definitional": "Start with a clear definition before elaborating on details.",
-                "comparative": "Use a parallel structure when comparing entities.",
-                "procedural": "Number steps and consider potential challenges or variations.",
-                "factual": "Focus on accuracy and provide specific details instead of generalizations."
-            }
-            
-            if query_type in type_suggestions:
-                suggestions.append(type_suggestions[query_type])
+        if avg_score < 0.7:
+            if query_type in TYPE_SUGGESTIONS:
+                suggestions.append(TYPE_SUGGESTIONS[query_type])
                 
         return suggestions
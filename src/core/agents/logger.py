@@ -4,10 +4,14 @@ Logger configuration for multi-agent system.
 This module provides unified logging setup for all agents.
 """
 
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
 import sys
-from typing import Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
 # Define log levels
 LOG_LEVELS = {
@@ -21,6 +25,83 @@ LOG_LEVELS = {
 # Default log format
 DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 
+# Log files are rotated once they reach this size
+MAX_LOG_BYTES = 50 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+# Directory holding the per-agent log files
+AGENT_LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs")
+
+# Configuration (level, log file, format) each logger was last set up with
+_logger_configs: Dict[str, Tuple[str, Optional[str], str]] = {}
+
+
+class _RoutingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that tags each record with the handlers that must write it."""
+    
+    def __init__(self, log_queue: queue.Queue, target_handlers: List[logging.Handler]):
+        super().__init__(log_queue)
+        self.target_handlers = target_handlers
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # prepare returns a copy, so a record queued by several loggers keeps each tag
+        record = super().prepare(record)
+        record.log_handlers = self.target_handlers
+        return record
+
+
+class _RouterHandler(logging.Handler):
+    """Hands each dequeued record to the console and file handlers of its logger."""
+    
+    def emit(self, record: logging.LogRecord) -> None:
+        # Handlers of a replaced configuration are closed once their records are written
+        closing = getattr(record, "log_close", None)
+        if closing is not None:
+            for handler in closing:
+                handler.close()
+            return
+        
+        for handler in getattr(record, "log_handlers", ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+# All agent loggers enqueue to one queue, written by a single background listener
+_log_queue: queue.Queue = queue.Queue(-1)
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# Console and file handlers of each configured logger
+_logger_handlers: Dict[str, List[logging.Handler]] = {}
+
+
+def _ensure_listener() -> None:
+    """Start the process-wide queue listener on first use."""
+    global _listener
+    if _listener is None:
+        _listener = logging.handlers.QueueListener(_log_queue, _RouterHandler())
+        _listener.start()
+
+
+def _stop_listener() -> None:
+    """Flush the queued records and close the handlers at interpreter exit."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for handlers in _logger_handlers.values():
+        for handler in handlers:
+            handler.close()
+    _logger_handlers.clear()
+
+
+atexit.register(_stop_listener)
+
+
+@lru_cache(maxsize=None)
+def _ensure_directory(path: str) -> None:
+    """Create a directory if needed, only touching the filesystem once per path."""
+    os.makedirs(path, exist_ok=True)
+
 def setup_logger(name: str, 
                 level: str = "info", 
                 log_file: Optional[str] = None,
@@ -28,6 +109,11 @@ def setup_logger(name: str,
     """
     Set up a logger with the specified configuration.
     
+    The logger itself only enqueues records; a single background listener thread,
+    shared by all loggers of the process, writes them to the console and the
+    (size-rotated) log file, so logging never blocks the caller on I/O. Setting
+    up a logger again with the same configuration returns it unchanged.
+    
     Args:
         name: Name of the logger, typically __name__ or agent name
         level: Log level as string ("debug", "info", "warning", "error", "critical")
@@ -37,11 +123,16 @@ def setup_logger(name: str,
     Returns:
         Configured logger instance
     """
-    # Get the log level
-    log_level = LOG_LEVELS.get(level.lower(), logging.INFO)
-    
     # Create logger
     logger = logging.getLogger(name)
+    
+    # Nothing to do if the logger is already configured this way
+    config = (level, log_file, log_format)
+    if _logger_configs.get(name) == config and logger.handlers:
+        return logger
+    
+    # Get the log level
+    log_level = LOG_LEVELS.get(level.lower(), logging.INFO)
     logger.setLevel(log_level)
     
     # Remove existing handlers to avoid duplicates
@@ -50,22 +141,36 @@ def setup_logger(name: str,
     
     # Create formatter
     formatter = logging.Formatter(log_format)
+    handlers = []
     
     # Create console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(log_level)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers.append(console_handler)
     
     # Create file handler if log_file is specified
     if log_file:
         # Ensure log directory exists
-        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        _ensure_directory(os.path.dirname(os.path.abspath(log_file)))
         
-        file_handler = logging.FileHandler(log_file)
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=MAX_LOG_BYTES, backupCount=LOG_BACKUP_COUNT
+        )
         file_handler.setLevel(log_level)
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
+    
+    # Hand records to the background listener instead of writing them inline
+    _ensure_listener()
+    previous_handlers = _logger_handlers.get(name)
+    if previous_handlers:
+        # Queued after the records of the previous configuration, so it closes them last
+        _log_queue.put_nowait(logging.makeLogRecord({"log_close": previous_handlers}))
+    _logger_handlers[name] = handlers
+    
+    logger.addHandler(_RoutingQueueHandler(_log_queue, handlers))
+    _logger_configs[name] = config
     
     return logger
 
@@ -80,10 +185,7 @@ def get_agent_logger(agent_name: str, level: str = "info") -> logging.Logger:
     Returns:
         Configured logger instance for the agent
     """
-    log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs")
-    os.makedirs(log_dir, exist_ok=True)
-    
-    log_file = os.path.join(log_dir, f"{agent_name}.log")
+    log_file = os.path.join(AGENT_LOG_DIR, f"{agent_name}.log")
     return setup_logger(
         name=f"agent.{agent_name}",
         level=level,
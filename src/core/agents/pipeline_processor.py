@@ -0,0 +1,118 @@
+from typing import Dict, List, Any, Optional, Set, Tuple
+from .agent_coordinator import AgentCoordinator
+from .logger import get_agent_logger
+import asyncio
+import logging
+
+
+class PipelineProcessor:
+    """
+    Batches concurrent pipeline requests in front of an AgentCoordinator.
+
+    Requests submitted within a short window are collected into one batch and run
+    through AgentCoordinator.run_batch, so agents that support batching (such as
+    the RetrievalAgent embedding all queries at once) share their work.
+    """
+
+    def __init__(
+        self,
+        coordinator: AgentCoordinator,
+        batch_size: int = 16,
+        max_wait_ms: float = 50,
+    ):
+        """
+        Initialize the processor.
+
+        Args:
+            coordinator: The coordinator running the agent pipeline.
+            batch_size: Maximum number of requests dispatched together.
+            max_wait_ms: Maximum time to wait for a batch to fill up, in milliseconds.
+        """
+        self.coordinator = coordinator
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.logger = get_agent_logger("pipeline_processor")
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._batches: Set[asyncio.Task] = set()
+
+    async def submit(self, initial_input: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Queue a pipeline run and wait for its result.
+
+        Args:
+            initial_input: The initial input data for the pipeline.
+
+        Returns:
+            The final pipeline result for this input.
+        """
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._collect_batches())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((initial_input, future))
+        return await future
+
+    async def close(self) -> None:
+        """Stop collecting new batches and wait for running batches to finish."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+
+    async def _collect_batches(self) -> None:
+        """Drain the queue into batches of up to batch_size requests."""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            # Wait for more requests until the batch is full or the window closes
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Run the batch in the background so the next one can fill up meanwhile
+            task = asyncio.create_task(self._dispatch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _dispatch(
+        self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]
+    ) -> None:
+        """Run one batch through the coordinator and resolve its futures."""
+        self.logger.info(f"Dispatching batch of {len(batch)} request(s)")
+
+        try:
+            results = await self.coordinator.run_batch(
+                [initial_input for initial_input, _ in batch]
+            )
+        except Exception as e:
+            self.logger.error(
+                "Error in batch execution: %s",
+                e,
+                exc_info=self.logger.isEnabledFor(logging.DEBUG),
+            )
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
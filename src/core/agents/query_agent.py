@@ -1,12 +1,108 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Callable, Optional, Tuple
 from .base_agent import BaseAgent
 import re
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
 import spacy
 from collections import Counter
 
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick is optional, fall back to substring scans
+    ahocorasick = None
+
+# Query type patterns in priority order: the most specific patterns come first
+# (comparative queries are the most prone to being incorrectly classified)
+QUERY_TYPE_PATTERNS = [
+    ("comparative", r'\bhow\b.+\bcompare\b|\bcompare\b|\bdifference\b|\bdistinguish\b|\bversus\b|\bvs\b|\bsimilar\b|\bdifferent\b'),
+    ("procedural", r'\bhow\b.+\bdo\b|\bhow\b.+\bcan\b|\bhow\b.+\bto\b'),
+    ("explanatory", r'\bhow\b|\bexplain\b|\bdescribe\b|\belaborate\b'),
+    ("definitional", r'\bwhat\s+is\b|\bdefine\b|\bmeaning\s+of\b|\bdefinition\b'),
+    ("causal", r'\bwhy\b|\bcause\b|\breason\b'),
+    ("factual", r'\bwhen\b|\bwhere\b|\bwho\b|\bwhich\b'),
+    ("enumerative", r'\blist\b|\bname\b|\bgive\b.+\bexamples\b'),
+    ("evaluative", r'\badvantages\b|\bbenefits\b|\bdrawbacks\b|\blimitations\b'),
+]
+
+# All query type patterns fused into one regex. Each type is a lookahead from the
+# start of the query, so alternatives are tried in priority order rather than by
+# match position, and the name of the matching group is the query type.
+QUERY_TYPE_RE = re.compile(
+    "(?:" + "|".join(rf"(?=[\s\S]*?(?P<{name}>{pattern}))" for name, pattern in QUERY_TYPE_PATTERNS) + ")"
+)
+
+# NLTK's English stopword list, kept inline so no corpus has to be downloaded or loaded
+STOPWORDS = frozenset({
+    "i", "me", "my", "myself", "we", "our", "ours", "ourselves", "you", "you're", "you've",
+    "you'll", "you'd", "your", "yours", "yourself", "yourselves", "he", "him", "his", "himself",
+    "she", "she's", "her", "hers", "herself", "it", "it's", "its", "itself", "they", "them",
+    "their", "theirs", "themselves", "what", "which", "who", "whom", "this", "that", "that'll",
+    "these", "those", "am", "is", "are", "was", "were", "be", "been", "being", "have", "has",
+    "had", "having", "do", "does", "did", "doing", "a", "an", "the", "and", "but", "if", "or",
+    "because", "as", "until", "while", "of", "at", "by", "for", "with", "about", "against",
+    "between", "into", "through", "during", "before", "after", "above", "below", "to", "from",
+    "up", "down", "in", "out", "on", "off", "over", "under", "again", "further", "then", "once",
+    "here", "there", "when", "where", "why", "how", "all", "any", "both", "each", "few", "more",
+    "most", "other", "some", "such", "no", "nor", "not", "only", "own", "same", "so", "than",
+    "too", "very", "s", "t", "can", "will", "just", "don", "don't", "should", "should've", "now",
+    "d", "ll", "m", "o", "re", "ve", "y", "ain", "aren", "aren't", "couldn", "couldn't", "didn",
+    "didn't", "doesn", "doesn't", "hadn", "hadn't", "hasn", "hasn't", "haven", "haven't", "isn",
+    "isn't", "ma", "mightn", "mightn't", "mustn", "mustn't", "needn", "needn't", "shan", "shan't",
+    "shouldn", "shouldn't", "wasn", "wasn't", "weren", "weren't", "won", "won't", "wouldn",
+    "wouldn't",
+})
+
+# Number of queries spaCy processes together in process_batch
+SPACY_BATCH_SIZE = 64
+
+# Literal phrases signalling each intent, in priority order
+INTENT_TRIGGERS = [
+    ("instruction_seeking", ("how to", "how do i")),
+    ("knowledge_seeking", ("what is", "define")),
+    ("understanding_seeking", ("why",)),
+    ("comparison_seeking", ("compare", "difference")),
+    ("troubleshooting", ("problem", "error", "issue", "bug", "fix")),
+    ("recommendation_seeking", ("best", "recommend", "should", "better")),
+]
+
+# Intent assumed from the query type when no trigger phrase is present
+INTENT_BY_QUERY_TYPE = {
+    "procedural": "instruction_seeking",
+    "explanatory": "understanding_seeking",
+    "definitional": "knowledge_seeking",
+    "comparative": "comparison_seeking",
+    "causal": "understanding_seeking",
+    "factual": "fact_seeking",
+    "enumerative": "information_gathering",
+    "evaluative": "assessment_seeking",
+    "general": "information_seeking"
+}
+
+
+def build_intent_matcher() -> Callable[[str], Optional[str]]:
+    """
+    Build a function returning the highest-priority intent triggered by a lowercased query.
+    
+    Uses a single Aho-Corasick automaton over all trigger phrases when pyahocorasick
+    is installed, so each query is scanned once.
+    """
+    if ahocorasick is None:
+        def match_intent(text: str) -> Optional[str]:
+            for intent, triggers in INTENT_TRIGGERS:
+                if any(trigger in text for trigger in triggers):
+                    return intent
+            return None
+        return match_intent
+    
+    automaton = ahocorasick.Automaton()
+    for priority, (intent, triggers) in enumerate(INTENT_TRIGGERS):
+        for trigger in triggers:
+            automaton.add_word(trigger, (priority, intent))
+    automaton.make_automaton()
+    
+    def match_intent(text: str) -> Optional[str]:
+        best = min((value for _, value in automaton.iter(text)), default=None)
+        return best[1] if best else None
+    return match_intent
+
 
 class QueryUnderstandingAgent(BaseAgent):
     """
@@ -19,29 +115,36 @@ class QueryUnderstandingAgent(BaseAgent):
     4. Expand the query with related terms if needed
     """
     
-    def __init__(self, name: str = "query_agent", use_spacy: bool = True):
+    supports_batch = True
+    
+    def __init__(self, name: str = "query_agent", use_spacy: bool = True, use_gpu: bool = True):
         super().__init__(name)
         self.use_spacy = use_spacy
+        self.use_gpu = use_gpu
+        self._match_intent = build_intent_matcher()
         
-        # Initialize NLP resources as needed
-        try:
-            # Download NLTK resources if not present
-            nltk.download('punkt', quiet=True)
-            nltk.download('stopwords', quiet=True)
-            self.stopwords = set(stopwords.words('english'))
-            
-            # Load spaCy model if available
-            if self.use_spacy:
-                try:
-                    self.nlp = spacy.load("en_core_web_sm")
-                except:
-                    self.nlp = None
-                    self.use_spacy = False
-                    print("SpaCy model not available. Falling back to basic NLP.")
-        except:
-            self.stopwords = {"the", "a", "an", "in", "on", "at", "to", "for", "with", "and", "or", "of", "is", "are"}
-            self.use_spacy = False
-            print("NLTK resources not available. Using basic stopwords.")
+        # The spaCy model is loaded on first use
+        self._nlp = None
+        self._nlp_loaded = False
+        self.stopwords = STOPWORDS
+    
+    @property
+    def nlp(self):
+        """The spaCy pipeline, loaded on first access (None when unavailable)."""
+        if not self.use_spacy:
+            return None
+        if not self._nlp_loaded:
+            self._nlp_loaded = True
+            try:
+                # Run the pipeline on the GPU when one is usable (needs cupy), otherwise on the CPU
+                if self.use_gpu and spacy.prefer_gpu():
+                    self.logger.info("Running the spaCy pipeline on the GPU")
+                self._nlp = spacy.load("en_core_web_sm")
+            except:
+                self._nlp = None
+                self.use_spacy = False
+                print("SpaCy model not available. Falling back to basic NLP.")
+        return self._nlp
         
     async def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -60,15 +163,50 @@ class QueryUnderstandingAgent(BaseAgent):
         """
         raw_query = input_data.get("query", "")
         
+        # Parse the query once and share the result between all steps
+        doc = self.nlp(raw_query) if self.use_spacy and self.nlp is not None else None
+        return self._analyze(raw_query, doc)
+    
+    async def process_batch(self, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Process several user queries, parsing all of them in one spaCy pass.
+        
+        Args:
+            inputs: The input data of each pipeline run, as accepted by process
+            
+        Returns:
+            The result for each input, as returned by process
+        """
+        raw_queries = [input_data.get("query", "") for input_data in inputs]
+        
+        if self.use_spacy and self.nlp is not None:
+            docs = list(self.nlp.pipe(raw_queries, batch_size=SPACY_BATCH_SIZE))
+        else:
+            docs = [None] * len(raw_queries)
+        
+        return [self._analyze(raw_query, doc) for raw_query, doc in zip(raw_queries, docs)]
+    
+    def _analyze(self, raw_query: str, doc: Optional[Any]) -> Dict[str, Any]:
+        """
+        Build the query analysis from the raw query and its parsed spaCy Doc.
+        
+        Args:
+            raw_query: The user's raw query
+            doc: The parsed spaCy Doc of the query, or None without spaCy
+            
+        Returns:
+            The analysis result, as returned by process
+        """
         # Determine query type using NLP techniques
         query_type = self._determine_query_type(raw_query)
         
         # Extract key terms and entities
-        key_terms = self._extract_key_terms(raw_query)
-        entities = self._extract_entities(raw_query)
+        term_pairs = self._extract_key_terms(raw_query, doc)
+        key_terms = [term for _, term in term_pairs]
+        entities = self._extract_entities(doc)
         
         # Expand the query based on key terms and context
-        expanded_query = self._expand_query(raw_query, key_terms, query_type)
+        expanded_query = self._expand_query(raw_query, term_pairs, query_type)
         
         # Combine all the analysis into a structured result
         return {
@@ -90,60 +228,35 @@ class QueryUnderstandingAgent(BaseAgent):
         Returns:
             A string representing the query type (explanatory, definitional, etc.)
         """
-        query_lower = query.lower()
-        
-        # Order matters! Check the most specific patterns first, then move to more general ones
-        
-        # Check for comparative queries first (most prone to being incorrectly classified)
-        if re.search(r'\bhow\b.+\bcompare\b|\bcompare\b|\bdifference\b|\bdistinguish\b|\bversus\b|\bvs\b|\bsimilar\b|\bdifferent\b', query_lower):
-            return "comparative"
-            
-        # Then check procedural queries
-        elif re.search(r'\bhow\b.+\bdo\b|\bhow\b.+\bcan\b|\bhow\b.+\bto\b', query_lower):
-            return "procedural"
-            
-        # Then move to more general query types
-        elif re.search(r'\bhow\b|\bexplain\b|\bdescribe\b|\belaborate\b', query_lower):
-            return "explanatory"
-        elif re.search(r'\bwhat\s+is\b|\bdefine\b|\bmeaning\s+of\b|\bdefinition\b', query_lower):
-            return "definitional"
-        elif re.search(r'\bwhy\b|\bcause\b|\breason\b', query_lower):
-            return "causal"
-        elif re.search(r'\bwhen\b|\bwhere\b|\bwho\b|\bwhich\b', query_lower):
-            return "factual"
-        elif re.search(r'\blist\b|\bname\b|\bgive\b.+\bexamples\b', query_lower):
-            return "enumerative"
-        elif re.search(r'\badvantages\b|\bbenefits\b|\bdrawbacks\b|\blimitations\b', query_lower):
-            return "evaluative"
-        else:
-            return "general"
+        match = QUERY_TYPE_RE.match(query.lower())
+        return match.lastgroup if match else "general"
     
-    def _extract_key_terms(self, query: str) -> List[str]:
+    def _extract_key_terms(self, query: str, doc: Optional[Any]) -> List[Tuple[str, str]]:
         """
         Extract important terms from the query using NLP techniques.
         
         Args:
             query: The user's raw query
+            doc: The parsed spaCy Doc of the query, or None without spaCy
             
         Returns:
-            A list of key terms from the query
+            A list of (surface form, key term) pairs; the key term is the lemma
+            when spaCy is available and the lowercased word otherwise
         """
-        if self.use_spacy and self.nlp is not None:
+        if doc is not None:
             # Use spaCy for more advanced term extraction
-            doc = self.nlp(query)
-            
             # Extract nouns, proper nouns, and important verbs
             key_terms = []
             for token in doc:
                 if token.pos_ in ["NOUN", "PROPN"] or (token.pos_ == "VERB" and token.dep_ == "ROOT"):
                     if not token.is_stop and len(token.text) > 2:
-                        key_terms.append(token.lemma_)
+                        key_terms.append((token.text, token.lemma_))
             
             # If we didn't find enough terms, include adjectives
             if len(key_terms) < 2:
                 for token in doc:
                     if token.pos_ == "ADJ" and not token.is_stop and len(token.text) > 2:
-                        key_terms.append(token.lemma_)
+                        key_terms.append((token.text, token.lemma_))
                         
             return key_terms
         else:
@@ -152,26 +265,28 @@ class QueryUnderstandingAgent(BaseAgent):
             words = query.lower().split()
             key_terms = [word for word in words if word not in self.stopwords and len(word) > 2]
             
-            # Count frequency to find more important terms
-            term_counts = Counter(key_terms)
+            # Unique terms in first-seen order; only repeated terms need counting
+            unique_terms = list(dict.fromkeys(key_terms))
+            if len(unique_terms) < len(key_terms):
+                # Sort by frequency, the sort is stable so ties keep their order
+                term_counts = Counter(key_terms)
+                unique_terms.sort(key=term_counts.__getitem__, reverse=True)
             
-            # Return unique terms sorted by frequency
-            return [term for term, _ in term_counts.most_common()]
+            return [(term, term) for term in unique_terms]
     
-    def _extract_entities(self, query: str) -> List[Dict[str, str]]:
+    def _extract_entities(self, doc: Optional[Any]) -> List[Dict[str, str]]:
         """
         Extract named entities from the query.
         
         Args:
-            query: The user's raw query
+            doc: The parsed spaCy Doc of the query, or None without spaCy
             
         Returns:
             A list of dictionaries containing entity text and type
         """
         entities = []
         
-        if self.use_spacy and self.nlp is not None:
-            doc = self.nlp(query)
+        if doc is not None:
             for ent in doc.ents:
                 entities.append({
                     "text": ent.text,
@@ -180,13 +295,13 @@ class QueryUnderstandingAgent(BaseAgent):
         
         return entities
     
-    def _expand_query(self, query: str, key_terms: List[str], query_type: str) -> str:
+    def _expand_query(self, query: str, key_terms: List[Tuple[str, str]], query_type: str) -> str:
         """
         Expand the query with related terms to improve retrieval.
         
         Args:
             query: The original query
-            key_terms: Key terms extracted from the query
+            key_terms: (surface form, key term) pairs extracted from the query
             query_type: The type of query
             
         Returns:
@@ -207,13 +322,10 @@ class QueryUnderstandingAgent(BaseAgent):
         
         # Include key terms with their variants if available
         term_expansions = []
-        if self.use_spacy and self.nlp is not None:
-            for term in key_terms[:3]:  # Limit to top 3 terms to avoid dilution
-                doc = self.nlp(term)
-                if len(doc) > 0:
-                    # Include lemma form if different from the original
-                    if doc[0].lemma_ != term:
-                        term_expansions.append(doc[0].lemma_)
+        for surface, lemma in key_terms[:3]:  # Limit to top 3 terms to avoid dilution
+            # Include lemma form if different from the original wording in the query
+            if lemma != surface and lemma not in term_expansions:
+                term_expansions.append(lemma)
         
         if term_expansions:
             expanded += " " + " ".join(term_expansions)
@@ -231,32 +343,8 @@ class QueryUnderstandingAgent(BaseAgent):
         Returns:
             A string describing the likely user intent
         """
-        query_lower = query.lower()
-        
-        # Check for common intent patterns
-        if "how to" in query_lower or "how do i" in query_lower:
-            return "instruction_seeking"
-        elif "what is" in query_lower or "define" in query_lower:
-            return "knowledge_seeking"
-        elif "why" in query_lower:
-            return "understanding_seeking"
-        elif "compare" in query_lower or "difference" in query_lower:
-            return "comparison_seeking"
-        elif any(word in query_lower for word in ["problem", "error", "issue", "bug", "fix"]):
-            return "troubleshooting"
-        elif any(word in query_lower for word in ["best", "recommend", "should", "better"]):
-            return "recommendation_seeking"
-        else:
-            # Default mapping based on query type
-            intent_map = {
-                "procedural": "instruction_seeking",
-                "explanatory": "understanding_seeking",
-                "definitional": "knowledge_seeking",
-                "comparative": "comparison_seeking",
-                "causal": "understanding_seeking",
-                "factual": "fact_seeking",
-                "enumerative": "information_gathering",
-                "evaluative": "assessment_seeking",
-                "general": "information_seeking"
-            }
-            return intent_map.get(query_type, "information_seeking")
+        # Check for common intent patterns, falling back to the query type
+        intent = self._match_intent(query.lower())
+        if intent is not None:
+            return intent
+        return INTENT_BY_QUERY_TYPE.get(query_type, "information_seeking")
@@ -1,10 +1,79 @@
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
 from .base_agent import BaseAgent
 import torch
 from transformers import TextIteratorStreamer
 from threading import Thread
+from itertools import chain
+import numpy as np
+import asyncio
 import re
 
+# Patterns used when post-processing generated responses
+SPECIAL_TOKEN_RE = re.compile(r"<\|.*?\|>")
+WHITESPACE_RE = re.compile(r"\s+")
+NUMBERED_STEP_RE = re.compile(r"^\d+\.\s")
+# Sentence boundaries: whitespace after '.', '!' or '?' followed by a capital letter,
+# so abbreviations such as "e.g. the" or "Fig. 1" do not end a step
+SENTENCE_BOUNDARY_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z])")
+
+# Patterns used by the grounding check
+SENTENCE_SPLIT_RE = re.compile(r'[.!?]')
+ALNUM_WORD_RE = re.compile(r'[^\W_]+')  # Runs of letters and digits
+
+# Only words longer than this count as important for grounding
+MIN_IMPORTANT_WORD_LENGTH = 4
+
+# From this many important response words on, they are all looked up at once with NumPy
+VECTORIZED_GROUNDING_MIN_WORDS = 256
+
+# Lead-in phrases often generated by LLMs that add nothing to the answer
+REDUNDANT_PHRASES = (
+    "Based on the provided context,",
+    "According to the information provided,",
+    "As mentioned in the context,",
+    "From the context provided,"
+)
+
+# Base prompts for different query types
+SYSTEM_PROMPTS = {
+    "explanatory": "You are a helpful assistant providing clear explanations. Use the following context to explain the topic thoroughly and logically.",
+    "definitional": "You are a precise assistant defining concepts. Use the following context to provide a clear, concise definition.",
+    "comparative": "You are a balanced assistant comparing topics. Use the following context to highlight similarities and differences in a fair way.",
+    "causal": "You are an insightful assistant explaining causes and effects. Use the following context to explain the relationships between events or concepts.",
+    "factual": "You are a factual assistant providing accurate information. Use the following context to give precise, concise facts without speculation.",
+    "procedural": "You are a helpful guide providing step-by-step instructions. Use the following context to explain how to perform a task clearly and accurately.",
+    "enumerative": "You are a thorough assistant providing comprehensive lists. Use the following context to enumerate all relevant items clearly and concisely.",
+    "evaluative": "You are a balanced reviewer evaluating options. Use the following context to assess advantages and disadvantages fairly.",
+    "general": "You are a helpful assistant providing information. Use the following context to give a relevant, concise response."
+}
+
+# Enhancements of the base prompt for each user intent
+INTENT_ENHANCEMENTS = {
+    "instruction_seeking": " Focus on clear, actionable steps that are easy to follow.",
+    "knowledge_seeking": " Prioritize accuracy and clarity in your educational response.",
+    "understanding_seeking": " Ensure a thorough explanation that builds conceptual understanding.",
+    "comparison_seeking": " Present a balanced view of all sides with clear distinctions.",
+    "troubleshooting": " Focus on identifying potential solutions to the problem.",
+    "recommendation_seeking": " Provide thoughtful recommendations with justifications.",
+    "information_seeking": " Deliver comprehensive, well-organized information.",
+    "assessment_seeking": " Offer a fair evaluation of pros and cons."
+}
+
+# Guidelines appended to every system prompt
+UNIVERSAL_GUIDELINES = (
+    " Base your answer strictly on the provided context. "
+    "If the context doesn't contain enough information to answer fully, "
+    "acknowledge limitations rather than inventing information. "
+    "Use a clear, concise, and helpful tone."
+)
+
+# Every system prompt precomputed per (query type, intent); None stands for an intent without enhancement
+SYSTEM_PROMPT_TABLE = {
+    (query_type, intent): base_prompt + INTENT_ENHANCEMENTS.get(intent, "") + UNIVERSAL_GUIDELINES
+    for query_type, base_prompt in SYSTEM_PROMPTS.items()
+    for intent in [*INTENT_ENHANCEMENTS, None]
+}
+
 
 class ResponseGenerationAgent(BaseAgent):
     """
@@ -17,13 +86,16 @@ class ResponseGenerationAgent(BaseAgent):
     4. Ensures responses are grounded in the retrieved documents
     """
     
+    supports_batch = True
+    
     def __init__(self, model, tokenizer, name: str = "response_agent", 
-                 max_new_tokens: int = 512, temperature: float = 0.7):
+                 max_new_tokens: int = 512, temperature: float = 0.7, max_batch_size: int = 16):
         super().__init__(name)
         self.model = model
         self.tokenizer = tokenizer
         self.max_new_tokens = max_new_tokens
         self.temperature = temperature
+        self.max_batch_size = max_batch_size
         
     async def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -42,21 +114,48 @@ class ResponseGenerationAgent(BaseAgent):
                 - response: The generated response
                 - response_metadata: Additional information about the response
         """
-        # Get the necessary data
-        context = input_data.get("integrated_context", "")
-        query = input_data.get("query", "")
-        query_type = input_data.get("query_type", "general")
-        intent = input_data.get("intent", "information_seeking")
-        entities = input_data.get("entities", [])
-        
-        # Create a prompt based on the query type and intent
-        system_prompt = self._get_system_prompt(query_type, intent)
+        return (await self.process_batch([input_data]))[0]
+    
+    async def process_batch(self, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Generate responses for several inputs, running their prompts through the model together.
         
-        # Build the full prompt with context
-        full_prompt = self._build_prompt(system_prompt, context, query, entities)
+        Args:
+            inputs: The input data of each pipeline run, as accepted by process
+            
+        Returns:
+            The result for each input, as returned by process
+        """
+        prompts = [self._prepare_prompt(input_data) for input_data in inputs]
+        
+        # Generate the responses using the LLM, off the event loop so other requests keep running
+        if len(prompts) == 1:
+            generations = [await asyncio.to_thread(self._generate_response, prompts[0])]
+        else:
+            generations = []
+            for start in range(0, len(prompts), self.max_batch_size):
+                chunk = prompts[start:start + self.max_batch_size]
+                generations.extend(await asyncio.to_thread(self._generate_responses, chunk))
+        
+        return [self._build_result(input_data, *generation)
+                for input_data, generation in zip(inputs, generations)]
+    
+    def _build_result(self, input_data: Dict[str, Any], response: str,
+                      prompt_tokens: int, response_tokens: int) -> Dict[str, Any]:
+        """
+        Post-process a generated response and describe it.
         
-        # Generate the response using the LLM
-        response = self._generate_response(full_prompt)
+        Args:
+            input_data: The agent input the response was generated for
+            response: The raw generated response
+            prompt_tokens: Number of tokens in the prompt
+            response_tokens: Number of generated tokens
+            
+        Returns:
+            The agent result, as returned by process
+        """
+        context = input_data.get("integrated_context", "")
+        query_type = input_data.get("query_type", "general")
         
         # Post-process the response to ensure quality
         processed_response = self._post_process_response(response, query_type)
@@ -65,8 +164,8 @@ class ResponseGenerationAgent(BaseAgent):
         response_metadata = {
             "grounded": self._is_response_grounded(processed_response, context),
             "response_type": query_type,
-            "prompt_tokens": len(self.tokenizer.encode(full_prompt)),
-            "response_tokens": len(self.tokenizer.encode(processed_response))
+            "prompt_tokens": prompt_tokens,
+            "response_tokens": response_tokens
         }
         
         return {
@@ -74,6 +173,59 @@ class ResponseGenerationAgent(BaseAgent):
             "response_metadata": response_metadata
         }
     
+    async def stream_response(self, input_data: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Generate a response and yield the text as the model produces it.
+        
+        The chunks are raw model output; unlike process, no post-processing is applied.
+        
+        Args:
+            input_data: The same input as accepted by process
+            
+        Yields:
+            Successive pieces of the generated response text
+        """
+        full_prompt = self._prepare_prompt(input_data)
+        inputs = self.tokenizer(full_prompt, return_tensors="pt").to(self.model.device)
+        
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        thread = Thread(target=self.model.generate,
+                        kwargs={**inputs, **self._generation_kwargs(), "streamer": streamer})
+        thread.start()
+        
+        # Wait for each chunk in a worker thread so the event loop is never blocked
+        while True:
+            chunk = await asyncio.to_thread(next, streamer, None)
+            if chunk is None:
+                break
+            if chunk:
+                yield chunk
+        
+        await asyncio.to_thread(thread.join)
+    
+    def _prepare_prompt(self, input_data: Dict[str, Any]) -> str:
+        """
+        Build the full LLM prompt for the agent input.
+        
+        Args:
+            input_data: The agent input, as accepted by process
+            
+        Returns:
+            The formatted prompt
+        """
+        # Get the necessary data
+        context = input_data.get("integrated_context", "")
+        query = input_data.get("query", "")
+        query_type = input_data.get("query_type", "general")
+        intent = input_data.get("intent", "information_seeking")
+        entities = input_data.get("entities", [])
+        
+        # Create a prompt based on the query type and intent
+        system_prompt = self._get_system_prompt(query_type, intent)
+        
+        # Build the full prompt with context
+        return self._build_prompt(system_prompt, context, query, entities)
+    
     def _get_system_prompt(self, query_type: str, intent: str) -> str:
         """
         Get an appropriate system prompt based on query type and intent.
@@ -85,47 +237,16 @@ class ResponseGenerationAgent(BaseAgent):
         Returns:
             A system prompt tailored to the query type and intent
         """
-        # Base prompts for different query types
-        system_prompts = {
-            "explanatory": "You are a helpful assistant providing clear explanations. Use the following context to explain the topic thoroughly and logically.",
-            "definitional": "You are a precise assistant defining concepts. Use the following context to provide a clear, concise definition.",
-            "comparative": "You are a balanced assistant comparing topics. Use the following context to highlight similarities and differences in a fair way.",
-            "causal": "You are an insightful assistant explaining causes and effects. Use the following context to explain the relationships between events or concepts.",
-            "factual": "You are a factual assistant providing accurate information. Use the following context to give precise, concise facts without speculation.",
-            "procedural": "You are a helpful guide providing step-by-step instructions. Use the following context to explain how to perform a task clearly and accurately.",
-            "enumerative": "You are a thorough assistant providing comprehensive lists. Use the following context to enumerate all relevant items clearly and concisely.",
-            "evaluative": "You are a balanced reviewer evaluating options. Use the following context to assess advantages and disadvantages fairly.",
-            "general": "You are a helpful assistant providing information. Use the following context to give a relevant, concise response."
-        }
-        
-        # Get the base prompt for the query type
-        base_prompt = system_prompts.get(query_type, system_prompts["general"])
-        
-        # Enhance the prompt based on intent
-        intent_enhancements = {
-            "instruction_seeking": " Focus on clear, actionable steps that are easy to follow.",
-            "knowledge_seeking": " Prioritize accuracy and clarity in your educational response.",
-            "understanding_seeking": " Ensure a thorough explanation that builds conceptual understanding.",
-            "comparison_seeking": " Present a balanced view of all sides with clear distinctions.",
-            "troubleshooting": " Focus on identifying potential solutions to the problem.",
-            "recommendation_seeking": " Provide thoughtful recommendations with justifications.",
-            "information_seeking": " Deliver comprehensive, well-organized information.",
-            "assessment_seeking": " Offer a fair evaluation of pros and cons."
-        }
-        
-        # Add the intent-specific enhancement if available
-        enhancement = intent_enhancements.get(intent, "")
-        enhanced_prompt = base_prompt + enhancement
+        prompt = SYSTEM_PROMPT_TABLE.get((query_type, intent))
+        if prompt is None:
+            # Unknown query types get the general prompt, unknown intents no enhancement
+            if query_type not in SYSTEM_PROMPTS:
+                query_type = "general"
+            if intent not in INTENT_ENHANCEMENTS:
+                intent = None
+            prompt = SYSTEM_PROMPT_TABLE[(query_type, intent)]
         
-        # Add universal guidelines
-        universal_guidelines = (
-            " Base your answer strictly on the provided context. "
-            "If the context doesn't contain enough information to answer fully, "
-            "acknowledge limitations rather than inventing information. "
-            "Use a clear, concise, and helpful tone."
-        )
-        
-        return enhanced_prompt + universal_guidelines
+        return prompt
     
     def _build_prompt(self, system_prompt: str, context: str, query: str, entities: List[Dict[str, str]]) -> str:
         """
@@ -140,13 +261,14 @@ class ResponseGenerationAgent(BaseAgent):
         Returns:
             A formatted prompt string
         """
-        # Highlight entities in the query if any exist
+        # Highlight entities in the query if any exist, in a single pass so that
+        # entities nested in or overlapping others are only highlighted once
         highlighted_query = query
-        for entity in entities:
-            highlighted_query = highlighted_query.replace(
-                entity["text"], 
-                f"**{entity['text']}**"
-            )
+        entity_texts = {entity["text"] for entity in entities if entity["text"]}
+        if entity_texts:
+            # Longest first, so a longer entity wins over an entity it contains
+            entity_re = re.compile("|".join(map(re.escape, sorted(entity_texts, key=len, reverse=True))))
+            highlighted_query = entity_re.sub(lambda match: f"**{match.group(0)}**", query)
         
         # Format for the model (adapt this to your specific model's preferred format)
         # This example uses a chat format with system, context, and user messages
@@ -165,7 +287,7 @@ Here is the relevant context information:
         
         return prompt
     
-    def _generate_response(self, prompt: str) -> str:
+    def _generate_response(self, prompt: str) -> Tuple[str, int, int]:
         """
         Generate a response using the language model.
         
@@ -173,26 +295,16 @@ Here is the relevant context information:
             prompt: The formatted prompt
             
         Returns:
-            The generated response text
+            A (response text, prompt token count, generated token count) tuple
         """
         # Tokenize the prompt
         inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
         
-        # Set up generation parameters
-        gen_kwargs = {
-            "max_new_tokens": self.max_new_tokens,
-            "temperature": self.temperature,
-            "top_p": 0.9,
-            "do_sample": self.temperature > 0,
-            "eos_token_id": self.tokenizer.eos_token_id,
-            "pad_token_id": self.tokenizer.pad_token_id if hasattr(self.tokenizer, 'pad_token_id') else self.tokenizer.eos_token_id,
-        }
-        
         # Generate the response
         with torch.no_grad():
             generated_ids = self.model.generate(
                 **inputs,
-                **gen_kwargs
+                **self._generation_kwargs()
             )
             
         # Decode the generated text
@@ -201,7 +313,68 @@ Here is the relevant context information:
         # Extract just the assistant's response 
         response = generated_text.split("<|assistant|>")[-1].strip()
         
-        return response
+        # Token counts come from the generation itself, so nothing is tokenized twice
+        prompt_tokens = inputs["input_ids"].shape[-1]
+        response_tokens = generated_ids.shape[-1] - prompt_tokens
+        
+        return response, prompt_tokens, response_tokens
+    
+    def _generate_responses(self, prompts: List[str]) -> List[Tuple[str, int, int]]:
+        """
+        Generate responses for several prompts with a single padded generate call.
+        
+        Args:
+            prompts: The formatted prompts
+            
+        Returns:
+            A (response text, prompt token count, generated token count) tuple per prompt
+        """
+        # Decoder-only models continue from the last position, so pad on the left
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        padding_side = self.tokenizer.padding_side
+        self.tokenizer.padding_side = "left"
+        try:
+            inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.model.device)
+        finally:
+            self.tokenizer.padding_side = padding_side
+        
+        with torch.no_grad():
+            generated_ids = self.model.generate(
+                **inputs,
+                **self._generation_kwargs()
+            )
+        
+        # Every prompt occupies the same padded width, the new tokens follow it
+        padded_length = inputs["input_ids"].shape[-1]
+        results = []
+        for i in range(len(prompts)):
+            generated_text = self.tokenizer.decode(generated_ids[i], skip_special_tokens=True)
+            response = generated_text.split("<|assistant|>")[-1].strip()
+            
+            # Sequences that finished early are padded up to the longest one
+            prompt_tokens = int(inputs["attention_mask"][i].sum())
+            response_tokens = int((generated_ids[i, padded_length:] != self.tokenizer.pad_token_id).sum())
+            results.append((response, prompt_tokens, response_tokens))
+        
+        return results
+    
+    def _generation_kwargs(self) -> Dict[str, Any]:
+        """Generation parameters shared by process and stream_response."""
+        gen_kwargs = {
+            "max_new_tokens": self.max_new_tokens,
+            "temperature": self.temperature,
+            "top_p": 0.9,
+            "do_sample": self.temperature > 0,
+            "eos_token_id": self.tokenizer.eos_token_id,
+            "pad_token_id": self.tokenizer.pad_token_id if hasattr(self.tokenizer, 'pad_token_id') else self.tokenizer.eos_token_id,
+            "use_cache": True,
+        }
+        # A forward pass compiled by load_quantized_model needs a static KV cache,
+        # whose fixed shapes let the compiled graph be reused
+        if getattr(self.model, "forward_compiled", False):
+            gen_kwargs["cache_implementation"] = "static"
+        return gen_kwargs
     
     def _post_process_response(self, response, query_type: str) -> str:
         """
@@ -219,33 +392,26 @@ Here is the relevant context information:
             return ""
             
         # Remove any remaining special tokens or artifacts
-        response = re.sub(r"<\|.*?\|>", "", response)
+        response = SPECIAL_TOKEN_RE.sub("", response)
         
         # Clean up whitespace
-        response = re.sub(r"\s+", " ", response).strip()
+        response = WHITESPACE_RE.sub(" ", response).strip()
         
         # Remove redundant phrases often generated by LLMs
-        redundant_phrases = [
-            "Based on the provided context,",
-            "According to the information provided,",
-            "As mentioned in the context,",
-            "From the context provided,"
-        ]
-        
-        for phrase in redundant_phrases:
-            if response.startswith(phrase):
-                response = response[len(phrase):].strip()
+        if response.startswith(REDUNDANT_PHRASES):
+            for phrase in REDUNDANT_PHRASES:
+                if response.startswith(phrase):
+                    response = response[len(phrase):].strip()
         
         # Format the response based on query type
         if query_type == "procedural":
             # Ensure step numbering is consistent for procedural queries
-            if not re.search(r"^\d+\.\s", response):
-                steps = response.split(". ")
+            if not NUMBERED_STEP_RE.search(response):
+                steps = SENTENCE_BOUNDARY_RE.split(response)
                 if len(steps) > 2:
-                    formatted_steps = []
-                    for i, step in enumerate(steps[:-1]):  # Exclude the last element if it's not a complete step
-                        formatted_steps.append(f"{i+1}. {step}")
-                    response = "\n".join(formatted_steps)
+                    if not steps[-1].endswith((".", "!", "?")):
+                        steps.pop()  # Exclude the last element if it's not a complete step
+                    response = "\n".join(f"{i+1}. {step}" for i, step in enumerate(steps))
         
         elif query_type == "comparative":
             # Enhance structure for comparative responses
@@ -268,7 +434,8 @@ Here is the relevant context information:
                 # If we found terms to compare, restructure the response
                 if len(comparison_terms) >= 2:
                     term1, term2 = comparison_terms[:2]
-                    if not re.search(f"{term1}:|{term2}:", response, re.IGNORECASE):
+                    # The terms come from the response itself, so match them literally
+                    if not re.search(f"{re.escape(term1)}:|{re.escape(term2)}:", response, re.IGNORECASE):
                         # Try to split the response into sections about each term
                         response = f"Comparison between {term1} and {term2}:\n\n" + response
         
@@ -287,27 +454,69 @@ Here is the relevant context information:
         """
         # A simple approach: check if key sentences from the response
         # have substantial overlap with the context
-        response_sentences = re.split(r'[.!?]', response)
-        context_lower = context.lower()
+        response_sentences = SENTENCE_SPLIT_RE.split(response)
+        
+        # Tokenize the context once so each word check is a set lookup
+        context_words = frozenset(word for word in ALNUM_WORD_RE.findall(context.lower())
+                                  if len(word) > MIN_IMPORTANT_WORD_LENGTH)
         
-        grounded_sentences = 0
-        total_sentences = len(response_sentences)
+        total_sentences = 0
+        sentence_words = []  # Important words of each sentence that has any
         
         for sentence in response_sentences:
             sentence = sentence.strip()
             if not sentence:
-                total_sentences -= 1
                 continue
-                
+            total_sentences += 1
+            
             # Check for significant word overlap
             important_words = [word for word in sentence.lower().split() 
-                              if len(word) > 4 and word.isalnum()]
-            
+                              if len(word) > MIN_IMPORTANT_WORD_LENGTH and word.isalnum()]
             if important_words:
-                overlapping = sum(1 for word in important_words if word in context_lower)
-                # If more than 40% of important words are in the context, consider it grounded
-                if overlapping / len(important_words) > 0.4:
-                    grounded_sentences += 1
+                sentence_words.append(important_words)
+        
+        word_count = sum(map(len, sentence_words))
+        if word_count >= VECTORIZED_GROUNDING_MIN_WORDS:
+            overlaps = self._count_context_words(sentence_words, word_count, context_words)
+        else:
+            overlaps = [sum(1 for word in important_words if word in context_words)
+                        for important_words in sentence_words]
+        
+        # If more than 40% of important words are in the context, consider the sentence grounded
+        grounded_sentences = sum(1 for overlapping, important_words in zip(overlaps, sentence_words)
+                                 if overlapping / len(important_words) > 0.4)
         
         # If more than 70% of sentences are grounded, consider the response grounded
         return (total_sentences == 0) or (grounded_sentences / total_sentences > 0.7)
+    
+    def _count_context_words(self, sentence_words: List[List[str]], word_count: int,
+                             context_words: frozenset) -> np.ndarray:
+        """
+        Count the words of each sentence that occur in the context, in one vectorized pass.
+        
+        Words are compared by their hashes: the response words are looked up in the
+        sorted context hashes with a single binary search over all sentences.
+        
+        Args:
+            sentence_words: The important words of each sentence
+            word_count: The total number of words in sentence_words
+            context_words: The words of the context
+            
+        Returns:
+            The number of context words in each sentence
+        """
+        if not context_words or not sentence_words:
+            return np.zeros(len(sentence_words), dtype=np.int64)
+        
+        context_hashes = np.sort(np.fromiter(map(hash, context_words), dtype=np.int64,
+                                             count=len(context_words)))
+        word_hashes = np.fromiter(map(hash, chain.from_iterable(sentence_words)), dtype=np.int64,
+                                  count=word_count)
+        
+        positions = np.searchsorted(context_hashes, word_hashes)
+        np.minimum(positions, len(context_hashes) - 1, out=positions)
+        found = context_hashes[positions] == word_hashes
+        
+        # Sum the matches of each sentence from its first word onwards
+        starts = np.cumsum([0] + [len(words) for words in sentence_words[:-1]])
+        return np.add.reduceat(found.astype(np.int64), starts)
@@ -1,13 +1,25 @@
 from typing import Dict, Any, List, Tuple, Optional
+from collections import Counter, OrderedDict
 from .base_agent import BaseAgent
+from .text_utils import BM25_K1, BM25_B, TOKEN_RE
 from langchain_community.vectorstores import Chroma
 import numpy as np
+import hashlib
 import logging
+import time
+
+try:
+    from fastembed.rerank.cross_encoder import TextCrossEncoder
+except ImportError:  # fastembed is optional, documents are then ranked without a reranker
+    TextCrossEncoder = None
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Weight of the BM25 key-term score, scaled to [0, 1], added to the vector score when ranking
+BM25_WEIGHT = 0.2
+
 class RetrievalAgent(BaseAgent):
     """
     Agent responsible for retrieving relevant documents from the vector database.
@@ -19,9 +31,40 @@ class RetrievalAgent(BaseAgent):
     4. Returns a set of high-quality context documents
     """
     
-    def __init__(self, vectordb: Chroma, name: str = "retrieval_agent"):
+    supports_batch = True
+    
+    def __init__(self, vectordb: Chroma, name: str = "retrieval_agent", cache_size: int = 512,
+                 cache_ttl: float = 600, semantic_threshold: Optional[float] = 0.97,
+                 reranker_model: Optional[str] = None):
+        """
+        Initialize the agent.
+        
+        Args:
+            vectordb: The vector database to retrieve documents from
+            name: The agent name
+            cache_size: Maximum number of cached search results (0 disables the cache)
+            cache_ttl: Time in seconds after which cached search results expire
+            semantic_threshold: Cosine similarity from which a query reuses the cached
+                results of a different query (None only reuses results of identical queries)
+            reranker_model: Cross-encoder (e.g. "BAAI/bge-reranker-base") reranking the
+                retrieved documents down to the number needed for the query type
+                (None ranks by vector score and key terms only)
+        """
         super().__init__(name)
         self.vectordb = vectordb
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.semantic_threshold = semantic_threshold
+        
+        # Search results by query digest: (stored at, k, results, normalized query embedding)
+        self._cache: "OrderedDict[str, Tuple[float, int, List[Tuple], Optional[np.ndarray]]]" = OrderedDict()
+        
+        self.reranker = None
+        if reranker_model is not None:
+            if TextCrossEncoder is None:
+                logger.warning(f"fastembed is not installed, reranker {reranker_model} disabled")
+            else:
+                self.reranker = TextCrossEncoder(model_name=reranker_model)
         
     async def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -40,6 +83,86 @@ class RetrievalAgent(BaseAgent):
                 - context_text: Combined text from all relevant documents
                 - relevance_scores: Scores indicating document relevance
         """
+        return (await self.process_batch([input_data]))[0]
+    
+    async def process_batch(self, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Retrieve documents for several queries, embedding all of them in one call.
+        
+        Args:
+            inputs: The input data of each pipeline run, as accepted by process
+            
+        Returns:
+            The result for each input, as returned by process
+        """
+        plans = [self._plan_retrieval(input_data) for input_data in inputs]
+        embeddings: Dict[str, List[float]] = {}
+        
+        # First try with the expanded queries, embedded as a single batch
+        results = self._retrieve_many([(query, k) for query, _, _, k in plans], embeddings)
+        
+        # If no results, try with key terms, embedding every fallback query together
+        fallbacks = [i for i, found in enumerate(results) if not found and plans[i][2]]
+        if fallbacks:
+            logger.info(f"No results with expanded query, trying with key terms...")
+            searches = [(" ".join(plans[i][2]), plans[i][3]) for i in fallbacks]
+            for i, found in zip(fallbacks, self._retrieve_many(searches, embeddings)):
+                results[i] = found
+        
+        # If still no results, try to increase k, reusing the query embeddings
+        retries = [i for i, found in enumerate(results) if not found]
+        for i in retries:
+            logger.info(f"No results with k={plans[i][3]}, trying with increased k...")
+        if retries:
+            searches = [(plans[i][0], plans[i][3] * 2) for i in retries]
+            for i, found in zip(retries, self._retrieve_many(searches, embeddings)):
+                results[i] = found
+        
+        # The reranker scores against the user's own question and keeps the un-doubled k
+        return [self._build_result(key_terms, found, input_data.get("query", query), k // 2)
+                for input_data, (query, _, key_terms, k), found in zip(inputs, plans, results)]
+    
+    def _retrieve_many(self, searches: List[Tuple[str, int]],
+                       embeddings: Dict[str, List[float]]) -> List[List[Tuple]]:
+        """
+        Run several searches, embedding all queries that need it in one call.
+        
+        Args:
+            searches: (query, k) pairs to search for
+            embeddings: Query embeddings computed so far; new embeddings are added to it
+            
+        Returns:
+            The (document, score) tuples found for each search
+        """
+        # Queries searched recently are answered from the cache without embedding them
+        results = [self._cache_get(query, k) for query, k in searches]
+        
+        to_embed = list(dict.fromkeys(query for (query, _), cached in zip(searches, results)
+                                      if cached is None and query not in embeddings))
+        new_embeddings = self._embed_queries(to_embed) if to_embed else None
+        if new_embeddings is not None:
+            embeddings.update(zip(to_embed, new_embeddings))
+        
+        for i, (query, k) in enumerate(searches):
+            if results[i] is not None:
+                continue
+            if query in embeddings:
+                results[i] = self._try_retrieval_by_vector(query, embeddings[query], k)
+            else:
+                results[i] = self._try_retrieval(query, k)
+        
+        return results
+    
+    def _plan_retrieval(self, input_data: Dict[str, Any]) -> Tuple[str, str, List[str], int]:
+        """
+        Work out the query, query type, key terms and number of documents to retrieve.
+        
+        Args:
+            input_data: The agent input
+            
+        Returns:
+            A (query, query_type, key_terms, k) tuple
+        """
         # Get the query information
         query = input_data.get("expanded_query", input_data.get("query", ""))
         query_type = input_data.get("query_type", "general")
@@ -62,42 +185,41 @@ class RetrievalAgent(BaseAgent):
         # Increase k to improve chances of finding relevant documents
         k = k_values.get(query_type, 4) * 2  # Double the initial k value
         
-        # First try with expanded query
-        results = self._try_retrieval(query, k)
-        
-        # If no results, try with key terms
-        if not results and key_terms:
-            logger.info(f"No results with expanded query, trying with key terms...")
-            key_terms_query = " ".join(key_terms)
-            results = self._try_retrieval(key_terms_query, k)
-        
-        # If still no results, try to increase k
-        if not results:
-            logger.info(f"No results with k={k}, trying with increased k...")
-            results = self._try_retrieval(query, k * 2)
+        return query, query_type, key_terms, k
+    
+    def _build_result(self, key_terms: List[str], results: List[Tuple], query: str = "",
+                      top_k: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Rank the retrieved documents and assemble the agent result.
         
+        Args:
+            key_terms: Important terms from the query
+            results: (document, score) tuples retrieved for the query
+            query: The query the reranker scores documents against
+            top_k: Number of documents kept after reranking
+            
+        Returns:
+            The agent result
+        """
         # Process and rank the results
-        documents = []
-        scores = []
-        sources = []
-        
-        for doc, score in results:
-            documents.append(doc.page_content)
-            scores.append(float(score))  # Convert to float for serialization
-            sources.append({
-                "source": doc.metadata.get("source", "Unknown"),
-                "title": doc.metadata.get("title", "Unknown")
-            })
+        documents = [doc.page_content for doc, _ in results]
+        scores = np.fromiter((score for _, score in results), dtype=np.float64, count=len(results))
         
         logger.info(f"Retrieved {len(documents)} documents")
         
-        # Advanced ranking could be implemented here
-        ranked_indices = self._rank_documents(documents, scores, key_terms)
+        if self.reranker is not None and documents and top_k:
+            ranked_indices = self._rerank_documents(query, documents, top_k)
+        else:
+            ranked_indices = self._rank_documents(documents, scores, key_terms)
         
-        # Reorder documents, scores, and sources based on the ranking
+        # Reorder based on the ranking; sources are only built for the documents kept,
+        # and tolist() converts the scores to floats for serialization in one call
         documents = [documents[i] for i in ranked_indices]
-        scores = [scores[i] for i in ranked_indices]
-        sources = [sources[i] for i in ranked_indices]
+        scores = scores[ranked_indices].tolist()
+        sources = [{
+            "source": results[i][0].metadata.get("source", "Unknown"),
+            "title": results[i][0].metadata.get("title", "Unknown")
+        } for i in ranked_indices]
         
         # Combine documents into a single context text
         context_text = "\n\n".join(documents)
@@ -109,6 +231,51 @@ class RetrievalAgent(BaseAgent):
             "relevance_scores": scores
         }
     
+    def _embed_queries(self, queries: List[str]) -> Optional[List[List[float]]]:
+        """
+        Embed several queries with a single call to the embedding model.
+        
+        Returns:
+            One embedding per query, or None if the vector store does not expose
+            its embedding model
+        """
+        embeddings = getattr(self.vectordb, "embeddings", None)
+        if embeddings is None or not hasattr(self.vectordb, "similarity_search_by_vector_with_relevance_scores"):
+            return None
+        # Bypass a document embedding cache, so user queries are never written to disk
+        embeddings = getattr(embeddings, "underlying_embeddings", embeddings)
+        try:
+            return embeddings.embed_documents(queries)
+        except Exception as e:
+            logger.error(f"Error embedding queries: {str(e)}")
+            return None
+    
+    def _try_retrieval_by_vector(self, query: str, embedding: List[float], k: int = 4) -> List[Tuple]:
+        """
+        Try to retrieve documents for a precomputed query embedding.
+        
+        Args:
+            query: The query string the embedding was computed from
+            embedding: The query embedding
+            k: Number of documents to retrieve
+            
+        Returns:
+            List of (document, score) tuples
+        """
+        normalized = self._normalize(embedding)
+        cached = self._cache_get_similar(normalized, k)
+        if cached is not None:
+            return cached
+        
+        try:
+            results = self.vectordb.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+        except Exception as e:
+            logger.error(f"Error retrieving documents: {str(e)}")
+            return []
+        
+        self._cache_put(query, k, results, normalized)
+        return results
+    
     def _try_retrieval(self, query: str, k: int = 4) -> List[Tuple]:
         """
         Try to retrieve documents with error handling.
@@ -120,13 +287,96 @@ class RetrievalAgent(BaseAgent):
         Returns:
             List of (document, score) tuples
         """
+        cached = self._cache_get(query, k)
+        if cached is not None:
+            return cached
+        
         try:
             # Use the vector database to retrieve documents
             results = self.vectordb.similarity_search_with_score(query, k=k)
-            return results
         except Exception as e:
             logger.error(f"Error retrieving documents: {str(e)}")
             return []
+        
+        self._cache_put(query, k, results)
+        return results
+    
+    def _cache_key(self, query: str) -> str:
+        """Digest of a query string used as its cache key."""
+        return hashlib.blake2b(query.encode("utf-8"), digest_size=16).hexdigest()
+    
+    def _normalize(self, embedding: List[float]) -> Optional[np.ndarray]:
+        """Unit-length copy of an embedding for cosine comparisons, None for a zero vector."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+    
+    def _cache_get(self, query: str, k: int) -> Optional[List[Tuple]]:
+        """
+        Return the cached results of a search for the same query with at least k documents.
+        
+        A search with a larger k returns the results of a smaller k as its prefix,
+        so the cached results are cut down to k.
+        """
+        key = self._cache_key(query)
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        
+        stored_at, cached_k, results, _ = entry
+        if time.time() - stored_at > self.cache_ttl:
+            del self._cache[key]
+            return None
+        if cached_k < k:
+            return None
+        
+        self._cache.move_to_end(key)
+        return results[:k]
+    
+    def _cache_get_similar(self, normalized: Optional[np.ndarray], k: int) -> Optional[List[Tuple]]:
+        """
+        Return the cached results of a search for a near-identical query embedding.
+        
+        Args:
+            normalized: The unit-length query embedding
+            k: Number of documents needed
+            
+        Returns:
+            The cached results cut down to k, or None if no cached query is similar enough
+        """
+        if self.semantic_threshold is None or normalized is None or not self._cache:
+            return None
+        
+        now = time.time()
+        candidates = [key for key, (stored_at, cached_k, _, vector) in self._cache.items()
+                      if vector is not None and cached_k >= k and now - stored_at <= self.cache_ttl
+                      and vector.shape == normalized.shape]
+        if not candidates:
+            return None
+        
+        similarities = np.stack([self._cache[key][3] for key in candidates]) @ normalized
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.semantic_threshold:
+            return None
+        
+        self._cache.move_to_end(candidates[best])
+        return self._cache[candidates[best]][2][:k]
+    
+    def _cache_put(self, query: str, k: int, results: List[Tuple],
+                   normalized: Optional[np.ndarray] = None) -> None:
+        """Store search results, evicting the least recently used entries."""
+        if self.cache_size <= 0:
+            return
+        
+        key = self._cache_key(query)
+        self._cache[key] = (time.time(), k, results, normalized)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+    
+    def clear_cache(self) -> None:
+        """Drop all cached search results."""
+        self._cache.clear()
     
     def _rank_documents(self, documents: List[str], scores: List[float], key_terms: List[str]) -> List[int]:
         """
@@ -140,24 +390,68 @@ class RetrievalAgent(BaseAgent):
         Returns:
             List of indices representing the ranked order of documents
         """
-        # This is a simple ranking that weighs vector similarity and key term presence
+        # This is a simple ranking that weighs vector similarity and key term relevance
         # More sophisticated ranking could be implemented
         
-        # Create a copy of the initial scores
-        final_scores = scores.copy()
+        # Boost the score by how well each document matches the key terms under BM25
+        final_scores = np.asarray(scores, dtype=np.float64)
+        bm25_scores = self._bm25_scores(documents, key_terms)
+        best = bm25_scores.max(initial=0.0)
+        if best > 0:
+            final_scores = final_scores + BM25_WEIGHT * bm25_scores / best
+        
+        # Indices that sort the scores in descending order, highest scores first
+        return np.argsort(final_scores)[::-1].tolist()
+    
+    def _rerank_documents(self, query: str, documents: List[str], top_k: int) -> List[int]:
+        """
+        Rank documents with the cross-encoder and keep the best top_k.
+        
+        Args:
+            query: The query to score documents against
+            documents: List of document texts
+            top_k: Number of documents to keep
+            
+        Returns:
+            Indices of the top_k documents, best first
+        """
+        try:
+            rerank_scores = np.fromiter(self.reranker.rerank(query, documents), dtype=np.float64,
+                                        count=len(documents))
+        except Exception as e:
+            logger.error(f"Error reranking documents: {str(e)}")
+            return list(range(len(documents)))
+        
+        ranked = np.argsort(-rerank_scores, kind="stable")
+        return ranked[:top_k].tolist()
+    
+    def _bm25_scores(self, documents: List[str], key_terms: List[str]) -> np.ndarray:
+        """
+        Score the retrieved documents against the key terms with BM25.
+        
+        Term statistics come from the retrieved documents themselves, so terms that
+        occur in every candidate count for little and rarer terms separate them.
         
-        # Boost scores based on key term presence
-        for i, doc in enumerate(documents):
-            doc_lower = doc.lower()
-            term_count = sum(1 for term in key_terms if term in doc_lower)
+        Args:
+            documents: List of document texts
+            key_terms: Important terms from the query
             
-            # Boost the score based on term presence
-            # This is a simple heuristic that can be refined
-            term_boost = term_count * 0.05
-            final_scores[i] += term_boost
+        Returns:
+            The BM25 score of each document
+        """
+        terms = list(dict.fromkeys(TOKEN_RE.findall(" ".join(key_terms).lower())))
+        if not documents or not terms:
+            return np.zeros(len(documents))
+        
+        # Term frequencies as a (terms x documents) matrix
+        doc_counts = [Counter(TOKEN_RE.findall(doc.lower())) for doc in documents]
+        tf = np.array([[counts[term] for counts in doc_counts] for term in terms], dtype=np.float64)
+        doc_lens = np.fromiter((sum(counts.values()) for counts in doc_counts), dtype=np.float64,
+                               count=len(documents))
         
-        # Get indices that would sort the array in descending order
-        ranked_indices = np.argsort(final_scores).tolist()
-        ranked_indices.reverse()  # Highest scores first
+        num_docs = len(documents)
+        df = np.count_nonzero(tf, axis=1)
+        idf = np.log((num_docs - df + 0.5) / (df + 0.5) + 1)
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lens / (doc_lens.mean() or 1.0))
         
-        return ranked_indices
+        return idf @ (tf * (BM25_K1 + 1) / (tf + length_norm))
@@ -0,0 +1,32 @@
+from typing import Callable, Sequence
+import re
+
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick is optional, fall back to substring scans
+    ahocorasick = None
+
+
+# Tokenizer shared by the BM25 scorers
+TOKEN_RE = re.compile(r'\w+')
+
+# BM25 parameters used when ranking retrieved documents and scoring response sentences
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def build_indicator_matcher(indicators: Sequence[str]) -> Callable[[str], bool]:
+    """
+    Build a function that tells whether a lowercased text contains any indicator.
+
+    Uses a single Aho-Corasick automaton when pyahocorasick is installed, so each
+    text is scanned once regardless of the number of indicators.
+    """
+    if ahocorasick is None:
+        return lambda text: any(indicator in text for indicator in indicators)
+
+    automaton = ahocorasick.Automaton()
+    for indicator in indicators:
+        automaton.add_word(indicator, indicator)
+    automaton.make_automaton()
+    return lambda text: next(automaton.iter(text), None) is not None
@@ -1,4 +1,5 @@
 import uvicorn
+from contextlib import asynccontextmanager
 from utils import load_yaml_file
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,10 +7,11 @@ from fastapi.responses import JSONResponse
 
 from routes.main import router as main_router
 from routes.test import router as test_router
-from routes.main import guardrails_processor as main_guardrails_processor
 
-from conversation import initialize_guardrails
+from conversation import initialize_models, initialize_guardrails
+from multi_agent_rag import create_multi_agent_rag
 from guardrails import GuardrailProcessor, GuardrailConfig
+import asyncio
 import logging
 
 # Configure logging
@@ -18,9 +20,28 @@ logger = logging.getLogger(__name__)
 
 config_data = load_yaml_file("config.yaml")
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load the models once per process before the first request is served."""
+    model, tokenizer, vectordb, guardrails_processor = await asyncio.to_thread(initialize_models)
+    app.state.model = model
+    app.state.tokenizer = tokenizer
+    app.state.vectordb = vectordb
+    app.state.guardrails = guardrails_processor
+    app.state.multi_agent_system = create_multi_agent_rag(
+        model, tokenizer, vectordb,
+        batch_size=config_data.get("multi_agent_batch_size", 1),
+        reranker_model=config_data.get("reranker_model")
+    )
+    logger.info("Models loaded, ready to serve requests")
+    yield
+    await app.state.multi_agent_system.close()
+
+
 def create_app() -> FastAPI:
     # Create the FastAPI application
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
 
     # Enable CORS
     app.add_middleware(
@@ -57,12 +78,8 @@ def create_app() -> FastAPI:
         if 'disclaimers' in data:
             config.disclaimers = data['disclaimers']
         
-        # Update the global guardrails processor
-        from routes.main import guardrails_processor
-        new_processor = GuardrailProcessor(config)
-        
-        # Update in routes/main.py
-        globals()['main_guardrails_processor'] = new_processor
+        # Replace the guardrails processor used by the routes
+        request.app.state.guardrails = GuardrailProcessor(config)
         
         # For debugging
         logger.info(f"Successfully updated guardrails. Blocked topics: {config.blocked_topics}")
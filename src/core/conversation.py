@@ -1,13 +1,19 @@
+import copy
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer
-from threading import Thread
+from transformers import (
+    AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer, DynamicCache, StoppingCriteria, StoppingCriteriaList
+)
+from threading import Event, Lock, Thread
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from model import load_quantized_model
+from embeddings import embedding_function
+from vector_store import MAX_IN_MEMORY_VECTORS, in_memory_if_small
+from semantic_cache import SemanticCache
 from utils import load_yaml_file
 from session_history import get_session_history
 from guardrails import GuardrailProcessor, GuardrailConfig
+import asyncio
 import logging
 import os
 
@@ -17,11 +23,30 @@ logger = logging.getLogger(__name__)
 
 config_data = load_yaml_file("config.yaml")
 
+# Guardrails processor shared by every request of the process, see get_guardrails
+shared_guardrails = None
+shared_guardrails_lock = Lock()
+
+# Default guardrails configuration, resolved once: next to this module, then relative
+# to the working directory
+GUARDRAILS_CONFIG_PATH = next((path for path in [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "config/guardrails.yaml"),
+    "config/guardrails.yaml",  # Relative path
+    "src/core/config/guardrails.yaml"  # Another common path
+] if os.path.exists(path)), None)
+
+qa_system_prompt = """You are a concise assistant for question-answering tasks. \
+    Use the following pieces of retrieved context to answer the question. \
+    If you don't know the answer, just say that you don't know. \
+    Provide a very concise answer in no more than three short sentences."""
+
+MAX_NEW_TOKENS = 1000
+
 def initialize_models():
     """Initialize models, tokenizer, vectordb, and guardrails."""
-    model = load_quantized_model(config_data["model_name"])
+    model = load_quantized_model(config_data["model_name"], compile_model=config_data.get("compile_model", False))
     tokenizer = AutoTokenizer.from_pretrained(config_data["model_name"])
-    embeddings = HuggingFaceEmbeddings(model_name=config_data["embedding_model_name"])
+    embeddings = embedding_function()
     
     # Use the correct path for ChromaDB - hardcoded to ensure it works
     chroma_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chromadb")
@@ -35,11 +60,29 @@ def initialize_models():
         embedding_function=embeddings
     )
     
-    # Initialize guardrails with singleton pattern
-    if not hasattr(initialize_models, '_guardrails'):
-        initialize_models._guardrails = initialize_guardrails()
+    # Small collections are searched exactly in memory instead of through HNSW
+    vectordb = in_memory_if_small(
+        vectordb,
+        max_vectors=config_data.get("max_in_memory_vectors", MAX_IN_MEMORY_VECTORS),
+        quantize=config_data.get("vector_dtype", "float32") == "int8"
+    )
     
-    return model, tokenizer, vectordb, initialize_models._guardrails
+    # Prefill the system prompt once so each turn only encodes its context and question;
+    # a compiled model generates with a static cache and prefills the whole prompt instead
+    if not getattr(model, "forward_compiled", False):
+        get_system_prompt_cache(model, tokenizer)
+    
+    return model, tokenizer, vectordb, get_guardrails()
+
+def get_guardrails():
+    """Return the process-wide guardrails processor, initializing it on first use."""
+    global shared_guardrails
+    if shared_guardrails is None:
+        with shared_guardrails_lock:
+            # Checked again under the lock so concurrent first requests initialize it once
+            if shared_guardrails is None:
+                shared_guardrails = initialize_guardrails()
+    return shared_guardrails
 
 def initialize_guardrails(config_path=None):
     """Initialize the guardrails processor with optional custom config path."""
@@ -51,33 +94,90 @@ def initialize_guardrails(config_path=None):
         except FileNotFoundError:
             logger.warning(f"Guardrails config file not found at {config_path}. Using default configuration.")
             config._set_default_config()
+    elif GUARDRAILS_CONFIG_PATH:
+        # Load from the default location found at import
+        config.load_from_file(GUARDRAILS_CONFIG_PATH)
+        logger.info(f"Loaded guardrails configuration from {GUARDRAILS_CONFIG_PATH}")
     else:
-        # Try to load from default locations
-        default_paths = [
-            os.path.join(os.path.dirname(os.path.abspath(__file__)), "config/guardrails.yaml"),
-            "config/guardrails.yaml",  # Relative path
-            "src/core/config/guardrails.yaml"  # Another common path
-        ]
-        
-        config_loaded = False
-        for path in default_paths:
-            try:
-                config.load_from_file(path)
-                logger.info(f"Loaded guardrails configuration from {path}")
-                config_loaded = True
-                break
-            except FileNotFoundError:
-                continue
-        
-        if not config_loaded:
-            logger.warning("No guardrails config file found. Using default configuration.")
-            config._set_default_config()
+        logger.warning("No guardrails config file found. Using default configuration.")
+        config._set_default_config()
     
     logger.info(f"Guardrails initialized with blocked topics: {config.blocked_topics}")
     logger.info(f"Max response length: {config.max_response_length}")
     
     return GuardrailProcessor(config)
 
+def get_system_prompt_cache(model, tokenizer):
+    """
+    Return the token ids and KV cache of the system prompt, computing them on first use.
+
+    The system prompt is the same for every turn, so its attention keys and values
+    are computed once and every generation starts from a copy of them.
+    """
+    cached = getattr(get_system_prompt_cache, '_cache', None)
+    if cached is not None and cached[0] is model:
+        return cached[1], cached[2]
+
+    system_ids = tokenizer(qa_system_prompt, return_tensors="pt").input_ids.to(model.device)
+    system_kv = DynamicCache()
+    with torch.no_grad():
+        model(input_ids=system_ids, past_key_values=system_kv, use_cache=True)
+
+    get_system_prompt_cache._cache = (model, system_ids, system_kv)
+    logger.info(f"Cached system prompt KV for {system_ids.shape[1]} tokens")
+    return system_ids, system_kv
+
+def build_prompt_inputs(model, tokenizer, context, query):
+    """
+    Tokenize a turn's prompt on top of the cached system prompt.
+
+    Only the context and question are tokenized; the returned inputs hold the
+    full prompt ids and a copy of the system prompt cache, so generate prefills
+    just the new tokens. A compiled model instead generates with a static cache,
+    prefilling the whole prompt, as a growing cache would make it recompile. The
+    start of the context is cut if the prompt would not leave room for the answer
+    within the model's maximum length.
+    """
+    compiled = getattr(model, "forward_compiled", False)
+    if compiled:
+        system_ids = tokenizer(qa_system_prompt, return_tensors="pt").input_ids.to(model.device)
+    else:
+        system_ids, system_kv = get_system_prompt_cache(model, tokenizer)
+
+    turn_prompt = f"\n\nContext: {context}\n\nQuestion: {query}\n\nAnswer:"
+    turn_ids = tokenizer(turn_prompt, return_tensors="pt", add_special_tokens=False).input_ids.to(model.device)
+
+    max_length = getattr(model.config, "max_position_embeddings", None)
+    if max_length:
+        budget = max(max_length - system_ids.shape[1] - MAX_NEW_TOKENS, 1)
+        if turn_ids.shape[1] > budget:
+            logger.warning(f"Prompt truncated from {turn_ids.shape[1]} to {budget} tokens")
+            turn_ids = turn_ids[:, -budget:]
+
+    input_ids = torch.cat([system_ids, turn_ids], dim=1)
+    inputs = dict(input_ids=input_ids, attention_mask=torch.ones_like(input_ids), use_cache=True)
+    if compiled:
+        inputs["cache_implementation"] = "static"
+    else:
+        # generate extends the cache in place, so every turn gets its own copy
+        inputs["past_key_values"] = copy.deepcopy(system_kv)
+    return inputs
+
+def get_semantic_cache():
+    """Return the semantic response cache (singleton), or None when it is disabled."""
+    if not hasattr(get_semantic_cache, '_cache'):
+        cache_config = config_data.get("semantic_cache", {})
+        if cache_config.get("enabled", False):
+            cache_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "semantic_cache.db")
+            get_semantic_cache._cache = SemanticCache(
+                cache_path,
+                threshold=cache_config.get("threshold", 0.97),
+                ttl=cache_config.get("ttl", 24 * 3600)
+            )
+        else:
+            get_semantic_cache._cache = None
+    return get_semantic_cache._cache
+
 def retrieve_relevant_context(query, vectordb, top_k=3):
     """Retrieve relevant context from the vector database."""
     try:
@@ -94,56 +194,128 @@ def retrieve_relevant_context(query, vectordb, top_k=3):
         logger.error(f"Error retrieving context: {e}")
         return "Unable to retrieve context from the knowledge base due to an error."
 
-def generate_response(session_id, model, tokenizer, query, vectordb):
-    """Generate a response with guardrails applied."""
-    # Always use the singleton guardrails instance
-    if not hasattr(initialize_models, '_guardrails'):
-        initialize_models._guardrails = initialize_guardrails()
-    guardrails_processor = initialize_models._guardrails
-    
-    # Apply guardrails to the query first
-    should_process, custom_response = guardrails_processor.check_query(query)
-    if not should_process:
-        logger.info(f"Query blocked by guardrails: {query}")
-        conversation_history = get_session_history(session_id)
-        conversation_history.add_user_message(query)
-        conversation_history.add_ai_message(custom_response)
-        return custom_response
+def prepare_turn(session_id, model, tokenizer, query, vectordb):
+    """
+    Do the work that precedes generation: the semantic cache lookup, retrieval and tokenization.
+
+    Returns a (cached_response, query_vec, inputs) tuple; cached_response is set on a
+    cache hit, in which case there is nothing to generate.
+    """
+    # Serve near-duplicate queries of this session from the semantic cache
+    semantic_cache = get_semantic_cache()
+    query_vec = None
+    if semantic_cache is not None and semantic_cache.cacheable(query):
+        query_vec = vectordb.embeddings.embed_query(query)
+        cached_response = semantic_cache.get(session_id, query_vec)
+        if cached_response is not None:
+            return cached_response, query_vec, None
     
-    conversation_history = get_session_history(session_id)
     context = retrieve_relevant_context(query, vectordb)
     logger.info(f"Retrieved context length: {len(context)}")
 
-    qa_system_prompt = """You are a concise assistant for question-answering tasks. \
-    Use the following pieces of retrieved context to answer the question. \
-    If you don't know the answer, just say that you don't know. \
-    Provide a very concise answer in no more than three short sentences."""
+    return None, query_vec, build_prompt_inputs(model, tokenizer, context, query)
+
+class StopOnEvent(StoppingCriteria):
+    """Stops generation once the event is set."""
 
-    full_prompt = f"{qa_system_prompt}\n\nContext: {context}\n\nQuestion: {query}\n\nAnswer:"
+    def __init__(self, event):
+        self.event = event
 
-    inputs = tokenizer(full_prompt, return_tensors="pt", padding=True).to(model.device)
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.event.is_set()
+
+def stream_generation(model, tokenizer, inputs, response_filter):
+    """
+    Generate a response for the tokenized prompt.
+
+    Tokens are fed to the guardrails response filter as they arrive, and generation
+    stops early when the filter is done. Returns the processed response.
+    """
     streamer = TextIteratorStreamer(
         tokenizer, skip_prompt=True, skip_special_tokens=True
     )
+    stop_event = Event()
 
     generation_kwargs = dict(
-        inputs, streamer=streamer, max_new_tokens=1000, do_sample=True, temperature=0.7
+        inputs, streamer=streamer, max_new_tokens=MAX_NEW_TOKENS, do_sample=True, temperature=0.7,
+        stopping_criteria=StoppingCriteriaList([StopOnEvent(stop_event)])
     )
 
     thread = Thread(target=model.generate, kwargs=generation_kwargs)
     thread.start()
 
-    response = ""
-    for token in streamer:
-        response += token
-        print(token, end="", flush=True)
-    print()
+    tokens = [] if logger.isEnabledFor(logging.DEBUG) else None
+    next(response_filter)
+    try:
+        for token in streamer:
+            if tokens is not None:
+                tokens.append(token)
+            response_filter.send(token)
+        response_filter.send(None)
+    except StopIteration as done:
+        processed_response = done.value
+    finally:
+        if tokens is not None:
+            logger.debug(f"Generated response: {''.join(tokens)}")
+        # Stop the model and let the streamer drain if the filter finished early
+        stop_event.set()
+        for _ in streamer:
+            pass
+        thread.join()
+
+    return processed_response
+
+# Preparations of blocked queries, referenced until their threads finish
+discarded_tasks = set()
+
+def discard_task(task):
+    """Let a task finish in the background, logging any exception it raises."""
+    def log_error(done_task):
+        discarded_tasks.discard(done_task)
+        if not done_task.cancelled() and done_task.exception() is not None:
+            logger.error(f"Error in discarded task: {done_task.exception()}")
+    
+    discarded_tasks.add(task)
+    task.add_done_callback(log_error)
+
+async def generate_response(session_id, model, tokenizer, query, vectordb, guardrails_processor=None):
+    """Generate a response with guardrails applied (the process-wide guardrails unless given)."""
+    if guardrails_processor is None:
+        guardrails_processor = get_guardrails()
+    
+    # Retrieval and tokenization do not depend on the guardrails check, so they run alongside it
+    prepare_task = asyncio.create_task(
+        asyncio.to_thread(prepare_turn, session_id, model, tokenizer, query, vectordb)
+    )
+    should_process, custom_response = await asyncio.to_thread(guardrails_processor.check_query, query)
+    
+    conversation_history = get_session_history(session_id)
+    if not should_process:
+        # A running thread cannot be cancelled, so its result is ignored instead
+        discard_task(prepare_task)
+        logger.info(f"Query blocked by guardrails: {query}")
+        conversation_history.add_user_message(query)
+        conversation_history.add_ai_message(custom_response)
+        return custom_response
+    
+    cached_response, query_vec, inputs = await prepare_task
+    if cached_response is not None:
+        logger.info(f"Serving response from semantic cache for query: {query}")
+        conversation_history.add_user_message(query)
+        conversation_history.add_ai_message(cached_response)
+        return cached_response
+    
+    # Generation blocks until the last token, so it runs off the event loop; guardrails
+    # are applied to the response as it streams
+    processed_response = await asyncio.to_thread(
+        stream_generation, model, tokenizer, inputs, guardrails_processor.stream_process(query)
+    )
     
-    # Apply guardrails to the generated response
-    processed_response = guardrails_processor.process_response(query, response)
+    if query_vec is not None:
+        get_semantic_cache().put(session_id, query_vec, processed_response)
     
     # Store the processed response in conversation history
     conversation_history.add_user_message(query)
     conversation_history.add_ai_message(processed_response)
     
-    return processed_response
\ No newline at end of file
+    return processed_response
@@ -1,19 +1,152 @@
+import os
+import hashlib
+import numpy as np
 import torch
 from utils import load_yaml_file
+from transformers import AutoTokenizer
+from langchain_core.embeddings import Embeddings
 from langchain_huggingface import HuggingFaceEmbeddings
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+
+try:
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+except ImportError:  # optimum is optional, embeddings then run on PyTorch
+    onnxruntime = None
+
+try:
+    from blake3 import blake3
+except ImportError:  # blake3 is optional, cache keys then use blake2b
+    blake3 = None
+
+
+class ONNXEmbeddings(Embeddings):
+    """
+    Sentence embeddings computed by ONNX Runtime with an int8-quantized model.
+
+    The Hugging Face model is exported to ONNX and dynamically quantized on first
+    use, then cached on disk so later runs load the quantized model directly.
+    Embeddings are mean-pooled over the tokens and L2-normalized, like the
+    sentence-transformers models this replaces.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str = "onnx_models",
+                 max_length: int = 384, batch_size: int = 32):
+        """
+        :param model_name: Name or path of the Hugging Face model to embed with.
+        :param cache_dir: Directory holding the exported and quantized models.
+        :param max_length: Maximum number of tokens per text, longer texts are truncated.
+        :param batch_size: Number of texts run through the model at once.
+        """
+        self.model_name = model_name
+        self.model_dir = os.path.join(cache_dir, model_name.replace("/", "__"))
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self._tokenizer = None
+        self._session = None
+
+    def _load(self):
+        """Load the quantized model, exporting and quantizing it first if needed."""
+        quantized_path = os.path.join(self.model_dir, "model_quantized.onnx")
+        if not os.path.exists(quantized_path):
+            model = ORTModelForFeatureExtraction.from_pretrained(
+                self.model_name, export=True, provider="CPUExecutionProvider"
+            )
+            model.save_pretrained(self.model_dir)
+            AutoTokenizer.from_pretrained(self.model_name).save_pretrained(self.model_dir)
+
+            # Dynamic quantization: int8 weights, activations quantized on the fly
+            quantizer = ORTQuantizer.from_pretrained(self.model_dir)
+            quantizer.quantize(
+                save_dir=self.model_dir,
+                quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False),
+            )
+
+        self._tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+        self._session = onnxruntime.InferenceSession(quantized_path, providers=["CPUExecutionProvider"])
+        self._input_names = {model_input.name for model_input in self._session.get_inputs()}
+
+    def embed_documents(self, texts):
+        """
+        :param texts: The texts to embed.
+        :return: One embedding per text.
+        """
+        if self._session is None:
+            self._load()
+
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            tokens = self._tokenizer(
+                texts[start:start + self.batch_size], padding=True, truncation=True,
+                max_length=self.max_length, return_tensors="np"
+            )
+            feed = {name: tokens[name].astype(np.int64) for name in self._input_names if name in tokens}
+            hidden_states = self._session.run(None, feed)[0]
+
+            # Mean pooling over the real (non-padding) tokens, then L2 normalization
+            mask = tokens["attention_mask"][..., np.newaxis].astype(np.float32)
+            pooled = (hidden_states * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            embeddings.extend(pooled.tolist())
+
+        return embeddings
+
+    def embed_query(self, text):
+        """
+        :param text: The query to embed.
+        :return: The query embedding.
+        """
+        return self.embed_documents([text])[0]
+
+
+def content_key(text: str) -> str:
+    """
+    :param text: The text to embed.
+    :return: Hex digest of the text, used as its embedding cache key.
+    """
+    if blake3 is not None:
+        return blake3(text.encode("utf-8")).hexdigest()
+    return hashlib.blake2b(text.encode("utf-8")).hexdigest()
+
+
+def cache_backed(underlying: Embeddings, model_name: str, backend: str) -> Embeddings:
+    """
+    Wrap embeddings in a persistent cache keyed on the content of each document.
+
+    Unchanged chunks are not re-embedded when the documents are indexed again; only
+    cache misses reach the model. Queries are embedded directly.
+
+    :param underlying: The embeddings computing the vectors.
+    :param model_name: Name of the embedding model, namespacing the cache.
+    :param backend: Embedding backend, namespacing the cache.
+    :return: The cache-backed embeddings.
+    """
+    store = LocalFileStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache"))
+    namespace = f"{backend}__{model_name.replace('/', '__')}/"
+    return CacheBackedEmbeddings.from_bytes_store(
+        underlying, store, key_encoder=lambda text: namespace + content_key(text)
+    )
 
 
 def embedding_function():
     config_data = load_yaml_file("config.yaml")
+    model_name = config_data["embedding_model_name"]
 
-    # Force CPU usage to avoid CUDA out of memory errors
-    device = torch.device("cpu")
+    # The quantized ONNX model is opt-in: its vectors differ from those of an index built with PyTorch
+    if config_data.get("embedding_backend", "huggingface") == "onnx" and onnxruntime is not None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx_models")
+        return cache_backed(ONNXEmbeddings(model_name, cache_dir=cache_dir), model_name, "onnx")
+
+    # Use the GPU when there is one; EMBED_DEVICE=cpu avoids CUDA out of memory errors
+    device = torch.device(os.environ.get("EMBED_DEVICE", "cuda" if torch.cuda.is_available() else "cpu"))
 
-    model_name = config_data["embedding_model_name"]
     model_kwargs = {"device": device}
-    encode_kwargs = {"normalize_embeddings": False}
+    # Unit-length vectors, so inner product equals cosine similarity
+    encode_kwargs = {"normalize_embeddings": True, "batch_size": 64}
     embeddings = HuggingFaceEmbeddings(
         model_name=model_name, model_kwargs=model_kwargs, encode_kwargs=encode_kwargs
     )
 
-    return embeddings
+    return cache_backed(embeddings, model_name, "huggingface_normalized")
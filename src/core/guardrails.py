@@ -3,17 +3,178 @@ Guardrails for controlling LLM output in the AIFAQ system.
 Enhanced with semantic understanding and more robust filtering.
 """
 import re
+import hashlib
 import logging
-from typing import Dict, List, Optional, Tuple, Set
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, Generator, List, Optional, Tuple, Set
+
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick is optional, fall back to substring scans
+    ahocorasick = None
+
+try:
+    import hyperscan
+except ImportError:  # hyperscan is optional, every regex then scans every response
+    hyperscan = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Number of distinct queries whose check results each processor remembers
+QUERY_CACHE_SIZE = 4096
+
+# Number of processed responses each processor remembers, keyed by a hash of query and response
+RESPONSE_CACHE_SIZE = 1024
+
+# Words of a query
+WORD_RE = re.compile(r'\b\w+\b')
+
+# Query terms blocked together as cryptocurrency trading: one of each group
+CRYPTO_TERMS = ("bitcoin", "crypto", "mining")
+CRYPTO_TRADING_TERMS = ("profit", "trading", "exchange", "invest")
+
+# Terms that earn a response the disclaimer of their category (checked in this order)
+DISCLAIMER_TERMS = {
+    "security": ("security", "secure", "protection", "safety", "privacy", "firewall", "encrypt",
+                 "authentication", "password", "credential", "access control"),
+    "blockchain": ("blockchain", "hyperledger", "distributed ledger", "smart contract",
+                   "consensus", "chaincode", "fabric"),
+    "technical": ("implement", "deploy", "install", "configure", "setup", "integration", "docker")
+}
+
+# Sensitive information redacted from every response
+SENSITIVE_PATTERNS = {
+    "credit_card": r'\b\d{4}[- ]?\d{4}[- ]?\d{4}[- ]?\d{4}\b',
+    "ssn": r'\b\d{3}[- ]?\d{2}[- ]?\d{4}\b',
+    "ip_address": r'\b(?:\d{1,3}\.){3}\d{1,3}\b',
+    "email": r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
+}
+
+# Characters re matches with \s but hyperscan does not
+ASCII_SEPARATORS_RE = re.compile(r'[\x1c-\x1f]')
+
+# All sensitive patterns as one alternation, so a response is scanned once
+SENSITIVE_RE = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in SENSITIVE_PATTERNS.items()))
+
+# A leading or trailing unbounded wildcard, after any inline flags, of a pattern used with search
+LEADING_WILDCARD_RE = re.compile(r'^((?:\(\?[a-zA-Z]+\))*)\.\*(?![?+*{])')
+TRAILING_WILDCARD_RE = re.compile(r'(?<!\\)((?:\\\\)*)\.\*$')
+
+
+def strip_wildcards(pattern: str) -> str:
+    """
+    Drop a leading and trailing .* from a pattern that is only used with search.
+    
+    They do not change whether search finds a match, but a leading .* makes the
+    regex engine rescan the rest of the line from every starting position.
+    """
+    pattern = LEADING_WILDCARD_RE.sub(r'\1', pattern, count=1)
+    return TRAILING_WILDCARD_RE.sub(r'\1', pattern, count=1)
+
+
+def is_word_char(text: str, index: int) -> bool:
+    """Whether the character at index is a regex word character (False outside the text)."""
+    if index < 0 or index >= len(text):
+        return False
+    char = text[index]
+    return char.isalnum() or char == "_"
+
+
+def build_category_matcher(category_terms: Dict[str, Tuple[str, ...]]) -> Callable[[str], Set[str]]:
+    """
+    Build a function returning the categories with at least one term in a lowercased text.
+    
+    Uses a single Aho-Corasick automaton over the terms of all categories when
+    pyahocorasick is installed, so each text is scanned once.
+    """
+    if ahocorasick is None:
+        return lambda text: {category for category, terms in category_terms.items()
+                             if any(term in text for term in terms)}
+    
+    automaton = ahocorasick.Automaton()
+    for category, terms in category_terms.items():
+        for term in terms:
+            if automaton.exists(term):
+                automaton.get(term).add(category)
+            else:
+                automaton.add_word(term, {category})
+    automaton.make_automaton()
+    return lambda text: {category for _, categories in automaton.iter(text) for category in categories}
+
+
+disclaimer_categories = build_category_matcher(DISCLAIMER_TERMS)
+
+# Characters of a streamed response kept to find disclaimer terms split between chunks
+DISCLAIMER_TERM_OVERLAP = max(len(term) for terms in DISCLAIMER_TERMS.values() for term in terms) - 1
+
+
+def build_prefilter(patterns: List[str], caseless: bool = False) -> Optional[Callable[[str], bool]]:
+    """
+    Build a function telling whether any of several regexes may match a text.
+    
+    The patterns are compiled into one Hyperscan database in prefilter mode, which
+    may report matches the regexes would not make but never misses one, so a text
+    it rejects can skip the regexes entirely after a single scan. Only ASCII texts
+    are scanned, as hyperscan's Unicode tables differ from re's; others always may
+    match. Returns None when hyperscan is not installed or cannot compile the patterns.
+    """
+    if hyperscan is None or not patterns:
+        return None
+    
+    flags = hyperscan.HS_FLAG_PREFILTER | hyperscan.HS_FLAG_SINGLEMATCH
+    if caseless:
+        flags |= hyperscan.HS_FLAG_CASELESS
+    database = hyperscan.Database()
+    try:
+        database.compile(expressions=[pattern.encode("utf-8") for pattern in patterns],
+                         ids=list(range(len(patterns))), flags=[flags] * len(patterns))
+    except hyperscan.error as e:
+        logger.warning(f"Could not compile patterns with hyperscan, scanning with re only: {e}")
+        return None
+    
+    # Scratch space must not be shared between threads scanning at the same time
+    local = threading.local()
+    
+    def may_match(text: str) -> bool:
+        # Unlike hyperscan, re counts the ASCII separators \x1c-\x1f as whitespace
+        if not text.isascii() or ASCII_SEPARATORS_RE.search(text):
+            return True
+        
+        scratch = getattr(local, "scratch", None)
+        if scratch is None:
+            scratch = local.scratch = hyperscan.Scratch(database)
+        matched = []
+        
+        def on_match(*_) -> bool:
+            matched.append(True)
+            return True  # Stop at the first match
+        
+        try:
+            database.scan(text.encode("ascii"), match_event_handler=on_match, scratch=scratch)
+        except hyperscan.ScanTerminated:
+            pass
+        except hyperscan.error as e:
+            logger.warning(f"Hyperscan scan failed, scanning with re: {e}")
+            return True
+        return bool(matched)
+    
+    return may_match
+
+
+sensitive_prefilter = build_prefilter(list(SENSITIVE_PATTERNS.values()))
+
+
 class GuardrailConfig:
     """Configuration for LLM output guardrails."""
     
     def __init__(self):
+        # Bumped whenever the patterns are compiled, so cached check results expire
+        self.version: int = 0
+        
         # Primary topics to block
         self.blocked_topics: List[str] = []
         
@@ -37,6 +198,69 @@ class GuardrailConfig:
         
         # Additional semantic rules
         self.high_risk_combinations: List[List[str]] = []
+        
+        self.compile_patterns()
+    
+    def compile_patterns(self) -> None:
+        """
+        Compile the configured patterns once, so checks call the compiled patterns directly.
+        
+        Called whenever the configuration is loaded; call it again after assigning
+        patterns or terms directly.
+        """
+        self.version += 1
+        self._custom_responses_compiled = [
+            (re.compile(strip_wildcards(pattern), re.IGNORECASE), response)
+            for pattern, response in self.custom_responses.items()
+        ]
+        # Filtered patterns are substituted, so their wildcards are part of the match
+        self._filtered_patterns_compiled = [
+            re.compile(pattern, re.IGNORECASE) for pattern in self.filtered_patterns
+        ]
+        self._filtered_patterns_prefilter = build_prefilter(self.filtered_patterns, caseless=True)
+        
+        # Every term the query checks look for, with the (kind, key, index) tags of
+        # the checks it belongs to. Related terms only count as whole words, so the
+        # single-word ones are looked up in the set of query words; all other terms
+        # match anywhere in the query ("invest" in "reinvesting") and are searched for
+        self._word_term_tags: Dict[str, List[Tuple[str, int, int]]] = {}
+        self._substring_term_tags: Dict[str, List[Tuple[str, int, int]]] = {}
+        tagged_terms = [(topic, ("topic", 0, i)) for i, topic in enumerate(self.blocked_topics)]
+        tagged_terms += [(term, ("crypto", 0, i)) for i, term in enumerate(CRYPTO_TERMS)]
+        tagged_terms += [(term, ("crypto", 1, i)) for i, term in enumerate(CRYPTO_TRADING_TERMS)]
+        for topic_index, terms in enumerate(self.topic_related_terms.values()):
+            tagged_terms += [(term, ("related", topic_index, i)) for i, term in enumerate(terms)]
+        
+        # High-risk combinations as bitmasks over the bits of their terms, with the
+        # number of distinct terms each combination has
+        self._combination_bits: Dict[str, int] = {}
+        for combination in self.high_risk_combinations:
+            for term in combination:
+                if term:
+                    self._combination_bits.setdefault(term.lower(), len(self._combination_bits))
+        self._combination_masks: List[Tuple[int, int]] = [
+            (sum(1 << self._combination_bits[term] for term in {term.lower() for term in combination if term}),
+             len({term.lower() for term in combination}))
+            for combination in self.high_risk_combinations
+        ]
+        tagged_terms += [(term, ("combination", 0, bit)) for term, bit in self._combination_bits.items()]
+        
+        for term, tag in tagged_terms:
+            term = term.lower()
+            if not term:
+                continue
+            if tag[0] == "related" and WORD_RE.fullmatch(term):
+                term_tags = self._word_term_tags
+            else:
+                term_tags = self._substring_term_tags
+            term_tags.setdefault(term, []).append(tag)
+        
+        self._substring_automaton = None
+        if ahocorasick is not None and self._substring_term_tags:
+            self._substring_automaton = ahocorasick.Automaton()
+            for term, tags in self._substring_term_tags.items():
+                self._substring_automaton.add_word(term, (term, tags))
+            self._substring_automaton.make_automaton()
     
     def load_from_file(self, filepath: str) -> None:
         """Load guardrail configuration from a YAML file."""
@@ -62,6 +286,8 @@ class GuardrailConfig:
             if 'high_risk_combinations' in config:
                 self.high_risk_combinations = config['high_risk_combinations']
             
+            self.compile_patterns()
+            
             logger.info(f"Loaded guardrails config with {len(self.blocked_topics)} blocked topics")
             logger.info(f"Loaded {len(self.topic_related_terms)} topic term relations")
         except Exception as e:
@@ -130,16 +356,16 @@ class GuardrailConfig:
         
         # Enhanced custom responses with better patterns
         self.custom_responses = {
-            r"(?i).*\b(?:how|can|ways?|method|technique|steps?)\s+(?:to|for|of)?\s*(?:hack|exploit|break|bypass|compromise).*": 
+            r"(?i)\b(?:how|can|ways?|method|technique|steps?)\s+(?:to|for|of)?\s*(?:hack|exploit|break|bypass|compromise)": 
                 "I cannot provide information about hacking, exploiting vulnerabilities, or unauthorized system access. Instead, I recommend exploring secure development practices and ethical cybersecurity resources if you're interested in security topics.",
             
-            r"(?i).*(?:what|recommend|suggest|tell\s+me|give\s+me).*\b(?:password|credentials).*": 
+            r"(?i)(?:what|recommend|suggest|tell\s+me|give\s+me).*\b(?:password|credentials)": 
                 "For security reasons, I cannot provide specific password recommendations or discuss credential management specifics. Please refer to your organization's security policies or consult trusted security frameworks like NIST for best practices on credential management.",
             
-            r"(?i).*(?:how|ways?|method|steps?)\s+(?:to|for|of)?\s*(?:avoid|bypass|trick|fool|get\s+around|circumvent)\s+(?:detection|security|authentication|verification|validation).*":
+            r"(?i)(?:how|ways?|method|steps?)\s+(?:to|for|of)?\s*(?:avoid|bypass|trick|fool|get\s+around|circumvent)\s+(?:detection|security|authentication|verification|validation)":
                 "I cannot provide information on bypassing security measures or authentication systems. This kind of activity could be illegal and unethical. Instead, I'd be happy to discuss proper security implementation or legitimate troubleshooting approaches.",
             
-            r"(?i).*(?:how|can|ways?)\s+(?:to|for|of)?\s*(?:steal|obtain|get|extract)\s+(?:data|information|credentials|password|key).*":
+            r"(?i)(?:how|can|ways?)\s+(?:to|for|of)?\s*(?:steal|obtain|get|extract)\s+(?:data|information|credentials|password|key)":
                 "I cannot provide guidance on extracting data or credentials without authorization. Such activities are potentially illegal and unethical. I can instead discuss proper data access methods, API usage, or legitimate data integration approaches."
         }
         
@@ -163,6 +389,8 @@ class GuardrailConfig:
             ["mine", "bitcoin", "profit"],
             ["trade", "exchange", "crypto"]
         ]
+        
+        self.compile_patterns()
 
 
 class GuardrailProcessor:
@@ -170,12 +398,20 @@ class GuardrailProcessor:
     
     def __init__(self, config: Optional[GuardrailConfig] = None):
         self.config = config or GuardrailConfig()
+        # Pick up patterns assigned to the config after it was loaded
+        self.config.compile_patterns()
+        self._check_query_cached = lru_cache(maxsize=QUERY_CACHE_SIZE)(self._check_normalized_query)
+        self._response_cache: "OrderedDict[Tuple[int, bytes], str]" = OrderedDict()
+        self._response_cache_lock = threading.Lock()
     
     def check_query(self, query: str) -> Tuple[bool, Optional[str]]:
         """
         Check if a query should be processed normally or requires a custom response.
         Enhanced with semantic understanding of topic relationships.
         
+        Results are cached per normalized query (lowercased, whitespace collapsed)
+        until the configuration is compiled again.
+        
         Args:
             query: The user query to check
             
@@ -184,53 +420,114 @@ class GuardrailProcessor:
             - should_process: True if the query should be processed normally
             - custom_response: Custom response to return (if should_process is False)
         """
-        query_lower = query.lower()
-        query_words = set(re.findall(r'\b\w+\b', query_lower))
+        normalized_query = " ".join(query.lower().split())
+        return self._check_query_cached(normalized_query, self.config.version)
+    
+    def _check_normalized_query(self, query_lower: str, config_version: int) -> Tuple[bool, Optional[str]]:
+        """
+        Check a normalized query; config_version only keys the result cache.
+        """
+        query_words = set(WORD_RE.findall(query_lower))
         
         # Check for custom responses first - most specific checks
-        for pattern, response in self.config.custom_responses.items():
-            if re.search(pattern, query, re.IGNORECASE):
-                logger.info(f"Custom response triggered for pattern: {pattern}")
+        for pattern, response in self.config._custom_responses_compiled:
+            if pattern.search(query_lower):
+                logger.info(f"Custom response triggered for pattern: {pattern.pattern}")
                 return False, response
         
+        # Find every configured term in one pass over the query, then apply the
+        # checks below in their order of priority
+        hits = self._find_terms(query_lower, query_words)
+        
         # Check for blocked topics - direct matches
-        for topic in self.config.blocked_topics:
-            if topic.lower() in query_lower:
-                logger.info(f"Query blocked due to topic: {topic}")
-                return False, f"I'm sorry, but I cannot provide information about {topic}."
+        topic_hits = hits.get(("topic", 0))
+        if topic_hits:
+            topic = self.config.blocked_topics[min(topic_hits)]
+            logger.info(f"Query blocked due to topic: {topic}")
+            return False, f"I'm sorry, but I cannot provide information about {topic}."
         
         # Check for cryptocurrency related terms - special case since this was failing
-        if "bitcoin" in query_lower or "crypto" in query_lower or "mining" in query_lower:
-            if any(term in query_lower for term in ["profit", "trading", "exchange", "invest"]):
+        if ("crypto", 0) in hits:
+            if ("crypto", 1) in hits:
                 logger.info(f"Query blocked due to cryptocurrency terms")
                 return False, f"I'm sorry, but I cannot provide information about cryptocurrency trading or investments."
         
         # Check for semantic matches using related terms
-        for topic, related_terms in self.config.topic_related_terms.items():
-            matched_terms = []
-            for term in related_terms:
-                # Check if the term appears as a word or phrase
-                if re.search(r'\b' + re.escape(term.lower()) + r'\b', query_lower):
-                    matched_terms.append(term)
+        for topic_index, (topic, related_terms) in enumerate(self.config.topic_related_terms.items()):
+            matched_terms = [related_terms[i] for i in sorted(hits.get(("related", topic_index), ()))]
             
             # If we have 2 or more matched terms, consider it a match
             if len(matched_terms) >= 2:
                 logger.info(f"Query blocked due to semantic match ({len(matched_terms)} terms) for topic {topic}: {matched_terms}")
                 return False, f"I'm sorry, but I cannot provide information about topics related to {topic}."
         
-        # Check for high-risk term combinations
-        for combination in self.config.high_risk_combinations:
-            matching_terms = [term for term in combination if term in query_lower]
-            if len(matching_terms) >= len(combination) - 1:  # Match if all but one term is present
+        # Check for high-risk term combinations, with the terms present as a bitmask
+        present = sum(1 << bit for bit in hits.get(("combination", 0), ()))
+        for combination_index, (mask, term_count) in enumerate(self.config._combination_masks):
+            if (present & mask).bit_count() >= term_count - 1:  # Match if all but one term is present
+                combination = self.config.high_risk_combinations[combination_index]
+                matching_terms = [term for term in combination
+                                  if term and present >> self.config._combination_bits[term.lower()] & 1]
                 logger.info(f"Query blocked due to high-risk combination: {matching_terms}")
                 return False, "I cannot provide information on this topic as it appears to be requesting potentially harmful guidance."
         
         return True, None
     
+    def _find_terms(self, text: str, words: Set[str]) -> Dict[Tuple[str, int], Set[int]]:
+        """
+        Find the configured query terms occurring in a text.
+        
+        Single-word related terms are set lookups in the words of the text. All other
+        terms are found with a single Aho-Corasick automaton when pyahocorasick is
+        installed, and substring scans otherwise; related phrases among them are then
+        checked for word boundaries.
+        
+        Args:
+            text: The lowercased query
+            words: The words of the text
+            
+        Returns:
+            The indices of the terms found, by (kind, key) of the check they belong to
+        """
+        hits: Dict[Tuple[str, int], Set[int]] = {}
+        for word in words & self.config._word_term_tags.keys():
+            for kind, key, index in self.config._word_term_tags[word]:
+                hits.setdefault((kind, key), set()).add(index)
+        
+        if self.config._substring_automaton is not None:
+            occurrences = self.config._substring_automaton.iter(text)
+        else:
+            occurrences = self._scan_substrings(text)
+        
+        for end, (term, tags) in occurrences:
+            start = end - len(term) + 1
+            whole_word = None
+            for kind, key, index in tags:
+                if kind == "related":
+                    # Same as the regex \bterm\b: a word boundary on both sides
+                    if whole_word is None:
+                        whole_word = (is_word_char(text, start - 1) != is_word_char(text, start)
+                                      and is_word_char(text, end) != is_word_char(text, end + 1))
+                    if not whole_word:
+                        continue
+                hits.setdefault((kind, key), set()).add(index)
+        return hits
+    
+    def _scan_substrings(self, text: str):
+        """Yield (end index, (term, tags)) for every occurrence of a searched term, without pyahocorasick."""
+        for term, tags in self.config._substring_term_tags.items():
+            start = text.find(term)
+            while start != -1:
+                yield start + len(term) - 1, (term, tags)
+                start = text.find(term, start + 1)
+    
     def process_response(self, query: str, response: str) -> str:
         """
         Apply guardrails to an LLM-generated response with enhanced filtering.
         
+        Results are cached by a hash of the query and response until the
+        configuration is compiled again, so repeated responses skip the filters.
+        
         Args:
             query: The user query that generated the response
             response: The raw LLM response
@@ -238,27 +535,53 @@ class GuardrailProcessor:
         Returns:
             The processed response with guardrails applied
         """
+        digest = hashlib.blake2b(query.encode("utf-8", "surrogatepass") + b"\0"
+                                 + response.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        key = (self.config.version, digest)
+        with self._response_cache_lock:
+            processed = self._response_cache.get(key)
+            if processed is not None:
+                self._response_cache.move_to_end(key)
+                return processed
+        
+        processed = self._process_response(query, response)
+        
+        with self._response_cache_lock:
+            self._response_cache[key] = processed
+            while len(self._response_cache) > RESPONSE_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
+        return processed
+    
+    def _process_response(self, query: str, response: str, categories: Optional[Set[str]] = None) -> str:
+        """
+        Apply guardrails to a response, without the cache; categories are the disclaimer
+        categories of the query and response when already known.
+        """
         processed = response
-        query_lower = query.lower()
-        combined_text = query_lower + " " + processed.lower()
         
         # Apply length limit
         if len(processed) > self.config.max_response_length:
             processed = processed[:self.config.max_response_length] + "... [Response truncated]"
             logger.info(f"Response truncated to {self.config.max_response_length} characters")
         
-        # Apply pattern filters
-        for pattern in self.config.filtered_patterns:
-            original_length = len(processed)
-            processed = re.sub(pattern, "[FILTERED]", processed, flags=re.IGNORECASE)
-            if len(processed) != original_length:
-                logger.info(f"Pattern filter applied: {pattern}")
+        # Apply pattern filters, unless a single hyperscan pass rules them all out
+        prefilter = self.config._filtered_patterns_prefilter
+        if prefilter is None or prefilter(processed):
+            for pattern in self.config._filtered_patterns_compiled:
+                original_length = len(processed)
+                processed = pattern.sub("[FILTERED]", processed)
+                if len(processed) != original_length:
+                    logger.info(f"Pattern filter applied: {pattern.pattern}")
+        
+        # Categories of disclaimer terms in the query and the raw response; the response
+        # need not be scanned once the query earns the security disclaimer, checked first
+        if categories is None:
+            categories = disclaimer_categories(query.lower())
+            if "security" not in categories:
+                categories |= disclaimer_categories(response.lower())
         
         # Add security disclaimer for security-related content
-        security_terms = ["security", "secure", "protection", "safety", "privacy", "firewall", "encrypt", 
-                         "authentication", "password", "credential", "access control"]
-        
-        if any(term in combined_text for term in security_terms):
+        if "security" in categories:
             if not processed.endswith('\n'):
                 processed += '\n'
             processed += self.config.disclaimers.get("security", "")
@@ -266,10 +589,7 @@ class GuardrailProcessor:
             return processed
         
         # Add blockchain disclaimer for blockchain-related content
-        blockchain_terms = ["blockchain", "hyperledger", "distributed ledger", "smart contract", 
-                           "consensus", "chaincode", "fabric"]
-        
-        if any(term in combined_text for term in blockchain_terms):
+        if "blockchain" in categories:
             if not processed.endswith('\n'):
                 processed += '\n'
             processed += self.config.disclaimers.get("blockchain", "")
@@ -277,28 +597,66 @@ class GuardrailProcessor:
             return processed
         
         # Add technical disclaimer for implementation-related content
-        technical_terms = ["implement", "deploy", "install", "configure", "setup", "integration", "docker"]
-        
-        if any(term in combined_text for term in technical_terms):
+        if "technical" in categories:
             if not processed.endswith('\n'):
                 processed += '\n'
             processed += self.config.disclaimers.get("technical", "")
             logger.info("Added technical disclaimer to response")
         
         # Post-filtering check for sensitive information that might have slipped through
-        sensitive_patterns = [
-            r'\b\d{4}[- ]?\d{4}[- ]?\d{4}[- ]?\d{4}\b',  # Credit card format
-            r'\b\d{3}[- ]?\d{2}[- ]?\d{4}\b',  # SSN format
-            r'\b(?:\d{1,3}\.){3}\d{1,3}\b',  # IP address format
-            r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'  # Email format
-        ]
+        redacted_kinds = set()
+        
+        def redact(match: re.Match) -> str:
+            redacted_kinds.add(match.lastgroup)
+            return "[REDACTED]"
         
-        for pattern in sensitive_patterns:
-            if re.search(pattern, processed):
-                processed = re.sub(pattern, "[REDACTED]", processed)
-                logger.info(f"Redacted potentially sensitive information matching pattern {pattern}")
+        if sensitive_prefilter is None or sensitive_prefilter(processed):
+            processed = SENSITIVE_RE.sub(redact, processed)
+        if redacted_kinds:
+            logger.info(f"Redacted potentially sensitive information: {', '.join(sorted(redacted_kinds))}")
         
         return processed
+    
+    def stream_process(self, query: str) -> Generator[None, Optional[str], str]:
+        """
+        Apply guardrails to a response while it is being generated.
+        
+        Returns a generator to prime with next() and then send the response tokens to;
+        sending None marks the end of the response. Each token is scanned for disclaimer
+        terms as it arrives, and the generator stops as soon as the response exceeds the
+        maximum length, so generation can be cut short. Pattern filters and redaction,
+        which may span tokens, run on the truncated response at the end; the generator's
+        StopIteration carries the processed response.
+        
+        Args:
+            query: The user query that generated the response
+            
+        Returns:
+            The filter generator
+        """
+        chunks = []
+        length = 0
+        categories = disclaimer_categories(query.lower())
+        # The end of the response so far, to find terms split between tokens
+        tail = ""
+        while True:
+            token = yield
+            if token is None:
+                break
+            chunks.append(token)
+            length += len(token)
+            
+            # Security, checked first, makes the other categories irrelevant
+            if "security" not in categories:
+                window = tail + token.lower()
+                categories |= disclaimer_categories(window)
+                tail = window[-DISCLAIMER_TERM_OVERLAP:]
+            
+            if length > self.config.max_response_length:
+                logger.info(f"Response exceeded {self.config.max_response_length} characters, stopping generation")
+                break
+        
+        return self._process_response(query, "".join(chunks), categories)
 
 
 # Default instance for easy import
@@ -43,6 +43,7 @@ for i in range(0, len(splits), batch_size):
         if i == 0:
             # Create vectorstore with first batch
             print("Creating new vectorstore...")
+            # Embeddings are normalized, so Chroma's default l2 space ranks like cosine
             vectorstore = Chroma.from_documents(
                 filter_complex_metadata(batch), embeddings, persist_directory=persist_directory
             )
@@ -2,20 +2,42 @@ import torch
 from transformers import BitsAndBytesConfig, AutoModelForCausalLM
 
 
-# function for loading 4-bit quantized model
-def load_quantized_model(model_name: str):
+# function for loading 4-bit (or 8-bit) quantized model
+def load_quantized_model(model_name: str, bits: int = 4, compile_model: bool = False):
     """
     :param model_name: Name or path of the model to be loaded.
+    :param bits: Weight precision, 4 (NF4 with double quantization) or 8 (LLM.int8).
+        The 8-bit kernels need a GPU with compute capability 7.5 or newer.
+    :param compile_model: Compile the forward pass with torch.compile (CUDA graphs),
+        at the cost of a slow first generation while the graphs are captured. The model
+        is then marked with forward_compiled, and callers must generate with a static
+        KV cache so the compiled graphs are reused.
     :return: Loaded quantized model.
     """
-    bnb_config = BitsAndBytesConfig(
-        load_in_4bit=True,
-        bnb_4bit_use_double_quant=True,
-        bnb_4bit_quant_type="nf4",
-        bnb_4bit_compute_dtype=torch.bfloat16,
-    )
+    # Allow TF32 tensor cores for the float32 matmuls left after quantization
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.set_float32_matmul_precision("high")
+
+    if bits == 4:
+        bnb_config = BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_use_double_quant=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_compute_dtype=torch.bfloat16,
+        )
+    elif bits == 8:
+        bnb_config = BitsAndBytesConfig(load_in_8bit=True)
+    else:
+        raise ValueError(f"Unsupported quantization: {bits} bits (expected 4 or 8)")
 
     model = AutoModelForCausalLM.from_pretrained(
-        model_name, torch_dtype=torch.bfloat16, quantization_config=bnb_config
+        model_name, torch_dtype=torch.bfloat16, quantization_config=bnb_config,
+        # Fused scaled dot-product attention (FlashAttention kernels where supported)
+        attn_implementation="sdpa"
     )
+
+    if compile_model:
+        # generate calls the forward pass once per token, so that is what gets compiled
+        model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=False)
+    model.forward_compiled = compile_model
     return model
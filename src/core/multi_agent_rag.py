@@ -5,6 +5,7 @@ from langchain_community.vectorstores import Chroma
 
 from agents import (
     AgentCoordinator,
+    PipelineProcessor,
     QueryUnderstandingAgent,
     RetrievalAgent,
     ContextIntegrationAgent,
@@ -22,7 +23,8 @@ class MultiAgentRAG:
     generating responses to user queries.
     """
     
-    def __init__(self, model, tokenizer, vectordb: Chroma, session_history: Optional[List[Dict]] = None):
+    def __init__(self, model, tokenizer, vectordb: Chroma, session_history: Optional[List[Dict]] = None,
+                 batch_size: int = 1, reranker_model: Optional[str] = None):
         """
         Initialize the multi-agent RAG system.
         
@@ -31,6 +33,9 @@ class MultiAgentRAG:
             tokenizer: The tokenizer for the language model
             vectordb: The vector database for document retrieval
             session_history: Optional conversation history
+            batch_size: Maximum number of concurrent queries batched through the
+                pipeline together (1 runs every query on its own)
+            reranker_model: Cross-encoder reranking the retrieved documents (None disables reranking)
         """
         self.model = model
         self.tokenizer = tokenizer
@@ -39,7 +44,7 @@ class MultiAgentRAG:
         
         # Initialize the agents
         self.query_agent = QueryUnderstandingAgent()
-        self.retrieval_agent = RetrievalAgent(vectordb)
+        self.retrieval_agent = RetrievalAgent(vectordb, reranker_model=reranker_model)
         self.context_agent = ContextIntegrationAgent()
         self.response_agent = ResponseGenerationAgent(model, tokenizer)
         self.evaluation_agent = EvaluationAgent()
@@ -53,6 +58,14 @@ class MultiAgentRAG:
             self.evaluation_agent
         ])
         
+        # Batch concurrent queries when requested
+        self.processor = PipelineProcessor(self.coordinator, batch_size=batch_size) if batch_size > 1 else None
+        
+    async def close(self) -> None:
+        """Wait for batched queries still in flight to finish."""
+        if self.processor is not None:
+            await self.processor.close()
+        
     async def generate_response(self, query: str, session_id: str) -> Dict[str, Any]:
         """
         Generate a response to a user query using the multi-agent system.
@@ -72,7 +85,10 @@ class MultiAgentRAG:
         }
         
         # Run the multi-agent pipeline
-        result = await self.coordinator.run_pipeline(initial_input)
+        if self.processor is not None:
+            result = await self.processor.submit(initial_input)
+        else:
+            result = await self.coordinator.run_pipeline(initial_input)
         
         # Extract the final response
         response = result.get("response", "")
@@ -101,6 +117,6 @@ class MultiAgentRAG:
 
 
 # Factory function to create a MultiAgentRAG instance
-def create_multi_agent_rag(model, tokenizer, vectordb, session_history=None):
+def create_multi_agent_rag(model, tokenizer, vectordb, session_history=None, batch_size=1, reranker_model=None):
     """Create a MultiAgentRAG instance."""
-    return MultiAgentRAG(model, tokenizer, vectordb, session_history)
+    return MultiAgentRAG(model, tokenizer, vectordb, session_history, batch_size, reranker_model)
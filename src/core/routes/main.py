@@ -1,8 +1,7 @@
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 import uuid
-from conversation import initialize_models, generate_response, initialize_guardrails
-from multi_agent_rag import create_multi_agent_rag
+from conversation import generate_response
 from guardrails import GuardrailProcessor, GuardrailConfig
 import asyncio
 import logging
@@ -11,12 +10,8 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize models and guardrails
-model, tokenizer, vectordb, guardrails_processor = initialize_models()  # Changed here to unpack 4 values
-# Initialize the multi-agent RAG system
-multi_agent_system = create_multi_agent_rag(model, tokenizer, vectordb)
-# No need to initialize guardrails separately, we now get it from initialize_models()
-# guardrails_processor = initialize_guardrails()  # Comment out or remove this line
+# Models, guardrails and the multi-agent RAG system are loaded once at startup
+# (see the lifespan handler in api.py) and shared through app.state
 
 router = APIRouter()
 
@@ -42,24 +37,14 @@ class DetailedResponseQuery(ResponseQuery):
 
 
 @router.post("/query", response_model=ResponseQuery)
-async def answer_query(item: RequestQuery) -> ResponseQuery:
+async def answer_query(item: RequestQuery, request: Request) -> ResponseQuery:
+    state = request.app.state
     try:
-        # Apply guardrails to the query first
-        should_process, custom_response = guardrails_processor.check_query(item.content)
-        if not should_process:
-            logger.info(f"Query blocked by guardrails: {item.content}")
-            # Return the custom response without further processing
-            return ResponseQuery(
-                id=item.id,
-                message=ResponseMessage(
-                    content=custom_response,
-                    type=1,
-                    id=str(uuid.uuid4()),
-                ),
-            )
-        
-        # If query passes guardrails, process normally
-        response = generate_response("1", model, tokenizer, item.content, vectordb)
+        # generate_response applies the guardrails, returning their response for blocked queries;
+        # the conversation id keys both the chat history and the semantic cache
+        response = await generate_response(
+            item.id, state.model, state.tokenizer, item.content, state.vectordb, state.guardrails
+        )
         
         return ResponseQuery(
             id=item.id,
@@ -75,16 +60,17 @@ async def answer_query(item: RequestQuery) -> ResponseQuery:
 
 
 @router.post("/query/multi-agent", response_model=DetailedResponseQuery)
-async def answer_query_multi_agent(item: RequestQuery) -> DetailedResponseQuery:
+async def answer_query_multi_agent(item: RequestQuery, request: Request) -> DetailedResponseQuery:
     """
     Generate a response using the multi-agent RAG system.
     
     This endpoint processes the query through the full multi-agent pipeline,
     providing a more contextually relevant and evaluated response.
     """
+    state = request.app.state
     try:
         # Apply guardrails to the query first
-        should_process, custom_response = guardrails_processor.check_query(item.content)
+        should_process, custom_response = state.guardrails.check_query(item.content)
         if not should_process:
             logger.info(f"Multi-agent query blocked by guardrails: {item.content}")
             # Return the custom response without further processing
@@ -99,7 +85,7 @@ async def answer_query_multi_agent(item: RequestQuery) -> DetailedResponseQuery:
             )
             
         # Generate response using the multi-agent system
-        result = await multi_agent_system.generate_response(
+        result = await state.multi_agent_system.generate_response(
             query=item.content,
             session_id=item.id
         )
@@ -126,15 +112,11 @@ async def text_query(request: Request):
         query_text = data.get("text", "")
         session_id = data.get("session_id", "default")
         
-        # Apply guardrails to the query first
-        should_process, custom_response = guardrails_processor.check_query(query_text)
-        if not should_process:
-            logger.info(f"Text query blocked by guardrails: {query_text}")
-            # Return the custom response without further processing
-            return {"response": custom_response}
-        
-        # If query passes guardrails, process normally
-        response = generate_response(session_id, model, tokenizer, query_text, vectordb)
+        # generate_response applies the guardrails, returning their response for blocked queries
+        state = request.app.state
+        response = await generate_response(
+            session_id, state.model, state.tokenizer, query_text, state.vectordb, state.guardrails
+        )
         
         return {"response": response}
     except Exception as e:
@@ -14,7 +14,8 @@ from agents import (
     ContextIntegrationAgent, 
     ResponseGenerationAgent,
     EvaluationAgent,
-    AgentCoordinator
+    AgentCoordinator,
+    BaseAgent
 )
 
 async def test_agent_coordination():
@@ -90,7 +91,66 @@ async def test_agent_coordination():
     return "Agent coordination test completed"
 
 
+class CountingAgent(BaseAgent):
+    """Agent returning a fixed result and counting its calls."""
+    
+    def __init__(self, name, result):
+        super().__init__(name)
+        self.result = result
+        self.calls = 0
+    
+    async def process(self, input_data):
+        self.calls += 1
+        return dict(self.result)
+
+
+def test_pipeline_cache_key():
+    """Check which differences between queries change the pipeline cache key."""
+    coordinator = AgentCoordinator([])
+    base = {"query": "What is Fabric?", "query_type": "definitional",
+            "key_terms": ["fabric", "ledger"], "chat_history": []}
+    key = coordinator._cache_key(base)
+    
+    # No key until the query has been analyzed
+    assert coordinator._cache_key({"query": "What is Fabric?"}) is None
+    
+    # Case, whitespace and key term order do not matter
+    assert coordinator._cache_key({**base, "query": "  what IS   fabric? "}) == key
+    assert coordinator._cache_key({**base, "key_terms": ["Ledger", "fabric"]}) == key
+    assert coordinator._cache_key({**base, "session_id": "other"}) == key
+    
+    # The query, its type, key terms and chat history do
+    assert coordinator._cache_key({**base, "query": "What is Besu?"}) != key
+    assert coordinator._cache_key({**base, "query_type": "general"}) != key
+    assert coordinator._cache_key({**base, "key_terms": ["fabric"]}) != key
+    history = [{"user": "Hi", "assistant": "Hello"}]
+    assert coordinator._cache_key({**base, "chat_history": history}) != key
+    assert coordinator._cache_key({**base, "chat_history": None}) == key
+    print("Pipeline cache key tests PASSED!")
+
+
+def test_pipeline_cache():
+    """Repeated queries with the same history are served from the pipeline cache."""
+    query_agent = CountingAgent("query_agent", {"query_type": "general", "key_terms": []})
+    response_agent = CountingAgent("response_agent", {"response": "An answer"})
+    coordinator = AgentCoordinator([query_agent, response_agent])
+    
+    first = asyncio.run(coordinator.run_pipeline({"query": "What is Fabric?", "chat_history": []}))
+    second = asyncio.run(coordinator.run_pipeline({"query": "what is fabric?", "chat_history": []}))
+    assert first["response"] == second["response"] == "An answer"
+    assert second["processing_history"][-1]["cache_hit"]
+    assert (query_agent.calls, response_agent.calls) == (2, 1)
+    
+    # A different chat history runs the whole pipeline again
+    history = [{"user": "Hi", "assistant": "Hello"}]
+    asyncio.run(coordinator.run_pipeline({"query": "What is Fabric?", "chat_history": history}))
+    assert response_agent.calls == 2
+    print("Pipeline cache tests PASSED!")
+
+
 if __name__ == "__main__":
     print("Starting agent coordination test...")
     test_result = asyncio.run(test_agent_coordination())
     print(f"\n{test_result}")
+    test_pipeline_cache_key()
+    test_pipeline_cache()
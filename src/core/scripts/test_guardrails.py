@@ -7,7 +7,7 @@ import os
 # Add the parent directory to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from guardrails import GuardrailProcessor, GuardrailConfig
+from guardrails import GuardrailProcessor, GuardrailConfig, WORD_RE
 
 def test_guardrails():
     """Test the guardrails functionality with various inputs."""
@@ -78,5 +78,83 @@ def test_guardrails():
             print("Query blocked by guardrails.")
             print(f"Custom response: {custom_response}")
 
+def test_blocked_queries():
+    """Check which queries the shipped guardrails configuration blocks."""
+    config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "guardrails.yaml")
+    config = GuardrailConfig()
+    config.load_from_file(config_path)
+    processor = GuardrailProcessor(config)
+    
+    # Inflected forms must be blocked like the terms they contain
+    blocked_queries = [
+        "investing in bitcoin",
+        "bitcoin investment",
+        "cryptocurrencies trading",
+        "mining bitcoin for profits",
+        "password cracking tools",
+        "exploiting a vulnerability with code",
+    ]
+    allowed_queries = [
+        "What is Hyperledger Fabric?",
+        "How do I deploy chaincode?",
+        "Explain the consensus of Fabric",
+    ]
+    
+    print("\nTesting blocked queries:")
+    print("========================")
+    
+    all_pass = True
+    for query in blocked_queries + allowed_queries:
+        should_process, _ = processor.check_query(query)
+        expected = query in allowed_queries
+        status = "✓" if should_process == expected else "✗"
+        print(f"{status} {'allowed' if should_process else 'blocked'}: {query}")
+        all_pass = all_pass and should_process == expected
+    
+    print("All tests PASSED!" if all_pass else "Some tests FAILED!")
+    assert all_pass
+
+def test_term_matching():
+    """Check that query terms match as substrings, and related terms only as whole words."""
+    config = GuardrailConfig()
+    config.blocked_topics = ["hacking"]
+    config.topic_related_terms = {"illegal activities": ["theft", "money laundering"]}
+    config.high_risk_combinations = [["steal", "data", "method"]]
+    processor = GuardrailProcessor(config)
+    
+    # Blocked topics and crypto terms match anywhere in the query
+    assert not processor.check_query("best hackingtools")[0]
+    assert not processor.check_query("reinvesting in bitcoin")[0]
+    assert processor.check_query("bitcoin whitepaper")[0]
+    
+    # Two related terms block, as whole words only (single words and phrases alike)
+    assert not processor.check_query("theft and money laundering")[0]
+    assert processor.check_query("thefts and money laundering")[0]
+    assert processor.check_query("theft and antimoney laundering")[0]
+    assert processor.check_query("theft and money launderings")[0]
+    
+    # A combination blocks once all but one of its terms are present, as substrings
+    assert not processor.check_query("steal the data")[0]
+    assert not processor.check_query("stealing metadata")[0]
+    assert processor.check_query("steal nothing")[0]
+    
+    # Checks are cached per normalized query until the patterns are compiled again
+    assert processor.check_query("  Theft AND money   laundering ") == processor.check_query("theft and money laundering")
+    config.topic_related_terms = {}
+    config.compile_patterns()
+    assert processor.check_query("theft and money laundering")[0]
+    
+    # The substring scan used without pyahocorasick finds the same terms as the automaton
+    config.topic_related_terms = {"illegal activities": ["theft", "money laundering"]}
+    config.compile_patterns()
+    queries = ["best hackingtools", "theft and antimoney laundering", "stealing metadata",
+               "money laundering, theft", "invest in crypto mining"]
+    expected = {query: processor._find_terms(query, set(WORD_RE.findall(query))) for query in queries}
+    config._substring_automaton = None
+    for query in queries:
+        assert processor._find_terms(query, set(WORD_RE.findall(query))) == expected[query]
+    print("Term matching tests PASSED!")
+
 if __name__ == "__main__":
-    test_guardrails()
\ No newline at end of file
+    test_guardrails()
+    test_blocked_queries()
\ No newline at end of file
@@ -52,14 +52,30 @@ def test_query_detection():
         ("Compare Hyperledger Fabric and Ethereum", "comparative"),
         ("What's the difference between Fabric and Ethereum?", "comparative"),
         ("Explain the endorsement process in Hyperledger Fabric", "explanatory"),
-        ("Why is Hyperledger Fabric permissioned?", "causal")
+        ("Why is Hyperledger Fabric permissioned?", "causal"),
+        # Contractions and line breaks, which a tokenizer would split differently
+        ("How come I don't get rewards?", "explanatory"),
+        ("How cannot this fail?", "explanatory"),
+        ("What\nis a chaincode?", "definitional"),
+        ("How\nto deploy a peer?", "explanatory"),
+        ("Can't I just list the peers?", "enumerative")
     ]
     
+    try:
+        from agents.query_agent import QueryUnderstandingAgent
+        agent = QueryUnderstandingAgent(use_spacy=False)
+    except ImportError as e:
+        print(f"Query agent not importable ({e}), checking the reference patterns only")
+        agent = None
+    
     all_pass = True
     
     for query, expected_type in test_queries:
         # Process the query
         detected_type = determine_query_type(query)
+        if agent is not None and agent._determine_query_type(query) != detected_type:
+            print(f"  FAIL: Query agent detected {agent._determine_query_type(query)}")
+            all_pass = False
         
         # Check the result
         status = "✓" if detected_type == expected_type else "✗"
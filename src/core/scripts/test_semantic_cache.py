@@ -0,0 +1,72 @@
+"""
+Test script for the semantic response cache.
+"""
+import sys
+import os
+import sqlite3
+import tempfile
+import time
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_cache import SemanticCache
+
+
+def test_semantic_cache():
+    """Check hits, misses, session isolation, expiry and dimension changes."""
+    with tempfile.TemporaryDirectory() as directory:
+        cache = SemanticCache(os.path.join(directory, "cache.db"), threshold=0.97, ttl=60)
+        cache.put("a", [1.0, 0.0, 0.0], "first answer")
+
+        # Near-duplicates of the session's query hit, other queries and sessions miss
+        assert cache.get("a", [1.0, 0.0, 0.0]) == "first answer"
+        assert cache.get("a", [2.0, 0.1, 0.0]) == "first answer"
+        assert cache.get("a", [1.0, 1.0, 0.0]) is None
+        assert cache.get("b", [1.0, 0.0, 0.0]) is None
+
+        # The most similar entry is served
+        cache.put("a", [0.0, 1.0, 0.0], "second answer")
+        assert cache.get("a", [0.0, 1.0, 0.01]) == "second answer"
+
+        # Vectors of another embedding dimension never match
+        assert cache.get("a", [1.0, 0.0, 0.0, 0.0]) is None
+        cache.put("a", [0.0, 0.0, 0.0, 1.0], "four dimensions")
+        assert cache.get("a", [0.0, 0.0, 0.0, 1.0]) == "four dimensions"
+        assert cache.get("a", [1.0, 0.0, 0.0]) == "first answer"
+
+        cache.clear("a")
+        assert cache.get("a", [1.0, 0.0, 0.0]) is None
+
+        # Expired entries are not served
+        cache.ttl = 0.01
+        cache.put("a", [1.0, 0.0, 0.0], "stale answer")
+        time.sleep(0.05)
+        assert cache.get("a", [1.0, 0.0, 0.0]) is None
+
+    # Queries about the present are never cached
+    assert SemanticCache.cacheable("What is a chaincode?")
+    assert not SemanticCache.cacheable("What is the latest Fabric release?")
+    print("Semantic cache tests PASSED!")
+
+
+def test_semantic_cache_upgrade():
+    """A cache table from before vectors were tagged with their dimension is recreated."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE semantic_cache (session_id TEXT, query_vec BLOB, response TEXT, ts REAL)")
+        conn.execute("INSERT INTO semantic_cache VALUES ('a', x'0000803f', 'old answer', ?)", (time.time(),))
+        conn.commit()
+        conn.close()
+
+        cache = SemanticCache(path)
+        assert cache.get("a", [1.0]) is None
+        cache.put("a", [1.0], "new answer")
+        assert cache.get("a", [1.0]) == "new answer"
+    print("Semantic cache upgrade tests PASSED!")
+
+
+if __name__ == "__main__":
+    test_semantic_cache()
+    test_semantic_cache_upgrade()
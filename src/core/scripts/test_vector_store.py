@@ -0,0 +1,113 @@
+"""
+Test script for the in-memory vector store.
+"""
+import sys
+import os
+import numpy as np
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_store import NumpyVectorStore, in_memory_if_small
+
+
+class FakeCollection:
+    """The parts of a Chroma collection the vector store reads."""
+
+    def __init__(self, store, space):
+        self.store = store
+        self.metadata = {"hnsw:space": space}
+
+    def count(self):
+        return len(self.store.vectors)
+
+
+class FakeEmbeddings:
+    """Embeds a text as the vector it was registered with."""
+
+    def __init__(self):
+        self.vectors = {}
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+
+class FakeChroma:
+    """A Chroma store holding its vectors in a list."""
+
+    def __init__(self, vectors, space="l2"):
+        self.vectors = [list(vector) for vector in vectors]
+        self.texts = [f"doc {i}" for i in range(len(self.vectors))]
+        self.embeddings = FakeEmbeddings()
+        self._collection = FakeCollection(self, space)
+
+    def get(self, ids=None, include=None):
+        indices = range(len(self.texts)) if ids is None else [int(i) for i in ids]
+        return {
+            "embeddings": [self.vectors[i] for i in indices],
+            "documents": [self.texts[i] for i in indices],
+            "metadatas": [{"source": self.texts[i]} for i in indices],
+        }
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        ids = []
+        for text in texts:
+            ids.append(str(len(self.texts)))
+            self.texts.append(text)
+            self.vectors.append(self.embeddings.vectors[text])
+        return ids
+
+
+def expected_distances(vectors, query, space):
+    """Distances as Chroma reports them in each space."""
+    if space == "cosine":
+        return 1.0 - vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+    if space == "ip":
+        return 1.0 - vectors @ query
+    return ((vectors - query) ** 2).sum(axis=1)
+
+
+def test_vector_store():
+    """Check the in-memory search against brute-force distances in every space."""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(50, 8)).astype(np.float32)
+    query = rng.normal(size=8).astype(np.float32)
+
+    for space in ("l2", "cosine", "ip"):
+        expected = expected_distances(vectors, query, space)
+        nearest = np.argsort(expected)[:5]
+
+        store = NumpyVectorStore(FakeChroma(vectors, space))
+        results = store.similarity_search_by_vector_with_relevance_scores(query, k=5)
+        assert [doc.page_content for doc, _ in results] == [f"doc {i}" for i in nearest]
+        assert np.allclose([score for _, score in results], expected[nearest], atol=1e-4)
+
+        # int8 vectors keep the ranking of clearly separated neighbours
+        quantized = NumpyVectorStore(FakeChroma(vectors, space), quantize=True)
+        results = quantized.similarity_search_by_vector_with_relevance_scores(query, k=1)
+        assert results[0][0].page_content == f"doc {nearest[0]}"
+
+    # Texts added through the store are searchable right away
+    store = NumpyVectorStore(FakeChroma(vectors))
+    store.embeddings.vectors["new doc"] = list(query)
+    store.add_texts(["new doc"])
+    assert len(store) == 51
+    assert store.similarity_search_with_score("new doc", k=1)[0][0].page_content == "new doc"
+    print("Vector store tests PASSED!")
+
+
+def test_in_memory_if_small():
+    """Small collections are wrapped, large and empty ones are left to Chroma."""
+    vectors = np.eye(4, dtype=np.float32)
+    assert isinstance(in_memory_if_small(FakeChroma(vectors), max_vectors=4), NumpyVectorStore)
+
+    large = FakeChroma(vectors)
+    assert in_memory_if_small(large, max_vectors=3) is large
+    empty = FakeChroma([])
+    assert in_memory_if_small(empty) is empty
+    print("In-memory selection tests PASSED!")
+
+
+if __name__ == "__main__":
+    test_vector_store()
+    test_in_memory_if_small()
@@ -0,0 +1,152 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+import numpy as np
+from typing import Optional
+
+try:
+    import sqlite_vec
+except ImportError:  # sqlite-vec is optional, similarities then come from NumPy
+    sqlite_vec = None
+
+logger = logging.getLogger(__name__)
+
+# Queries about the present are answered afresh every time
+DO_NOT_CACHE_RE = re.compile(
+    r"\b(?:today|now|current(?:ly)?|latest|recent(?:ly)?)\b", re.IGNORECASE
+)
+
+
+class SemanticCache:
+    """
+    Persistent cache of generated responses keyed on the query embedding.
+
+    A response is served again when a new query in the same session is a near
+    duplicate of a cached one (cosine similarity at or above the threshold) and
+    the entry has not expired. Entries live in a SQLite table; with sqlite-vec
+    loaded the nearest entry is found by SQLite itself, otherwise the session's
+    vectors are compared in NumPy.
+    """
+
+    def __init__(self, path: str, threshold: float = 0.97, ttl: float = 24 * 3600):
+        """
+        :param path: Path of the SQLite database file.
+        :param threshold: Minimum cosine similarity for a cached response to be served.
+        :param ttl: Time in seconds after which a cached response expires.
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        columns = {
+            row[1] for row in self._conn.execute("PRAGMA table_info(semantic_cache)")
+        }
+        if columns and "dim" not in columns:
+            # Cache written before vectors were tagged with their dimension, start afresh
+            self._conn.execute("DROP TABLE semantic_cache")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS semantic_cache "
+            "(session_id TEXT, dim INTEGER, query_vec BLOB, response TEXT, ts REAL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS semantic_cache_session ON semantic_cache (session_id, dim, ts)"
+        )
+        self._conn.commit()
+        self._vec_loaded = self._load_sqlite_vec()
+
+    def _load_sqlite_vec(self) -> bool:
+        """Load the sqlite-vec extension, if both it and extension loading are available."""
+        if sqlite_vec is None or not hasattr(self._conn, "enable_load_extension"):
+            return False
+        try:
+            self._conn.enable_load_extension(True)
+            sqlite_vec.load(self._conn)
+            self._conn.enable_load_extension(False)
+            return True
+        except sqlite3.Error as e:
+            logger.warning(f"Could not load sqlite-vec, using NumPy similarities: {e}")
+            return False
+
+    @staticmethod
+    def cacheable(query: str) -> bool:
+        """
+        :param query: The user query.
+        :return: Whether responses to the query may be cached.
+        """
+        return DO_NOT_CACHE_RE.search(query) is None
+
+    def get(self, session_id: str, query_vec) -> Optional[str]:
+        """
+        :param session_id: The session the query belongs to.
+        :param query_vec: Embedding of the query.
+        :return: The cached response of the most similar query, or None on a miss.
+            Entries embedded with a model of another dimension never match.
+        """
+        query_vec = np.asarray(query_vec, dtype=np.float32)
+        oldest = time.time() - self.ttl
+
+        with self._lock:
+            if self._vec_loaded:
+                row = self._conn.execute(
+                    "SELECT response, vec_distance_cosine(query_vec, ?) AS distance FROM semantic_cache "
+                    "WHERE session_id = ? AND dim = ? AND ts >= ? ORDER BY distance LIMIT 1",
+                    (query_vec.tobytes(), session_id, query_vec.size, oldest),
+                ).fetchone()
+                if row is None:
+                    return None
+                response, similarity = row[0], 1.0 - row[1]
+            else:
+                rows = self._conn.execute(
+                    "SELECT response, query_vec FROM semantic_cache WHERE session_id = ? AND dim = ? AND ts >= ?",
+                    (session_id, query_vec.size, oldest),
+                ).fetchall()
+                if not rows:
+                    return None
+                matrix = np.frombuffer(
+                    b"".join(vec for _, vec in rows), dtype=np.float32
+                ).reshape(len(rows), -1)
+                similarities = (
+                    matrix
+                    @ query_vec
+                    / np.maximum(
+                        np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_vec),
+                        1e-12,
+                    )
+                )
+                best = int(np.argmax(similarities))
+                response, similarity = rows[best][0], float(similarities[best])
+
+        return response if similarity >= self.threshold else None
+
+    def put(self, session_id: str, query_vec, response: str) -> None:
+        """
+        :param session_id: The session the query belongs to.
+        :param query_vec: Embedding of the query.
+        :param response: The response to cache.
+        """
+        query_vec = np.asarray(query_vec, dtype=np.float32)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM semantic_cache WHERE ts < ?", (now - self.ttl,)
+            )
+            self._conn.execute(
+                "INSERT INTO semantic_cache (session_id, dim, query_vec, response, ts) VALUES (?, ?, ?, ?, ?)",
+                (session_id, query_vec.size, query_vec.tobytes(), response, now),
+            )
+            self._conn.commit()
+
+    def clear(self, session_id: Optional[str] = None) -> None:
+        """
+        :param session_id: Only drop this session's entries (all entries when None).
+        """
+        with self._lock:
+            if session_id is None:
+                self._conn.execute("DELETE FROM semantic_cache")
+            else:
+                self._conn.execute(
+                    "DELETE FROM semantic_cache WHERE session_id = ?", (session_id,)
+                )
+            self._conn.commit()
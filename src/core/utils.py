@@ -1,10 +1,19 @@
 import os
 import yaml
+from functools import lru_cache
 
+# libyaml's C loader when PyYAML was built with it, the pure-Python loader otherwise
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
+
+@lru_cache(maxsize=None)
 def load_yaml_file(file_name):
+    """
+    :param file_name: Path of the YAML file, relative to this directory.
+    :return: The parsed file. It is parsed once per process and shared, so do not modify it.
+    """
     base_path = os.path.dirname(os.path.abspath(__file__))
     file_path = os.path.join(base_path, file_name)
 
-    with open(file_path, "r") as f:
-        return yaml.safe_load(f)
+    with open(file_path, "rb") as f:
+        return yaml.load(f, Loader=YAML_LOADER)
@@ -0,0 +1,252 @@
+import logging
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.vectorstores import Chroma
+
+try:
+    import simsimd
+except ImportError:  # simsimd is optional, distances then come from NumPy
+    simsimd = None
+
+logger = logging.getLogger(__name__)
+
+# Collections up to this many vectors are searched exactly in memory
+MAX_IN_MEMORY_VECTORS = 200_000
+
+# simsimd metrics computing the distance of each collection space directly
+SIMSIMD_METRICS = {"cosine": "cosine", "l2": "sqeuclidean"}
+
+# Rows of an int8 matrix converted to float32 at a time, small enough to stay in cache
+INT8_BLOCK_ROWS = 16384
+
+
+def quantize_int8(vectors: np.ndarray):
+    """
+    Symmetric per-vector int8 quantization.
+
+    :param vectors: (n, d) float32 vectors.
+    :return: The (n, d) int8 codes and the (n,) float32 scales, with vector ≈ scale * code.
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, np.newaxis]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class NumpyVectorStore:
+    """
+    Exact nearest-neighbour search over the vectors of a Chroma collection, held in RAM.
+
+    All vectors are kept in one contiguous float32 matrix, so a query is a single
+    BLAS matrix-vector product followed by a partial sort, instead of an HNSW
+    traversal. Scores are distances in the collection's own space (l2, cosine or
+    ip), so results are interchangeable with Chroma's. Everything else is
+    delegated to the wrapped Chroma store.
+
+    With quantize=True the vectors are held as int8 codes with a per-vector scale,
+    a quarter of the memory to scan per query at the cost of a small loss in
+    distance precision.
+    """
+
+    def __init__(self, vectordb: Chroma, quantize: bool = False):
+        """
+        :param vectordb: The Chroma store whose vectors are loaded into memory.
+        :param quantize: Hold the vectors as int8 instead of float32.
+        """
+        self.vectordb = vectordb
+        self.quantize = quantize
+        self._scales = None
+        collection = getattr(vectordb, "_collection", None)
+        metadata = getattr(collection, "metadata", None) or {}
+        self.space = metadata.get("hnsw:space", "l2")
+
+        data = vectordb.get(include=["embeddings", "documents", "metadatas"])
+        self._documents = [
+            Document(page_content=text or "", metadata=meta or {})
+            for text, meta in zip(data["documents"], data["metadatas"])
+        ]
+        vectors = np.asarray(data["embeddings"], dtype=np.float32).reshape(
+            len(self._documents), -1
+        )
+        self._set_vectors(vectors)
+        logger.info(
+            f"Loaded {len(self._documents)} vectors into memory "
+            f"({self._matrix.dtype}, {self.space} distance)"
+        )
+
+    def __getattr__(self, name):
+        if name == "vectordb":
+            raise AttributeError(name)
+        return getattr(self.vectordb, name)
+
+    def __len__(self):
+        return len(self._documents)
+
+    @property
+    def embeddings(self):
+        return self.vectordb.embeddings
+
+    def _set_vectors(self, vectors: np.ndarray) -> None:
+        """Store the (n, d) float32 vectors, quantizing them if enabled."""
+        if self.quantize:
+            codes, self._scales = quantize_int8(vectors)
+            self._matrix = np.ascontiguousarray(codes)
+            # Norms of the vectors as represented, so distances stay consistent
+            self._norms = self._int8_norms()
+        else:
+            self._matrix = np.ascontiguousarray(vectors)
+            self._norms = np.linalg.norm(self._matrix, axis=1)
+
+    def _int8_norms(self) -> np.ndarray:
+        """Norms of the dequantized vectors."""
+        norms = np.empty(len(self._matrix), dtype=np.float32)
+        for start in range(0, len(self._matrix), INT8_BLOCK_ROWS):
+            block = self._matrix[start : start + INT8_BLOCK_ROWS].astype(np.float32)
+            norms[start : start + INT8_BLOCK_ROWS] = np.linalg.norm(block, axis=1)
+        return norms * self._scales
+
+    def _int8_dots(self, query: np.ndarray) -> np.ndarray:
+        """Dot products of a query vector with every dequantized vector."""
+        dots = np.empty(len(self._matrix), dtype=np.float32)
+        for start in range(0, len(self._matrix), INT8_BLOCK_ROWS):
+            block = self._matrix[start : start + INT8_BLOCK_ROWS].astype(np.float32)
+            dots[start : start + INT8_BLOCK_ROWS] = block @ query
+        return dots * self._scales
+
+    def _distances(self, query: np.ndarray) -> np.ndarray:
+        """Distance from a query vector to every stored vector, in the collection's space."""
+        if self._scales is not None:
+            if simsimd is not None and self.space == "cosine":
+                # Cosine ignores the per-vector scales, so the int8 codes are compared directly
+                query_codes, _ = quantize_int8(query[np.newaxis, :])
+                return np.asarray(
+                    simsimd.cdist(query_codes, self._matrix, metric="cosine")
+                )[0]
+            dots = self._int8_dots(query)
+        elif simsimd is not None and self.space in SIMSIMD_METRICS:
+            # SIMD kernels for the CPU at hand, without NumPy's intermediate arrays
+            return np.asarray(
+                simsimd.cdist(
+                    query[np.newaxis, :],
+                    self._matrix,
+                    metric=SIMSIMD_METRICS[self.space],
+                )
+            )[0]
+        else:
+            dots = self._matrix @ query
+
+        if self.space == "cosine":
+            return 1.0 - dots / np.maximum(self._norms * np.linalg.norm(query), 1e-12)
+        if self.space == "ip":
+            return 1.0 - dots
+        # Squared euclidean distance, as reported by Chroma for l2
+        return np.maximum(self._norms**2 + query @ query - 2.0 * dots, 0.0)
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k: int = 4):
+        """
+        :param embedding: The query embedding.
+        :param k: Number of documents to return.
+        :return: (document, distance) tuples, closest first.
+        """
+        if not self._documents or k <= 0:
+            return []
+
+        distances = self._distances(np.asarray(embedding, dtype=np.float32))
+        if k < len(distances):
+            # Select the k closest in linear time and only sort those
+            nearest = np.argpartition(distances, k)[:k]
+            nearest = nearest[np.argsort(distances[nearest])]
+        else:
+            nearest = np.argsort(distances)
+        return [(self._documents[i], float(distances[i])) for i in nearest]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs):
+        """
+        :param query: The query text.
+        :param k: Number of documents to return.
+        :return: (document, distance) tuples, closest first.
+        """
+        embedding = self.embeddings.embed_query(query)
+        return self.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs):
+        """
+        :param query: The query text.
+        :param k: Number of documents to return.
+        :return: The closest documents.
+        """
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k)]
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        """
+        Add texts to the Chroma store and append their vectors to the in-memory matrix.
+
+        :param texts: The texts to add.
+        :param metadatas: Optional metadata for each text.
+        :return: The ids of the added texts.
+        """
+        texts = list(texts)
+        ids = self.vectordb.add_texts(texts, metadatas=metadatas, **kwargs)
+
+        added = self.vectordb.get(
+            ids=ids, include=["embeddings", "documents", "metadatas"]
+        )
+        self._documents.extend(
+            Document(page_content=text or "", metadata=meta or {})
+            for text, meta in zip(added["documents"], added["metadatas"])
+        )
+        vectors = np.asarray(added["embeddings"], dtype=np.float32).reshape(
+            len(added["documents"]), -1
+        )
+        if self.quantize:
+            codes, scales = quantize_int8(vectors)
+            self._matrix = np.ascontiguousarray(
+                np.vstack([self._matrix.reshape(-1, codes.shape[1]), codes])
+            )
+            self._scales = np.concatenate([self._scales, scales])
+            self._norms = self._int8_norms()
+        else:
+            self._matrix = np.ascontiguousarray(
+                np.vstack([self._matrix.reshape(-1, vectors.shape[1]), vectors])
+            )
+            self._norms = np.linalg.norm(self._matrix, axis=1)
+        return ids
+
+    def add_documents(self, documents, **kwargs):
+        """
+        :param documents: The documents to add.
+        :return: The ids of the added documents.
+        """
+        return self.add_texts(
+            [doc.page_content for doc in documents],
+            metadatas=[doc.metadata for doc in documents],
+            **kwargs,
+        )
+
+
+def in_memory_if_small(
+    vectordb: Chroma, max_vectors: int = MAX_IN_MEMORY_VECTORS, quantize: bool = False
+):
+    """
+    Wrap a Chroma store in a NumpyVectorStore when its collection is small enough.
+
+    :param vectordb: The Chroma store.
+    :param max_vectors: Largest collection size searched in memory.
+    :param quantize: Hold the vectors in memory as int8 instead of float32.
+    :return: The NumpyVectorStore, or the Chroma store itself for larger collections.
+    """
+    try:
+        count = vectordb._collection.count()
+    except Exception as e:
+        logger.warning(f"Could not count the vector collection: {e}")
+        return vectordb
+
+    if count == 0 or count > max_vectors:
+        logger.info(
+            f"Searching the {count} vectors through Chroma (in-memory limit {max_vectors})"
+        )
+        return vectordb
+    logger.info(
+        f"Searching the {count} vectors in memory (in-memory limit {max_vectors})"
+    )
+    return NumpyVectorStore(vectordb, quantize=quantize)